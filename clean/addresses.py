@@ -0,0 +1,91 @@
+import re
+
+# USPS street suffix abbreviations
+SUFFIXES = {
+    'STREET': 'ST', 'STR': 'ST', 'AVENUE': 'AVE', 'AV': 'AVE',
+    'BOULEVARD': 'BLVD', 'DRIVE': 'DR', 'PLACE': 'PL', 'ROAD': 'RD',
+    'LANE': 'LN', 'COURT': 'CT', 'TERRACE': 'TER', 'PARKWAY': 'PKWY',
+    'CIRCLE': 'CIR', 'HIGHWAY': 'HWY', 'SQUARE': 'SQ', 'CRESCENT': 'CRES',
+    }
+
+DIRECTIONALS = {
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+    'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE',
+    'SOUTHWEST': 'SW',
+    }
+
+ORDINALS = {
+    'FIRST': '1ST', 'SECOND': '2ND', 'THIRD': '3RD', 'FOURTH': '4TH',
+    'FIFTH': '5TH', 'SIXTH': '6TH', 'SEVENTH': '7TH', 'EIGHTH': '8TH',
+    'NINTH': '9TH', 'TENTH': '10TH',
+    }
+
+# Ways of writing 'between' and 'and' in ADDRDESC
+BETWEEN_WORDS = set(['BETWEEN', 'BTWN', 'BTW', 'BET', 'BETW'])
+AND_WORDS = set(['AND', '&', '/'])
+
+def _canonical_street(words):
+    '''
+    INPUT: list of words
+    OUTPUT: str
+    '''
+    out = []
+    for word in words:
+        word = SUFFIXES.get(word, word)
+        word = DIRECTIONALS.get(word, word)
+        word = ORDINALS.get(word, word)
+        out.append(word)
+    return ' '.join(out)
+
+def normalize_address(addrdesc):
+    '''
+    INPUT: str
+    OUTPUT: str, or None when there is no address to key
+    Canonical location key for an ADDRDESC: upper case, punctuation
+    dropped, suffixes, directionals and spelled-out ordinals abbreviated.
+    'X BETWEEN A AND B' becomes 'X BETWEEN A AND B' with A and B in sorted
+    order, and an intersection 'A AND B' likewise, so the same block
+    described from either end gets the same key.  Missing values (NaN)
+    and descriptions with no words in them get None.
+    '''
+    if not isinstance(addrdesc, basestring):
+        return None
+    text = re.sub(r'(\S)&(\S)', r'\1 & \2', addrdesc.upper())
+    words = re.sub(r"[^A-Z0-9&/ ]", ' ', text.replace("'", '')).split()
+
+    # Split into the street and the cross streets around BETWEEN / AND
+    parts, current, between = [], [], False
+    for word in words:
+        if word in BETWEEN_WORDS and not between and not parts:
+            parts.append(current)
+            current, between = [], True
+        elif word in AND_WORDS:
+            parts.append(current)
+            current = []
+        else:
+            current.append(word)
+    parts.append(current)
+    parts = [_canonical_street(part) for part in parts if part]
+    if not parts:
+        return None
+
+    if between and len(parts) == 3:
+        return '%s BETWEEN %s AND %s' % (parts[0], min(parts[1:]), max(parts[1:]))
+    if between:
+        return ' BETWEEN '.join([parts[0], ' AND '.join(parts[1:])])
+    if len(parts) == 2:
+        return ' AND '.join(sorted(parts))
+    return ' AND '.join(parts)
+
+def location_keys(addrdescs):
+    '''
+    INPUT: pandas Series of ADDRDESC
+    OUTPUT: pandas Series of location keys, float
+    Map every row to its location key (None for rows with no address);
+    also return the dedup ratio, keyed rows per unique key, which is how
+    many times fewer lookups are needed.
+    '''
+    keys = addrdescs.map(normalize_address)
+    n_unique = keys.nunique()
+    ratio = keys.count() / float(n_unique) if n_unique else 1.
+    return keys, ratio
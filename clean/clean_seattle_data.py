@@ -1,24 +1,45 @@
+import os
+import sys
 import pandas as pd
 import numpy as np
-import cPickle as pickle
 from geopy.geocoders import GoogleV3
+from geocode import GeocodeCache, geocode_addresses
+from addresses import location_keys
+
+# Shared storage layer lives with the feature scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+    '..', 'source'))
+import storage
+from instrument import RunLog
 
 # google API server key
 KEY_FILEPATH = 'C:\Users\\andersrmr\.ssh\\richard_google_developer_key'
 
-def clean_data():
+RAW_CSV = 'data/Pothole_Repairs_Seattle.csv'
+
+# Raw rows read at a time; None reads the whole file at once
+CHUNKSIZE = 100000
+
+# Raw columns read, with fixed dtypes so chunks parse alike
+RAW_DTYPES = {'OBJECTID': np.int64, 'WOKEY': str, 'LOCATION': str,\
+    'ADDRDESC': str, 'WO_STATUS': str, 'INITDT': str, 'FLDSTARTDT': str,\
+    'FLDENDDT': str}
+
+# Timestamp format of the data.seattle.gov CSV export
+RAW_DATETIME_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+def _clean_chunk(df):
     '''
-    INPUT: None
-    OUTPUT: None
-    Read in raw pothole data from disk, do some cleaning then pickle
-    the cleaned dataframe.
+    INPUT: df of raw rows
+    OUTPUT: df
+    Parse dates and keep completed repairs with a positive duration.
+    Every filter looks at one row at a time, so chunks can be cleaned
+    independently.
     '''
-    df = pd.read_csv('data/Pothole_Repairs_Seattle.csv')
-
     # Convert to datetime columns
-    df['FLDSTARTDT_dt'] = pd.to_datetime(df['FLDSTARTDT'])
-    df['INITDT_dt'] = pd.to_datetime(df['INITDT'])
-    df['FLDENDDT_dt'] = pd.to_datetime(df['FLDENDDT'])
+    df['FLDSTARTDT_dt'] = pd.to_datetime(df['FLDSTARTDT'], format=RAW_DATETIME_FORMAT)
+    df['INITDT_dt'] = pd.to_datetime(df['INITDT'], format=RAW_DATETIME_FORMAT)
+    df['FLDENDDT_dt'] = pd.to_datetime(df['FLDENDDT'], format=RAW_DATETIME_FORMAT)
 
     # Keep completed repairs
     df = df[df['WO_STATUS'] == 'COMPLETED']
@@ -26,26 +47,40 @@ def clean_data():
     # Keep only dates where end later than beginning
     df = df[df['INITDT_dt'] < df['FLDENDDT_dt']]
 
-    # Create repair time column and discard 0 repair times
+    # Create repair time column (whole days) and discard 0 repair times
     df['DURATION'] = df['FLDENDDT_dt'] - df['INITDT_dt']
-    df['DURATION_td'] = df['DURATION'].astype('timedelta64[D]')
-    df = df[df['DURATION'] != '0 days']
+    df['DURATION_td'] = np.floor(df['DURATION'] / np.timedelta64(1, 'D'))
+    df = df[df['DURATION'] > np.timedelta64(0)]
 
     # Keep only the columns I need
-    df = df[['OBJECTID','WOKEY','LOCATION','ADDRDESC','INITDT_dt',\
+    return df[['OBJECTID','WOKEY','LOCATION','ADDRDESC','INITDT_dt',\
         'FLDSTARTDT_dt','FLDENDDT_dt','DURATION','DURATION_td']]
 
-    df.to_pickle('df_all_cleaned.pkl')
+def clean_data(filename=RAW_CSV, chunksize=None, root=storage.STORE_DIR):
+    '''
+    INPUT: str, int or None, str
+    OUTPUT: int
+    Read in raw pothole data from disk, do some cleaning then store
+    the cleaned dataframe.  Returns the number of rows kept.
+
+    With chunksize, the CSV is streamed chunksize rows at a time and each
+    cleaned chunk is appended to the store, so memory use depends on the
+    chunk size rather than the file size.
+    '''
+    reader = pd.read_csv(filename, usecols=list(RAW_DTYPES), dtype=RAW_DTYPES,\
+        chunksize=chunksize)
+    if chunksize is None:
+        reader = [reader]
 
-    return df
+    storage.delete_frame('all_cleaned', root=root)
+    n_rows = 0
+    for chunk in reader:
+        df = _clean_chunk(chunk)
+        if len(df):
+            storage.append_frame(df, 'all_cleaned', root=root)
+        n_rows += len(df)
 
-def _forward_geocode(df):
-    new_locs = []
-    for row in df.index.tolist():
-        loc = df.ix[row,'ADDRDESC'] + ' Seattle'
-        loc = geolocator.geocode(loc, timeout=10)
-        new_locs.append((row, loc))
-    return new_locs
+    return n_rows
 
 def _reverse_geocode(df):
     rev_locs = []
@@ -55,69 +90,55 @@ def _reverse_geocode(df):
         rev_locs.append((row, addr))
     return rev_locs
 
-def do_geocoding():
+def do_geocoding(geolocator, n_workers=4, rate=5.):
     '''
-    INPUT: None
-    OUTPUT: None
-    Read in pickled, clean data, geocode the pothole locations.
-
-    ***WARNING***
-
-    RUNNING THIS CODE IGNORES THE QUERY LIMITS THAT EXIST ON THE GOOGLEMAPS API.
-    TO AVOID BEING CUT OFF, RUN IN SMALLER CHUNKS OF, SAY, 500, EVERY FEW MINUTES,
-    UP TO YOUR DAILY LIMIT OF 2,500.  USE THE ADDITIONAL FUNCTIONS BELOW, e.g., 
-    _append_geocoded_dfs to put the geocoded dataframes together.
-
-    ***WARNING***
-
+    INPUT: geopy geocoder, int, float
+    OUTPUT: df
+    Read in stored, clean data, geocode the pothole locations.
+
+    ADDRDESC is first normalized to a location key, so spelling variants
+    of the same block are geocoded once and the result shared by every
+    row.  Each key is looked up once and kept in an on-disk cache
+    (GEOCODE_CACHE), so re-running after a crash, or after hitting the
+    daily quota, only looks up the addresses still missing.  Lookups run
+    on n_workers threads limited to rate requests per second, with
+    backoff on timeouts; hitting the quota stops the run with
+    GeocoderQuotaExceeded.
     '''
-    df = pd.read_pickle('df_all_cleaned.pkl')
-    
-    # Forward geocoding
-    geocodes = _forward_geocode(df)
-
-    # Create an index
-    inds = []
-    for elem in geocodes:
-        inds.append(elem[0])
-
-    # Create Series of lats, longs, general addresses; add to df
-    lats, longs, addrs = [], [], []
-    for elem in geocodes:
-        lats.append(elem[1].latitude)
-        longs.append(elem[1].longitude)
-        addrs.append(elem[1].address)
-    
-    lats = pd.Series(lats, index=inds, name='lats')
-    longs = pd.Series(longs, index=inds, name='longs')
-    addrs = pd.Series(addrs, index=inds, name='addrs')
-
-    df['latitude'] = lats 
-    df['longitude'] = longs
-    df['address'] = addrs
+    df = storage.read_frame('all_cleaned')
+    keys, dedup_ratio = location_keys(df['ADDRDESC'])
+    print 'Geocoding %d rows as %d unique locations (%.1fx dedup), '\
+        '%d rows with no address skipped' % (keys.count(), keys.nunique(),\
+        dedup_ratio, keys.isnull().sum())
+
+    # Forward geocoding of addresses not seen before
+    cache = GeocodeCache()
+    stats = geocode_addresses(keys.dropna(), geolocator, cache,\
+        n_workers=n_workers, rate=rate)
+    print 'Geocoding: ', stats
+
+    # Fan cached lats, longs, general addresses back out to every row
+    geocodes = cache.lookup(keys.dropna())
+    cache.close()
+    locs = [geocodes.get(key, (None, None, None)) for key in keys]
+
+    df['latitude'] = pd.Series([loc[0] for loc in locs], index=df.index,\
+        dtype=float)
+    df['longitude'] = pd.Series([loc[1] for loc in locs], index=df.index,\
+        dtype=float)
+    df['address'] = pd.Series([loc[2] for loc in locs], index=df.index)
 
     return df
 
-def _append_geocoded_dfs(df1, df2):
-    '''
-    INPUT: df, df
-    OUTPUT: df
-    Append df2 to df1.  First ck if last row df1 = first row of df2.  If so,
-    remove first row of df2 before appending.
-    '''
-    if df1.tail(1).index == df2.head(1).index:
-        df2 = df2.drop(df2.head(1).index, 0)
-        return df1.append(df2)
-    return df1.append(df2)
-
 def clean_geocoded(df):
     '''
     INPUT: df
     OUTPUT: None
-    Remove rows with poorly performing geocoding
+    Remove rows with poorly performing or missing geocoding
     '''
+    df = df[df['latitude'].notnull()]
     df = df[df['address'] != 'Seattle, WA, USA']
-    df.to_pickle('df_geo_cleaned.pkl')
+    storage.write_frame(df, 'geo_cleaned')
 
 def main():
     with open(KEY_FILEPATH) as p:
@@ -125,9 +146,14 @@ def main():
 
     geolocator = GoogleV3(KEY)
 
-    df = clean_data()
-    df = do_geocoding()
-    clean_geocoded(df)
+    log = RunLog()
+    with log.step('clean_data') as record:
+        record['rows_out'] = clean_data(chunksize=CHUNKSIZE)
+    with log.step('geocode') as record:
+        df = do_geocoding(geolocator)
+        record['rows_out'] = len(df)
+    with log.step('clean_geocoded', rows_in=len(df)):
+        clean_geocoded(df)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,222 @@
+import time
+import random
+import sqlite3
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from geopy.exc import GeocoderTimedOut, GeocoderQuotaExceeded,\
+    GeocoderServiceError
+
+# Lookups that are worth retrying after a pause.  A quota error is not
+# one of them (though geopy makes it a GeocoderServiceError): it stops
+# the run, which the cache lets the next run resume.
+RETRY_ERRORS = (GeocoderTimedOut, GeocoderServiceError)
+
+GEOCODE_CACHE = 'geocode_cache.sqlite'
+
+# Returned instead of an error for lookups not sent after a quota error
+_SKIPPED = object()
+
+class GeocodeCache(object):
+    '''
+    On-disk geocode results keyed by location key (see
+    addresses.normalize_address).
+
+    Every result is written as soon as it arrives, so the cache doubles as
+    the checkpoint of a geocoding run: a restarted run only looks up the
+    keys that are not in it yet.  Addresses the geocoder could not place
+    are stored too, with no coordinates, so they are not retried.
+    '''
+    def __init__(self, filename=GEOCODE_CACHE):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS geocodes '
+            '(key TEXT PRIMARY KEY, latitude REAL, longitude REAL, address TEXT)')
+        self.conn.commit()
+
+    def missing(self, keys):
+        '''
+        INPUT: iterable of keys
+        OUTPUT: list of keys not cached yet, in first-seen order
+        '''
+        cached = set(row[0] for row in self.conn.execute('SELECT key FROM geocodes'))
+        seen = set()
+        missing = []
+        for key in keys:
+            if key not in cached and key not in seen:
+                seen.add(key)
+                missing.append(key)
+        return missing
+
+    def put(self, key, location):
+        '''
+        INPUT: str, geopy Location or None
+        OUTPUT: None
+        '''
+        if location is None:
+            row = (key, None, None, None)
+        else:
+            row = (key, location.latitude, location.longitude, location.address)
+        self.conn.execute('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)', row)
+
+    def commit(self):
+        self.conn.commit()
+
+    def lookup(self, keys):
+        '''
+        INPUT: iterable of keys
+        OUTPUT: dict of key -> (latitude, longitude, address)
+        Cached results for the keys; keys not cached are left out.
+        '''
+        keys = list(set(keys))
+        found = {}
+        # Stay under sqlite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            query = 'SELECT * FROM geocodes WHERE key IN (%s)' %\
+                ','.join('?' * len(chunk))
+            for row in self.conn.execute(query, chunk):
+                found[row[0]] = row[1:]
+        return found
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class TokenBucket(object):
+    '''
+    Thread-safe rate limiter: up to capacity calls at once, refilled at
+    rate calls per second.
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        INPUT: None
+        OUTPUT: None
+        Block until a call is allowed.
+        '''
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity,\
+                    self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _lookup_with_retry(geolocator, bucket, key, retries, backoff):
+    '''
+    INPUT: geocoder, TokenBucket, str, int, float
+    OUTPUT: (key, Location or None, exception or None)
+    Geocode one address, backing off exponentially (with jitter) on
+    timeouts and service errors.  Quota errors are raised at once.
+    '''
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            return key, geolocator.geocode(key + ' Seattle', timeout=10), None
+        except GeocoderQuotaExceeded:
+            raise
+        except RETRY_ERRORS as e:
+            if attempt == retries:
+                return key, None, e
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+def geocode_addresses(keys, geolocator, cache, n_workers=4, rate=5.,\
+    retries=4, backoff=1., checkpoint_every=50):
+    '''
+    INPUT: iterable of location keys, geopy geocoder, GeocodeCache,
+           int, float, int, float, int
+    OUTPUT: dict of run counts
+    Look up every address not already cached on a pool of n_workers
+    threads, at no more than rate requests per second overall.  Results
+    are written to the cache as they arrive and committed every
+    checkpoint_every lookups.  Addresses that still fail after retries
+    are left out of the cache so the next run tries them again.
+
+    The first quota error stops the run: no further lookups are sent,
+    the results already in are committed and GeocoderQuotaExceeded is
+    raised.  Rerunning once the quota resets picks up where it stopped.
+    '''
+    todo = cache.missing(keys)
+    bucket = TokenBucket(rate)
+    stats = {'requested': len(todo), 'found': 0, 'not_found': 0, 'failed': 0,\
+        'skipped': 0}
+    quota_hit = threading.Event()
+
+    def lookup(key):
+        if quota_hit.is_set():
+            return key, None, _SKIPPED
+        try:
+            return _lookup_with_retry(geolocator, bucket, key, retries, backoff)
+        except GeocoderQuotaExceeded as e:
+            quota_hit.set()
+            return key, None, e
+
+    quota_error = None
+    pool = ThreadPool(n_workers)
+    try:
+        for done, (key, location, error) in enumerate(\
+            pool.imap_unordered(lookup, todo), 1):
+            if error is _SKIPPED:
+                stats['skipped'] += 1
+                continue
+            if isinstance(error, GeocoderQuotaExceeded):
+                quota_error = error
+            if error is not None:
+                stats['failed'] += 1
+                continue
+            cache.put(key, location)
+            stats['found' if location is not None else 'not_found'] += 1
+            if done % checkpoint_every == 0:
+                cache.commit()
+    finally:
+        pool.terminate()
+        cache.commit()
+
+    if quota_error is not None:
+        raise GeocoderQuotaExceeded('%s; stopped after %d of %d lookups %s, '\
+            'rerun to resume from the cache' % (quota_error,\
+            stats['found'] + stats['not_found'], stats['requested'], stats))
+    return stats
+
+StubLocation = namedtuple('StubLocation', ['latitude', 'longitude', 'address'])
+
+class StubGeocoder(object):
+    '''
+    Offline stand-in for a geopy geocoder.  Each call sleeps for latency
+    seconds, raises a timeout or quota error at the given rates, and
+    otherwise returns a location derived from the query text, so runs are
+    repeatable without a network or API key.
+    '''
+    def __init__(self, latency=0.01, timeout_rate=0., quota_rate=0.,\
+        seed=0):
+        self.latency = latency
+        self.timeout_rate = timeout_rate
+        self.quota_rate = quota_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def geocode(self, query, timeout=None):
+        with self.lock:
+            self.calls += 1
+            draw = self.random.random()
+        time.sleep(self.latency)
+
+        if draw < self.timeout_rate:
+            raise GeocoderTimedOut('stub timeout')
+        if draw < self.timeout_rate + self.quota_rate:
+            raise GeocoderQuotaExceeded('stub quota exceeded')
+
+        seed = sum(ord(c) * (i + 1) for i, c in enumerate(query))
+        return StubLocation(47.5 + (seed % 2500) / 10000.,\
+            -122.42 + (seed % 1900) / 10000., query.title() + ', WA, USA')
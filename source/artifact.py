@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
+
+# Bumped whenever the layout below changes; older artifacts are refused
+ARTIFACT_FORMAT = 1
+
+# Saved models live in MODEL_DIR/<name>/<version>/, holding
+# manifest.json and the estimator as an uncompressed joblib file, whose
+# numpy arrays can be memory-mapped on load
+MODEL_DIR = 'models'
+MANIFEST = 'manifest.json'
+ESTIMATOR_FILE = 'estimator.joblib'
+
+# Kinds an estimator sees alike, as floats; a column may move between them
+# (say when schema.compact_frame narrows it) without counting as drift
+NUMERIC_KINDS = 'biuf'
+
+class SchemaError(ValueError):
+    '''
+    The data or code offered to a model does not match what it was
+    trained on.
+    '''
+    pass
+
+def data_fingerprint(df, columns):
+    '''
+    INPUT: df, list of column names
+    OUTPUT: str
+    Content hash of the given columns, row order included.
+    '''
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(df[columns], index=False).values.tobytes())
+    return h.hexdigest()
+
+def feature_schema(df, columns):
+    '''
+    INPUT: df, list of column names
+    OUTPUT: list of [column, dtype kind]
+    numpy kind letters ('f' float, 'i' int, 'b' bool, 'M' datetime, 'O'
+    object) are kept rather than exact dtypes.
+    '''
+    schema = []
+    for col in columns:
+        dtype = df[col].dtype
+        kind = 'category' if str(dtype) == 'category' else dtype.kind
+        schema.append([col, kind])
+    return schema
+
+def vocabularies(df, columns):
+    '''
+    INPUT: df, list of categorical column names
+    OUTPUT: dict of column -> sorted list of the levels seen, as text
+    '''
+    return dict((col, sorted(set(str(v) for v in df[col].dropna().unique())))\
+        for col in columns)
+
+def save_artifact(name, model, df, features, target, categoricals=(),\
+    fill_values=None, root=MODEL_DIR):
+    '''
+    INPUT: str, fitted estimator, df it was fit on, list of predictor
+           columns in model order, str, list of categorical columns, dict
+           or None, str
+    OUTPUT: str path of the new version
+    Save a model as a new version under root/name, with its feature
+    schema, the vocabularies of its categorical columns, fill values for
+    missing inputs and a fingerprint of the training data.
+    '''
+    version = time.strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(root, name, version)
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(root, name, '%s.%d' % (version, suffix))
+        suffix += 1
+    os.makedirs(path)
+
+    estimator_file = os.path.join(path, ESTIMATOR_FILE)
+    joblib.dump(model, estimator_file)
+    with open(estimator_file, 'rb') as f:
+        estimator_hash = hashlib.sha1(f.read()).hexdigest()
+
+    manifest = {'format': ARTIFACT_FORMAT, 'name': name,\
+        'version': os.path.basename(path),\
+        'estimator': type(model).__module__ + '.' + type(model).__name__,\
+        'estimator_sha1': estimator_hash,\
+        'estimator_bytes': os.path.getsize(estimator_file),\
+        'features': feature_schema(df, features),\
+        'target': target,\
+        'vocabularies': vocabularies(df, categoricals),\
+        'fill_values': dict((k, float(v)) for k, v in (fill_values or {}).items()),\
+        'training_rows': len(df),\
+        'training_fingerprint': data_fingerprint(df, list(features) + [target])}
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return path
+
+def latest_version(name, root=MODEL_DIR):
+    '''
+    INPUT: str, str
+    OUTPUT: str path of the newest saved version of name
+    '''
+    base = os.path.join(root, name)
+    versions = sorted(v for v in os.listdir(base) if\
+        os.path.exists(os.path.join(base, v, MANIFEST)))
+    if not versions:
+        raise IOError('No saved versions of model %s in %s' % (name, root))
+    return os.path.join(base, versions[-1])
+
+class ModelArtifact(object):
+    '''
+    A loaded model with its manifest.  features lists the predictor
+    columns in the order the estimator expects them.
+    '''
+    def __init__(self, path, manifest, model):
+        self.path = path
+        self.manifest = manifest
+        self.model = model
+        self.features = [col for col, _ in manifest['features']]
+        self.vocabularies = manifest['vocabularies']
+        self.fill_values = manifest['fill_values']
+
+    def check_frame(self, df):
+        '''
+        INPUT: df
+        OUTPUT: None
+        Raise SchemaError if df lacks a feature column, a column's kind
+        changed, or a categorical column holds levels unseen in training.
+        '''
+        missing = [col for col in self.features if col not in df]
+        if missing:
+            raise SchemaError('%s: missing feature columns %s' %\
+                (self.path, missing))
+        changed = [(col, kind, new) for (col, kind), (_, new) in\
+            zip(self.manifest['features'], feature_schema(df, self.features))\
+            if kind != new and not (kind in NUMERIC_KINDS and\
+            new in NUMERIC_KINDS)]
+        if changed:
+            raise SchemaError('%s: column kinds changed (column, trained, now) %s'\
+                % (self.path, changed))
+        for col, levels in self.vocabularies.items():
+            if col in df:
+                unseen = set(str(v) for v in df[col].dropna().unique()) - set(levels)
+                if unseen:
+                    raise SchemaError('%s: %d unseen levels in %s, e.g. %s' %\
+                        (self.path, len(unseen), col, sorted(unseen)[:5]))
+
+def load_artifact(path, features=None, mmap=True, verify=False,\
+    root=MODEL_DIR):
+    '''
+    INPUT: str version path or model name, list of columns or None, bool,
+           bool, str
+    OUTPUT: ModelArtifact
+    Load a saved model, the newest version if given a name.  Fails before
+    unpickling anything on an unknown format, an estimator file of the
+    wrong size (or with verify, the wrong checksum, which means reading it
+    twice) or, if features is given, a feature list other than the one
+    trained on.  With mmap the estimator's arrays are memory-mapped
+    read-only rather than read, so a large forest loads in a fraction of
+    the time.
+    '''
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        path = latest_version(path, root)
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise SchemaError('%s: artifact format %s, expected %s' %\
+            (path, manifest.get('format'), ARTIFACT_FORMAT))
+    trained = [col for col, _ in manifest['features']]
+    if features is not None and list(features) != trained:
+        raise SchemaError('%s: trained on features %s, asked for %s' %\
+            (path, trained, list(features)))
+
+    estimator_file = os.path.join(path, ESTIMATOR_FILE)
+    changed = os.path.getsize(estimator_file) != manifest['estimator_bytes']
+    if verify and not changed:
+        with open(estimator_file, 'rb') as f:
+            changed = hashlib.sha1(f.read()).hexdigest() !=\
+                manifest['estimator_sha1']
+    if changed:
+        raise SchemaError('%s: estimator file does not match manifest' % path)
+
+    model = joblib.load(estimator_file, mmap_mode='r' if mmap else None)
+    n_features = getattr(model, 'n_features_in_', getattr(model, 'n_features_', None))
+    if n_features is not None and n_features != len(trained):
+        raise SchemaError('%s: estimator expects %d features, manifest lists %d'\
+            % (path, n_features, len(trained)))
+    return ModelArtifact(path, manifest, model)
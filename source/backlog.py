@@ -0,0 +1,248 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+class BacklogCounter(object):
+    '''
+    Number of work orders active on each calendar day.
+
+    A work order is active on day D when its init date <= D and
+    init date + DURATION > D.  Each order contributes +1 on its init date
+    and -1 on the first day it is no longer active; a cumulative sum of
+    those events gives the active count for every day at once.  New
+    orders are folded into the existing daily counts, so history is never
+    recomputed.
+    '''
+    def __init__(self):
+        self.first_day = None
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, init_dts, durations):
+        '''
+        INPUT: array of init datetimes, array of timedeltas
+        OUTPUT: None
+        Add work orders to the daily counts.
+        '''
+        start = np.asarray(init_dts, dtype='datetime64[ns]')\
+            .astype('datetime64[D]')
+        end = start.astype('datetime64[ns]') +\
+            np.asarray(durations, dtype='timedelta64[ns]')
+
+        # First day no longer active: the end date, rounded up to midnight
+        stop = end.astype('datetime64[D]')
+        stop = stop + (stop.astype('datetime64[ns]') < end).astype(np.int64)
+        if len(start) == 0:
+            return
+
+        lo, hi = start.min(), stop.max()
+        if self.first_day is None:
+            self.first_day = lo
+        self._extend(lo, hi)
+
+        offsets_start = (start - self.first_day).astype(np.int64)
+        offsets_stop = (stop - self.first_day).astype(np.int64)
+        n_days = len(self.counts)
+        delta = np.bincount(offsets_start, minlength=n_days + 1) -\
+            np.bincount(offsets_stop, minlength=n_days + 1)
+        self.counts += np.cumsum(delta)[:n_days]
+
+    def active_on(self, dates):
+        '''
+        INPUT: array of dates
+        OUTPUT: int array
+        Number of work orders active on each date; 0 outside the range
+        seen so far.
+        '''
+        days = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]')
+        if self.first_day is None:
+            return np.zeros(len(days), dtype=np.int64)
+
+        offsets = (days - self.first_day).astype(np.int64)
+        inside = (offsets >= 0) & (offsets < len(self.counts))
+        active = np.zeros(len(days), dtype=np.int64)
+        active[inside] = self.counts[offsets[inside]]
+        return active
+
+    def series(self):
+        '''
+        INPUT: None
+        OUTPUT: pandas Series
+        Active count for every calendar day seen so far.
+        '''
+        if self.first_day is None:
+            return pd.Series([], dtype=np.int64)
+        days = pd.date_range(pd.Timestamp(self.first_day),\
+            periods=len(self.counts), freq='D')
+        return pd.Series(self.counts, index=days, name='cumul_potholes')
+
+    def _extend(self, lo, hi):
+        '''
+        INPUT: datetime64[D], datetime64[D]
+        OUTPUT: None
+        Grow the daily counts to cover lo through hi; new days start at 0.
+        '''
+        before = int((self.first_day - lo).astype(np.int64))
+        if before > 0:
+            self.counts = np.concatenate([np.zeros(before, dtype=np.int64),\
+                self.counts])
+            self.first_day = lo
+
+        after = int((hi - self.first_day).astype(np.int64)) + 1 - len(self.counts)
+        if after > 0:
+            self.counts = np.concatenate([self.counts,\
+                np.zeros(after, dtype=np.int64)])
+
+# End time given to orders not finished yet, so they count as open forever
+OPEN_END = np.iinfo(np.int64).max
+
+def _ns(times):
+    '''
+    INPUT: datetime, str or array of them
+    OUTPUT: int64 nanoseconds, array if given an array
+    '''
+    if np.ndim(times) == 0:
+        return pd.Timestamp(times).value
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+
+class WorkOrderIndex(object):
+    '''
+    Work orders as time intervals [start, end), for counting and finding
+    the orders open at any moment without a pass over the frame.
+
+    Starts and ends are each kept sorted, so the number open at time t is
+    (# starts <= t) - (# ends <= t): two binary searches, at any time
+    resolution.  Grouped counts do the same within each group's slice of
+    the arrays; grouped lists of orders are split by each order's group.
+    Orders are also kept in start order with their ends, and
+    no finished order lasted longer than the longest one, so the orders
+    open during a range lie in a known slice of that order.  Orders with
+    no end are open from their start on.
+    '''
+    def __init__(self, df, start_col='INITDT_dt', end_col='FLDENDDT_dt',\
+        groups=()):
+        '''
+        INPUT: df, str, str, list of columns counts can be grouped by (e.g.
+               neighborhood_label, GEOID)
+        OUTPUT: None
+        '''
+        starts = _ns(df[start_col].values)
+        ends = _ns(df[end_col].values)
+        unfinished = df[end_col].isnull().values
+        ends[unfinished] = OPEN_END
+
+        order = np.argsort(starts, kind='mergesort')
+        self.labels = df.index.values[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.sorted_ends = np.sort(ends)
+        self.unfinished = np.nonzero(self.ends == OPEN_END)[0]
+        finished = self.ends != OPEN_END
+        self.max_duration = int((self.ends[finished] - self.starts[finished])\
+            .max()) if finished.any() else 0
+
+        self.groups = dict((col, self._group(df[col].values[order]))\
+            for col in groups)
+
+    def _group(self, values):
+        '''
+        INPUT: array of group labels, in start order
+        OUTPUT: dict
+        Each group's starts and ends, sorted, in one contiguous slice per
+        group, and every order's group code in start order (-1 for no
+        label); rows with no label are left out of the slices.
+        '''
+        codes, levels = pd.factorize(values, sort=True)
+        by_start = np.argsort(codes, kind='mergesort')
+        by_end = np.lexsort((self.ends, codes))
+        n_missing = (codes < 0).sum()
+        bounds = np.searchsorted(codes[by_start], np.arange(len(levels) + 1))
+        return {'levels': levels, 'bounds': bounds - n_missing,\
+            'starts': self.starts[by_start][n_missing:],\
+            'ends': self.ends[by_end][n_missing:], 'codes': codes}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def open_at(self, times, by=None):
+        '''
+        INPUT: datetime or array of datetimes, column name or None
+        OUTPUT: int array, or with by a df of times x group levels; for a
+                single time an int, or with by a Series over group levels
+        Number of orders open at each time.
+        '''
+        if np.ndim(times) == 0:
+            counts = self.open_at([times], by=by)
+            return counts[0] if by is None else counts.iloc[0]
+
+        t = _ns(times)
+        if by is None:
+            return np.searchsorted(self.starts, t, 'right') -\
+                np.searchsorted(self.sorted_ends, t, 'right')
+
+        group = self.groups[by]
+        bounds = group['bounds']
+        counts = np.empty((len(t), len(group['levels'])), dtype=np.int64)
+        for k in range(len(group['levels'])):
+            lo, hi = bounds[k], bounds[k + 1]
+            counts[:, k] = np.searchsorted(group['starts'][lo:hi], t, 'right') -\
+                np.searchsorted(group['ends'][lo:hi], t, 'right')
+        return pd.DataFrame(counts, index=pd.DatetimeIndex(times),\
+            columns=group['levels'])
+
+    def open_counts(self, start, end, freq='D', by=None):
+        '''
+        INPUT: datetime, datetime, pandas frequency, column name or None
+        OUTPUT: Series, or with by a df with one column per group level
+        Orders open at every tick of freq from start to end, e.g. at each
+        midnight, hour or Monday.
+        '''
+        times = pd.date_range(start, end, freq=freq)
+        counts = self.open_at(times, by=by)
+        if by is None:
+            return pd.Series(counts, index=times, name='open_orders')
+        return counts
+
+    def _labels(self, positions, by):
+        '''
+        INPUT: array of positions in start order, column name or None
+        OUTPUT: array of df index labels, or with by a dict of group level
+                -> array of labels, for every level
+        '''
+        if by is None:
+            return self.labels[positions]
+        group = self.groups[by]
+        codes = group['codes'][positions]
+        order = np.argsort(codes, kind='mergesort')
+        bounds = np.searchsorted(codes[order], np.arange(len(group['levels']) + 1))
+        labels = self.labels[positions[order]]
+        return OrderedDict((level, labels[bounds[k]:bounds[k + 1]])\
+            for k, level in enumerate(group['levels']))
+
+    def open_during(self, start, end, by=None):
+        '''
+        INPUT: datetime, datetime, column name or None
+        OUTPUT: array of df index labels, or with by a dict of group level
+                -> array of labels
+        Orders open at any time in [start, end).
+        '''
+        lo, hi = _ns(start), _ns(end)
+        stop = np.searchsorted(self.starts, hi, 'left')
+        first = np.searchsorted(self.starts, lo - self.max_duration, 'right')
+        first = min(first, stop)
+        positions = first + np.nonzero(self.ends[first:stop] > lo)[0]
+        earlier = self.unfinished[self.unfinished < first]
+        return self._labels(np.concatenate([earlier, positions]), by)
+
+    def breached(self, start, end, sla=pd.Timedelta(days=3), by=None):
+        '''
+        INPUT: datetime, datetime, timedelta, column name or None
+        OUTPUT: array of df index labels, or with by a dict of group level
+                -> array of labels
+        Orders that reached sla age while still open at some time in
+        [start, end), i.e. that breached the sla then.
+        '''
+        age = pd.Timedelta(sla).value
+        first = np.searchsorted(self.starts, _ns(start) - age, 'left')
+        stop = np.searchsorted(self.starts, _ns(end) - age, 'left')
+        late = self.ends[first:stop] - self.starts[first:stop] > age
+        return self._labels(first + np.nonzero(late)[0], by)
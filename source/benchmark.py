@@ -0,0 +1,607 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+import cPickle as pickle
+import numpy as np
+import pandas as pd
+from shapely.geometry import shape
+from sklearn.ensemble import RandomForestClassifier
+from spatial_index import StreetIndex
+from backlog import BacklogCounter, WorkOrderIndex
+from instrument import RunLog
+from parallel import ParallelRunner
+import create_features
+import build_models
+import scoring
+import artifact
+from encoding import CategoricalEncoder
+from neighbors import neighbor_features
+from projection import project, project_point, project_geometry,\
+    add_projected_coords
+from schema import compact_frame
+import storage
+import geometry_cache
+from synthetic import STREET_BLOCKS, make_street_grid, make_pothole_coords,\
+    make_work_orders, make_feature_frame, make_raw_csv, make_potholes,\
+    make_city, write_street_shapefile, timed
+from reference import brute_force_nearest, legacy_cumul_potholes,\
+    legacy_calendar_features, legacy_dummies
+
+# The cleaning scripts live next to this directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+    '..', 'clean'))
+import clean_seattle_data
+
+# Timings only; the correctness of everything timed here is asserted by
+# the tests in ../tests
+
+# Scales for the timed scenarios; up to 10M rows can be given on the
+# command line
+SCALES = [10000, 100000, 1000000]
+
+# Where timed scenario runs are logged, as instrument.RunLog JSON lines
+BENCH_DIR = 'bench_results'
+
+# Trees in the benchmark forest; the production model uses 500
+RF_TREES = 50
+
+def bench_street_index(n_blocks=100, n_potholes=200):
+    '''
+    INPUT: int, int
+    OUTPUT: dict
+    Time the brute-force street search against StreetIndex on a
+    synthetic grid.
+    '''
+    lines, attributes = make_street_grid(n_blocks)
+    lons, lats = make_pothole_coords(n_potholes)
+
+    start = time.time()
+    brute_force_nearest(lines, lons, lats)
+    brute_time = time.time() - start
+
+    start = time.time()
+    streets = StreetIndex(lines, attributes)
+    build_time = time.time() - start
+
+    start = time.time()
+    streets.nearest(lons, lats)
+    query_time = time.time() - start
+
+    return {'segments': len(lines), 'potholes': n_potholes,\
+        'brute_force_s': brute_time, 'index_build_s': build_time,\
+        'index_query_s': query_time, 'speedup': brute_time / query_time}
+
+def bench_backlog(n=500, n_big=1000000):
+    '''
+    INPUT: int, int
+    OUTPUT: dict
+    Time legacy cumul_potholes against BacklogCounter on n work orders,
+    and BacklogCounter alone on n_big.
+    '''
+    df = make_work_orders(n)
+
+    start = time.time()
+    expected = legacy_cumul_potholes(df)
+    legacy_time = time.time() - start
+
+    start = time.time()
+    backlog = BacklogCounter()
+    backlog.add(df['INITDT_dt'].values, df['DURATION'].values)
+    backlog.active_on(expected['INITDT_date_only'].values)
+    sweep_time = time.time() - start
+
+    big = make_work_orders(n_big, days=5 * 365)
+    start = time.time()
+    backlog = BacklogCounter()
+    backlog.add(big['INITDT_dt'].values, big['DURATION'].values)
+    backlog.active_on(big['INITDT_dt'].values)
+    return {'work_orders': n, 'legacy_s': legacy_time, 'sweep_s': sweep_time,\
+        'speedup': legacy_time / sweep_time, 'rows_big': n_big,\
+        'big_s': time.time() - start}
+
+def bench_calendar_features(n=1000):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Time the legacy calendar loops against create_calendar_features.
+    '''
+    df = make_work_orders(n, days=3 * 365)
+
+    start = time.time()
+    legacy_calendar_features(df)
+    legacy_time = time.time() - start
+
+    start = time.time()
+    create_features.create_calendar_features(df.copy())
+    new_time = time.time() - start
+    return {'sample_dates': n, 'legacy_s': legacy_time,\
+        'vectorized_s': new_time, 'speedup': legacy_time / new_time}
+
+def bench_work_order_index(n=200000, n_queries=200):
+    '''
+    INPUT: int, int
+    OUTPUT: dict
+    Time WorkOrderIndex open counts against full scans of the frame.
+    '''
+    rng = np.random.RandomState(10)
+    df = make_work_orders(n, days=3 * 365)
+    df['neighborhood_label'] = rng.randint(1, 120, n)
+    start, end = df['INITDT_dt'], df['FLDENDDT_dt']
+
+    begin = time.time()
+    index = WorkOrderIndex(df, groups=['neighborhood_label'])
+    build_s = time.time() - begin
+
+    times = pd.Timestamp('2010-01-01') + pd.to_timedelta(\
+        rng.randint(0, 3 * 365 * 24, n_queries), unit='h')
+    begin = time.time()
+    for t in times:
+        ((start <= t) & ((end > t) | end.isnull())).sum()
+    scan_s = time.time() - begin
+    begin = time.time()
+    index.open_at(times)
+    index_s = time.time() - begin
+    begin = time.time()
+    index.open_at(times, by='neighborhood_label')
+    grouped_s = time.time() - begin
+
+    return {'orders': n, 'build_s': build_s,\
+        'scan_us_per_query': scan_s / n_queries * 1e6,\
+        'index_us_per_query': index_s / n_queries * 1e6,\
+        'grouped_us_per_query': grouped_s / n_queries * 1e6,\
+        'speedup': scan_s / index_s}
+
+def bench_projection(n=1000000):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Time to project n points in one call against one at a time.
+    '''
+    lons, lats = make_pothole_coords(n)
+    start = time.time()
+    project(lons, lats)
+    vector_s = time.time() - start
+    start = time.time()
+    for lon, lat in zip(lons[:10000], lats[:10000]):
+        project_point(lon, lat)
+    scalar_s = (time.time() - start) * n / 10000.
+    return {'points': n, 'vector_s': vector_s, 'one_at_a_time_s': scalar_s}
+
+def bench_neighbors(n=1000000):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Time the nearby-pothole features for n potholes over ten years.
+    '''
+    big = make_potholes(n, days=3650)
+    big['DURATION_td'] = np.floor(big['DURATION'] / np.timedelta64(1, 'D'))
+    big = add_projected_coords(big)
+    start = time.time()
+    features = neighbor_features(big)
+    return {'rows': n, 'seconds': time.time() - start,\
+        'mean_neighbors': features['nearby_potholes'].mean()}
+
+def bench_parallel(n=1000000, worker_counts=(1, 2, 4)):
+    '''
+    INPUT: int, tuple of int
+    OUTPUT: dict
+    Time the row-local distance and calendar stages through a
+    ParallelRunner with each number of workers.
+    '''
+    df = make_potholes(n)
+    stages = [stage for stage in create_features.STAGES if stage.name in\
+        ('distances', 'calendar')]
+    result = {'rows': n, 'cpus': multiprocessing.cpu_count()}
+    for n_workers in worker_counts:
+        with ParallelRunner(stages, n_workers=n_workers) as runner:
+            start = time.time()
+            for stage in stages:
+                runner.apply(stage, df[stage.inputs].copy())
+            result['workers_%d_s' % n_workers] = time.time() - start
+    for n_workers in worker_counts[1:]:
+        result['workers_%d_speedup' % n_workers] =\
+            result['workers_%d_s' % worker_counts[0]] /\
+            result['workers_%d_s' % n_workers]
+    return result
+
+# Loads one stored frame in a fresh interpreter and reports its cost
+_LOAD_SCRIPT = '''
+import sys, json, time
+sys.path.insert(0, sys.argv[1])
+import pandas as pd
+import storage
+
+def status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+kind, path = sys.argv[2], sys.argv[3]
+columns = json.loads(sys.argv[4])
+
+# Reset the high-water mark so import overhead does not count
+with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+base = status_kb('VmRSS')
+start = time.time()
+if kind == 'pickle':
+    df = pd.read_pickle(path)
+    if columns:
+        df = df[columns]
+else:
+    df = storage.read_frame(path, columns=columns, root='')
+elapsed = time.time() - start
+peak = status_kb('VmHWM')
+print(json.dumps({'seconds': elapsed, 'peak_mb': (peak - base) / 1024.}))
+'''
+
+def _measure_load(kind, path, columns=None):
+    '''
+    INPUT: 'pickle' or 'parquet', str, list or None
+    OUTPUT: dict
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output([sys.executable, '-c', _LOAD_SCRIPT, here,\
+        kind, path, json.dumps(columns)])
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+def bench_storage(n=1000000, columns=('latitude','longitude','DURATION_td',\
+    'Median_Home_Value')):
+    '''
+    INPUT: int, tuple of str
+    OUTPUT: dict
+    Load time and peak memory of a whole-frame pickle against the
+    partitioned Parquet store, reading the full frame and a few columns.
+    '''
+    df = make_feature_frame(n)
+    tmp = tempfile.mkdtemp()
+    try:
+        pickle_path = os.path.join(tmp, 'features.pkl')
+        df.to_pickle(pickle_path)
+        storage.write_frame(df, 'features', root=tmp)
+        parquet_path = os.path.join(tmp, 'features')
+
+        result = {'rows': n}
+        for label, cols in [('all', None), ('subset', list(columns))]:
+            for kind, path in [('pickle', pickle_path), ('parquet', parquet_path)]:
+                cost = _measure_load(kind, path, cols)
+                result['%s_%s_s' % (kind, label)] = cost['seconds']
+                result['%s_%s_peak_mb' % (kind, label)] = cost['peak_mb']
+        return result
+    finally:
+        shutil.rmtree(tmp)
+
+def bench_streaming_ingest(n=200000, chunksize=20000):
+    '''
+    INPUT: int, int
+    OUTPUT: dict
+    Clean a synthetic raw CSV whole and in chunks.
+    '''
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'Pothole_Repairs_Seattle.csv')
+        make_raw_csv(filename, n)
+
+        start = time.time()
+        kept = clean_seattle_data.clean_data(filename, root=tmp)
+        whole_time = time.time() - start
+
+        start = time.time()
+        clean_seattle_data.clean_data(filename, chunksize=chunksize, root=tmp)
+        streamed_time = time.time() - start
+        return {'raw_rows': n, 'kept_rows': kept, 'whole_s': whole_time,\
+            'streamed_s': streamed_time}
+    finally:
+        shutil.rmtree(tmp)
+
+def bench_encoding(n=500000):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Memory and build time of the design matrix with every categorical
+    column, dense get_dummies against the sparse encoder.
+    '''
+    rng = np.random.RandomState(9)
+    df = make_feature_frame(n)
+    df['SEGMENT_TY'] = rng.randint(1, 12, n)
+    df['DIVIDED_CO'] = rng.randint(0, 3, n)
+    df['VEHICLE_US'] = rng.randint(0, 4, n)
+    columns = build_models.CATEGORICALS
+
+    start = time.time()
+    dense = legacy_dummies(df, columns)
+    dense_s = time.time() - start
+    dense_mb = dense.memory_usage(index=False).sum() / 1e6
+    # What an estimator is handed once the frame is made a float array
+    dense_float_mb = dense.shape[0] * dense.shape[1] * 8 / 1e6
+
+    start = time.time()
+    X = CategoricalEncoder(columns, numeric=build_models.BASE_PREDICTORS,\
+        min_count=1).fit_transform(df)
+    sparse_s = time.time() - start
+    sparse_mb = (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes) / 1e6
+    return {'rows': n, 'columns': X.shape[1], 'dense_mb': dense_mb,\
+        'dense_float_mb': dense_float_mb, 'sparse_mb': sparse_mb,\
+        'memory_ratio': dense_float_mb / sparse_mb,\
+        'dense_s': dense_s, 'sparse_s': sparse_s}
+
+def bench_compaction(n=1000000):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Bytes per work order of a features-like frame before and after
+    compact_frame, and the time it takes.
+    '''
+    df = make_feature_frame(n)
+    df['DURATION_td'] = np.floor(df['DURATION'] / np.timedelta64(1, 'D'))
+    df['INITDT_date_only'] = df['INITDT_dt'].dt.normalize()
+    df['address'] = df['ADDRDESC'] + ', Seattle, WA'
+    df = create_features.create_calendar_features(df)
+    # As after a merge: small integers as floats, flags as Python bools
+    df['dayofwk'] = df['dayofwk'].astype(float)
+    df['INIT_Quarter'] = df['INIT_Quarter'].astype(float)
+    df['b_holiday'] = df['b_holiday'].astype(object)
+
+    start = time.time()
+    compact, report = compact_frame(df)
+    compact_s = time.time() - start
+    before = report['bytes_before'].sum()
+    after = report['bytes_after'].sum()
+    return {'rows': n, 'bytes_per_row_before': float(before) / n,\
+        'bytes_per_row_after': float(after) / n,\
+        'memory_ratio': float(before) / after, 'compact_s': compact_s,\
+        'top_savings_mb': dict((col, round(saved / 1e6, 1)) for col, saved in\
+            report[['column', 'bytes_saved']].values[:5])}
+
+def bench_geometry_cache(n_blocks=STREET_BLOCKS):
+    '''
+    INPUT: int
+    OUTPUT: dict
+    Time loading a synthetic street shapefile directly with fiona, through
+    the geometry cache on the first run (parsed), on later runs (mapped)
+    and after a touch (rehashed).  The in-memory tables are cleared before
+    each load, as in a fresh process.
+    '''
+    import fiona
+    tmp = tempfile.mkdtemp()
+    try:
+        shapefilename = os.path.join(tmp, 'streets')
+        write_street_shapefile(shapefilename, n_blocks)
+
+        start = time.time()
+        with fiona.open(shapefilename + '.shp') as shp:
+            direct = [project_geometry(shape(feature['geometry'])) for\
+                feature in shp]
+        direct_s = time.time() - start
+
+        def load():
+            geometry_cache._tables.clear()
+            start = time.time()
+            geometry_cache.load_shapefile(shapefilename, projected=True)\
+                .geometries()
+            return time.time() - start
+
+        first_s = load()
+        cached_s = load()
+        os.utime(shapefilename + '.shp', None)
+        touched_s = load()
+        return {'features': len(direct), 'direct_read_ms': direct_s * 1000,\
+            'first_load_ms': first_s * 1000, 'cached_load_ms': cached_s * 1000,\
+            'touched_load_ms': touched_s * 1000}
+    finally:
+        shutil.rmtree(tmp)
+
+def run_scenarios(scales=SCALES, log=None):
+    '''
+    INPUT: list of int, RunLog or None
+    OUTPUT: str filename of the run log
+    Build a synthetic city offline (polygon tilings, street grid, ACS
+    tables, weather) and time every feature function and both model fits
+    at each scale.  Results go to bench_results/<run id>.jsonl; compare
+    two runs with 'python instrument.py OLD NEW'.
+    '''
+    if log is None:
+        run_id = time.strftime('%Y%m%dT%H%M%S')
+        log = RunLog(os.path.join(BENCH_DIR, run_id + '.jsonl'), run_id=run_id)
+
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        city = make_city(tmp, log)
+        os.chdir(tmp)
+
+        for n in scales:
+            df = make_potholes(n)
+            df = timed(log, 'add_projected_coords', n, add_projected_coords, df)
+            df = timed(log, 'create_distances', n,\
+                create_features.create_distances, df)
+            df = timed(log, 'create_calendar_features', n,\
+                create_features.create_calendar_features, df)
+            df = timed(log, 'get_neighborhoods', n,\
+                create_features.get_neighborhoods, df, hoods=city['hoods'])
+            df = timed(log, 'get_census_economic_vals', n,\
+                create_features.get_census_economic_vals, df,\
+                block_groups=city['block_groups'])
+            df = timed(log, 'get_pothole_count', n,\
+                create_features.get_pothole_count, df)
+            df = timed(log, 'get_neighbor_features', n,\
+                create_features.get_neighbor_features, df)
+            df = timed(log, 'get_temp', n, create_features.get_temp, df,\
+                daily=city['daily'])
+            df = timed(log, 'get_closest_distance_features', n,\
+                create_features.get_closest_distance_features, df,\
+                streets=city['streets'])
+
+            # The modelling frame: repairs under the 95th percentile, as in
+            # build_models, with the same predictors
+            df = df[df['DURATION_td'] < df['DURATION_td'].quantile(.95)]
+            X = df[['cumul_potholes','Median_Home_Value','Temp','min_dist']]\
+                .fillna(0).values
+            y = (df['DURATION_td'] > 3).values
+            timed(log, 'logit_fit', n,\
+                build_models.model_estimators()['logit'].fit, X, y)
+            timed(log, 'rf_fit', n, RandomForestClassifier(\
+                n_estimators=RF_TREES, n_jobs=-1).fit, X, y)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+    return log.filename
+
+def bench_scoring(rate=1000, seconds=5, n_history=50000):
+    '''
+    INPUT: int requests per second, int, int
+    OUTPUT: dict
+    Fit the base logistic model on a synthetic city, serve it with an
+    OnlineScorer behind a MicroBatcher, and send it reports at rate per
+    second from one client thread for the given seconds.  Latency is
+    measured from each report's scheduled arrival, so queueing delay
+    counts.
+    '''
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        city = make_city(tmp)
+        os.chdir(tmp)
+
+        df = add_projected_coords(make_potholes(n_history))
+        df = create_features.create_distances(df)
+        df = create_features.get_census_economic_vals(df,\
+            block_groups=city['block_groups'])
+        df = create_features.get_pothole_count(df)
+        df = create_features.get_temp(df, daily=city['daily'])
+        predictors = build_models.BASE_PREDICTORS
+        train = df.dropna(subset=predictors)
+        train['long_repair'] = (train['DURATION_td'] > 3).astype(int)
+        model = build_models.model_estimators()['logit'].fit(\
+            train[predictors].values, train['long_repair'].values)
+        scoring.save_scoring_model(model, predictors, train)
+
+        backlog = BacklogCounter()
+        backlog.add(df['INITDT_dt'].values, df['DURATION'].values)
+        scorer = scoring.OnlineScorer(scoring.load_scoring_model(),\
+            city['block_groups'], city['daily'], backlog)
+        scoring.settle_heap()
+
+        lats, lons = df['latitude'].values, df['longitude'].values
+        dts = df['INITDT_dt'].values
+        result = {}
+        for size in [1, 8, 64]:
+            start = time.time()
+            for i in range(0, 64 * 50, size):
+                scorer.score(lats[i:i+size], lons[i:i+size], dts[i:i+size])
+            result['score_us_per_report_batch%d' % size] =\
+                (time.time() - start) / (64 * 50) * 1e6
+
+        batcher = scoring.MicroBatcher(scorer)
+        n = rate * seconds
+        pending = []
+        start = time.time()
+        for i in range(n):
+            due = start + float(i) / rate
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            j = i % len(df)
+            pending.append((due, batcher.submit(lats[j], lons[j], dts[j])))
+        for due, p in pending:
+            p.result(timeout=10)
+        batcher.close()
+
+        latency = np.array([p.finished - due for due, p in pending]) * 1000
+        result.update({'requests': n, 'rate_per_s': rate,\
+            'achieved_rate_per_s': n / (pending[-1][0] - start + 1. / rate),\
+            'latency_p50_ms': np.percentile(latency, 50),\
+            'latency_p99_ms': np.percentile(latency, 99),\
+            'latency_max_ms': latency.max()})
+        return result
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+def bench_cold_start(n=200000, trees=RF_TREES, repeats=5):
+    '''
+    INPUT: int, int, int
+    OUTPUT: dict
+    Save a random forest fit on n synthetic rows as an artifact, then time
+    loading it with and without memory mapping against unpickling the
+    bare estimator.
+    '''
+    tmp = tempfile.mkdtemp()
+    try:
+        df = make_feature_frame(n)
+        df['long_repair'] = (df['DURATION_td'] > 3).astype(int)
+        predictors = build_models.BASE_PREDICTORS
+        model = RandomForestClassifier(n_estimators=trees, n_jobs=-1,\
+            random_state=0).fit(df[predictors].values, df['long_repair'].values)
+        path = artifact.save_artifact('rf', model, df, predictors,\
+            'long_repair', categoricals=['neighborhood_label'], root=tmp)
+        pickled = os.path.join(tmp, 'rf.pkl')
+        with open(pickled, 'wb') as f:
+            pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+
+        def best_of(func):
+            times = []
+            for _ in range(repeats):
+                start = time.time()
+                func()
+                times.append(time.time() - start)
+            return min(times)
+
+        def unpickle():
+            with open(pickled, 'rb') as f:
+                return pickle.load(f)
+
+        return {'trees': trees, 'rows': n,\
+            'estimator_mb': os.path.getsize(os.path.join(path,\
+                artifact.ESTIMATOR_FILE)) / 1e6,\
+            'load_mmap_s': best_of(lambda: artifact.load_artifact(path)),\
+            'load_no_mmap_s': best_of(lambda: artifact.load_artifact(path,\
+                mmap=False)),\
+            'load_verified_s': best_of(lambda: artifact.load_artifact(path,\
+                verify=True)),\
+            'unpickle_s': best_of(unpickle)}
+    finally:
+        shutil.rmtree(tmp)
+
+def main(argv=None):
+    '''
+    Usage: python benchmark.py            speedups over the replaced code
+           python benchmark.py scale [N ...]  timed scenarios at N rows
+           python benchmark.py scoring [RATE]  online scoring latency
+           python benchmark.py coldstart       model artifact load time
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'coldstart':
+        result = bench_cold_start()
+        for key in sorted(result):
+            print('%-20s %s' % (key, result[key]))
+        return
+    if argv and argv[0] == 'scoring':
+        result = bench_scoring(*[int(arg) for arg in argv[1:2]])
+        for key in sorted(result):
+            print('%-36s %s' % (key, result[key]))
+        return
+    if argv and argv[0] == 'scale':
+        scales = [int(n) for n in argv[1:]] or SCALES
+        print('Results in %s' % run_scenarios(scales))
+        return
+
+    for bench in [bench_street_index, bench_backlog, bench_work_order_index,\
+        bench_calendar_features, bench_projection, bench_neighbors,\
+        bench_parallel, bench_storage, bench_streaming_ingest, bench_encoding,\
+        bench_compaction, bench_geometry_cache]:
+        result = bench()
+        print(bench.__name__)
+        for key in sorted(result):
+            print('    %-24s %s' % (key, result[key]))
+        print('')
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,92 @@
+import sys
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from sklearn.linear_model import LogisticRegression
-from sklearn.cross_validation import KFold
-from sklearn.cross_validation import train_test_split
-from sklearn.cross_validation import cross_val_score
-import cPickle as pickle
-import sklearn.metrics as skm
-from sklearn.metrics import confusion_matrix
-import sys
 from sklearn.ensemble import RandomForestClassifier
+import storage
+from schema import restore_derived
+from instrument import RunLog
+from evaluate import make_folds, evaluate, summarize
+from encoding import CategoricalEncoder
+from scoring import save_scoring_model
+from tuning import PARAM_GRID, TuningCache, successive_halving, pareto_front
+
+# Categorical columns whose levels are saved with a model, so scoring data
+# can be checked against them
+CATEGORICALS = ['neighborhood_label','SND_FEACOD','ST_CODE','SEGMENT_TY',\
+    'DIVIDED_CO','VEHICLE_US']
+
+# Predictor sets compared by evaluate_models; an encoder stands for the
+# sparse matrix it builds (see encoding.py)
+BASE_PREDICTORS = ['cumul_potholes','Median_Home_Value','Temp','min_dist']
+FEATURE_SETS = OrderedDict([
+    ('base', BASE_PREDICTORS),
+    ('base+weather', BASE_PREDICTORS + ['Precip','Precip_3d','Precip_7d',\
+        'Temp_min','Temp_max']),
+    ('base+calendar', BASE_PREDICTORS + ['INIT_month','dayofwk','b_holiday',\
+        'days_from_wknd']),
+    ('base+neighbors', BASE_PREDICTORS + ['nearby_potholes',\
+        'nearby_repair_days']),
+    ('base+categorical', CategoricalEncoder(CATEGORICALS,\
+        numeric=BASE_PREDICTORS)),
+    ])
+
+def _fill_label(series, label):
+    '''
+    INPUT: Series, str
+    OUTPUT: Series
+    series with missing values set to label, categorical or not.
+    '''
+    if series.dtype.name == 'category' and label not in series.cat.categories:
+        series = series.cat.add_categories([label])
+    return series.fillna(label)
 
-def clean_prep_before_model():
+def clean_prep_before_model(df=None, root=storage.STORE_DIR):
     '''
-    INPUT: None
+    INPUT: df or None, str
     OUTPUT: df
-    Read in pickled df with all features computed.  Do final cleaning,
-    then pass cleaned df to model steps
+    Load the compacted features written by create_features.py (or clean
+    the df given), rebuilding the columns compaction dropped.  Do final
+    cleaning, then pass cleaned df to model steps
     '''
-    df = pd.read_pickle('df_1to10999_features.pkl')
+    if df is None:
+        df = restore_derived(storage.read_frame('features', root=root))
 
     # Keep only rows with no Median_Value NaNs, neighborhood_label == '', NaNs; 
     # street feature NaNs
     df = df[np.isfinite(df['Median_Home_Value'])]
     df = df[df['neighborhood_label'] != '']
-    df = df[np.isfinite(df['SND_FEACOD'])]
+    df = df[df['SND_FEACOD'].notnull()]
 
     # Remove rows where DURATION_td rounded to zero.
     df = df[df.DURATION_td != 0.000]
 
     # Label NaN street features 'no street features'
-    df.SND_FEACOD = df.SND_FEACOD.fillna('NO SND_FEACOD')
-    df.ST_CODE = df.ST_CODE.fillna('NO ST_CODE')
-    df.SEGMENT_TY = df.SEGMENT_TY.fillna('NO SEGMENT_TY')
-    df.DIVIDED_CO = df.DIVIDED_CO.fillna('NO DIVIDED_CO')
-    df.VEHICLE_US = df.VEHICLE_US.fillna('NO VEHICLE_US')
+    for col in ['SND_FEACOD','ST_CODE','SEGMENT_TY','DIVIDED_CO','VEHICLE_US']:
+        df[col] = _fill_label(df[col], 'NO ' + col)
+
+    # No precipitation reading means no rain was recorded; the day before
+    # the weather record starts gets that day's temperature
+    for col in ['Precip','Precip_lag1','Precip_3d','Precip_7d']:
+        df[col] = df[col].fillna(0)
+    df['Temp_lag1'] = df['Temp_lag1'].fillna(df['Temp'])
+
+    # No neighbour repaired yet: count it as no wait
+    df['nearby_repair_days'] = df['nearby_repair_days'].fillna(0)
 
     if df.isnull().values.any():
         print 'You still have NaNs'
         return df
 
-    # Conditionally add no. of potholes feature from pickled file
-    if 'cumul_potholes' not in df:
-        df['INITDT_date_only'] = df['INITDT_dt'].apply( lambda x: x.date())
-        df['INITDT_date_only'] = pd.to_datetime(df.INITDT_date_only)
-
-        df_number_potholes = pd.read_pickle('df_number_potholes.pkl')
-        df = df.reset_index()
-        df = pd.merge(df, df_number_potholes, how='left', on='INITDT_date_only')
-        df = df.set_index('index')
-
-    # Conditionally compute and add Temp feature
-    if 'Temp' not in df:
-        df = create_features.get_temp(df)
-
-    # Conditionally compute and add min_dist feature
-    if 'min_dist' not in df:
-        df['min_dist'] = df[['Seattle_dist','Space_Needle_dist','Pike_Place_dist',\
-            'Convention_Center_dist','Woodland_Park_dist']].min(axis=1)
-
-    # Conditionally rename days_end_FY feature:
-    if 'days_end_FY' in df:
-        df.rename(columns={'days_end_FY': 'months_end_FY'}, inplace=True)
-
     # Get rid of unneeded columns
     df.drop(['OBJECTID','WOKEY','LOCATION','ADDRDESC','address',\
         'Seattle_dist','Space_Needle_dist','Pike_Place_dist',\
         'Convention_Center_dist','Woodland_Park_dist','Queene_Anne_dist',\
-        'GEOID','GEO.id_x','GEO.id_y','GEO.display-label_y',\
-        'GEO.display-label_x',], axis=1, inplace=True)
+        'GEOID'], axis=1, inplace=True)
 
-    df.neighborhood_label = df.neighborhood_label.astype('category')
-    df.SND_FEACOD = df.SND_FEACOD.astype('category')
-    df.ST_CODE = df.ST_CODE.astype('category')
-    df.SEGMENT_TY = df.SEGMENT_TY.astype('category')
-    df.DIVIDED_CO = df.DIVIDED_CO.astype('category')
-    df.VEHICLE_US = df.VEHICLE_US.astype('category')
+    for col in CATEGORICALS:
+        df[col] = df[col].astype('category')
 
     return df
 
@@ -93,93 +105,124 @@ def define_target_vars(df):
 
     # Focus modeling on repair durations less than the 95th percentile
     df = df[df['b_DURATION_td_95']]
-    df.to_pickle('df_95_features.pkl')
+    storage.write_frame(df, 'features_95')
 
     return df
 
-def select_predictors(df, dummies=False, choose_dummies=True):
+def select_predictors(df, dummies=False, choose_dummies=True, encoder=None,\
+    n_hash=None):
     '''
-    INPUT: df
-    OUTPUT: df
-    Select and return predictor variables
-    '''
-    X = ['cumul_potholes','Median_Home_Value','Temp','min_dist']
-
-    # Conditionally compute categorical dummy variables
-    if dummies:
-        df_dum_neighborhood_label = pd.get_dummies(df.neighborhood_label)
-        df_dum_SND_FEACOD = pd.get_dummies(df.SND_FEACOD)
-        df_dum_ST_CODE = pd.get_dummies(df.ST_CODE)
-        df_dum_SEGMENT_TY = pd.get_dummies(df.SEGMENT_TY)
-        df_dum_DIVIDED_CO = pd.get_dummies(df.DIVIDED_CO)
-        df_dum_VEHICLE_US = pd.get_dummies(df.VEHICLE_US)
-
-        df_dummies = pd.concat([df_dum_SND_FEACOD, df_dum_ST_CODE, df_dum_SEGMENT_TY,\
-            df_dum_DIVIDED_CO, df_dum_VEHICLE_US, df_dum_neighborhood_label], axis=1)
-
-        if choose_dummies:
-            X = pd.concat([df.ix[:, X], df_dum_neighborhood_label], axis=1)
-        else:
-            X = pd.concat([df.ix[:, X], df_dummies], axis=1)
-    
-    return df[X]
+    INPUT: df, bool, bool, fitted CategoricalEncoder or None, int or None
+    OUTPUT: df, or with dummies a sparse matrix and its encoder
+    Select and return predictor variables.  With dummies the base
+    predictors are joined by indicator columns for neighborhood_label (or
+    with choose_dummies=False for every categorical), built by a sparse
+    encoder.  Pass the encoder fit on the training data when selecting
+    for test or scoring data so the columns line up.
+    '''
+    X = list(BASE_PREDICTORS)
+    if not dummies:
+        return df[X]
 
-def logit_model(df, X):
+    if encoder is None:
+        columns = ['neighborhood_label'] if choose_dummies else CATEGORICALS
+        encoder = CategoricalEncoder(columns, numeric=X, n_hash=n_hash).fit(df)
+    return encoder.transform(df), encoder
+
+def model_estimators():
     '''
     INPUT: None
-    OUTPUT: None
-    Build a logistic regression model
+    OUTPUT: dict of name -> unfitted estimator
+    The models compared on every feature set
     '''
-    y = df['long_repair']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20, random_state=67)
-
-    lr = LogisticRegression(class_weight='auto')
-    lr.fit(X_train, y_train)
-
-    print 
-    print 'Logistic Regression'
-    print '-------------------'
-    print
-    print 'Predictors: ', X.columns.tolist()
-    print
-    print 'Accuracy: ', lr.score(X_test,y_test)
-    print 'AUC: ', skm.roc_auc_score(y_test, lr.predict(X_test))
-    print 
-    print confusion_matrix(y_test, lr.predict(X_test))
+    return OrderedDict([
+        ('logit', LogisticRegression(class_weight='balanced')),
+        ('random_forest', RandomForestClassifier(n_estimators=500, n_jobs=-1)),
+        ])
 
-def rf_model(df, X):
+def evaluate_models(df, feature_sets=FEATURE_SETS, estimators=None,\
+    target='long_repair', time_aware=True, n_workers=None):
     '''
-    INPUT: None
-    OUTPUT: None
-    Build a random forest model
-    '''
-    y = df['long_repair']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20, random_state=67)
-    rfc = RandomForestClassifier(n_estimators=500, n_jobs=-1) 
-    rfc.fit(X_train, y_train)
-
-    print
-    print 'Random Forest Classifier'
-    print '------------------------'
-    print 
-    print 'Predictors: ', X.columns.tolist()
-    print
-    print 'Accuracy: ', rfc.score(X_test,y_test)
-    print 'AUC: ', skm.roc_auc_score(y_test, rfc.predict(X_test))
-    print 
-    print confusion_matrix(y_test, rfc.predict(X_test))
-
-def main():
-    df = clean_prep_before_model()
+    INPUT: df, dict of name -> predictor columns, dict of estimators or
+           None, str, bool, int or None
+    OUTPUT: df of per-fold results, df of summary
+    Cross-validate every estimator on every feature set over one shared
+    set of folds, split by INITDT_dt when time_aware.  Results are stored
+    as 'model_evaluation'.
+    '''
+    if estimators is None:
+        estimators = model_estimators()
+    folds = make_folds(df, time_col='INITDT_dt' if time_aware else None)
+    results = evaluate(df, feature_sets, estimators, target, folds,\
+        n_workers=n_workers)
+    storage.write_frame(results, 'model_evaluation')
+    return results, summarize(results)
+
+def tune_random_forest(df, predictors=BASE_PREDICTORS, target='long_repair',\
+    n_candidates=None):
+    '''
+    INPUT: df, list of predictor columns, str, int or None
+    OUTPUT: df of every scored candidate, df of the Pareto front
+    Search random forest settings by successive halving, training on all
+    but the latest work orders and scoring on the latest (the last
+    time-aware fold).  Scores are cached in TUNING_CACHE, so rerunning
+    after an interruption resumes the search.  Results are stored as
+    'rf_tuning'.
+    '''
+    train, test = make_folds(df, time_col='INITDT_dt')[-1]
+    cache = TuningCache()
+    try:
+        results = successive_halving(df[predictors].values.astype(float),\
+            df[target].values.astype(int), train, test,\
+            n_candidates=n_candidates, cache=cache)
+    finally:
+        cache.close()
+    # Settings mix None, numbers and strings; store them as text
+    stored = results.copy()
+    for col in PARAM_GRID:
+        stored[col] = stored[col].astype(str)
+    storage.write_frame(stored, 'rf_tuning')
+    return results, pareto_front(results)
+
+def main(argv=None):
+    '''
+    Usage: python build_models.py               evaluate the models
+           python build_models.py tune          tune the random forest
+           python build_models.py save [name]   fit and save the model
+                                                served by scoring.py, as
+                                                a new version under
+                                                models/scoring
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    log = RunLog()
+    with log.step('prep_before_model') as record:
+        df = clean_prep_before_model()
+        record['rows_out'] = len(df)
     df.info()
-    df = define_target_vars(df)
-    X = select_predictors(df, dummies=False, choose_dummies=True)
-    logit_model(df, X)
-    rf_model(df, X)
+    with log.step('define_target_vars', rows_in=len(df)):
+        df = define_target_vars(df)
+    if argv and argv[0] == 'save':
+        estimators = model_estimators()
+        name = argv[1] if len(argv) > 1 else 'logit'
+        with log.step('fit_scoring_model', rows_in=len(df)):
+            model = estimators[name].fit(df[BASE_PREDICTORS].values,\
+                df['long_repair'].values)
+            path = save_scoring_model(model, BASE_PREDICTORS, df,\
+                target='long_repair', categoricals=CATEGORICALS)
+        print 'Saved', path
+        return
+
+    if argv and argv[0] == 'tune':
+        with log.step('tune_random_forest', rows_in=len(df)):
+            results, front = tune_random_forest(df)
+        print front.to_string()
+        return
+
+    with log.step('evaluate_models', rows_in=len(df)):
+        results, summary = evaluate_models(df)
+    print summary.to_string()
     
 if __name__ == '__main__':
-    sys.path.insert(0, '../source')
-    import create_features
     main()
     
     
\ No newline at end of file
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+
+# American Community Survey downloads from factfinder, by table ID
+ACS_DIR = 'data'
+ACS_FILENAME = 'ACS_13_5YR_%s_with_ann.csv'
+
+# Parsed tables, as .npz next to the source CSVs
+ACS_CACHE_SUFFIX = '.npz'
+
+_tables = {}
+
+def acs_filename(table_id, acs_dir=ACS_DIR):
+    '''
+    INPUT: str, str
+    OUTPUT: str
+    Path of the downloaded ACS CSV for a table ID such as 'B25077'.
+    '''
+    return os.path.join(acs_dir, ACS_FILENAME % table_id)
+
+def _parse_acs_csv(filename):
+    '''
+    INPUT: str
+    OUTPUT: int64 array of GEOIDs, float array of values, list of columns
+    Read a factfinder CSV.  Annotation rows (a second header with column
+    descriptions) have no numeric GEO.id2 and are dropped; values that
+    are not numbers, such as '-' or '250,000+', become NaN.
+    '''
+    df = pd.read_csv(filename, dtype=str)
+    geoids = pd.to_numeric(df['GEO.id2'], errors='coerce')
+    df = df[geoids.notnull()]
+    geoids = geoids[geoids.notnull()].astype(np.int64).values
+
+    columns = [col for col in df.columns if not col.startswith('GEO.')]
+    values = np.column_stack([pd.to_numeric(df[col], errors='coerce').values\
+        for col in columns]).astype(float)
+
+    order = np.argsort(geoids, kind='mergesort')
+    return geoids[order], values[order], columns
+
+def load_acs_table(table_id, acs_dir=ACS_DIR):
+    '''
+    INPUT: str, str
+    OUTPUT: dict with 'geoids', 'values' and 'columns'
+    An ACS table as sorted integer GEOIDs and a float value matrix.  The
+    CSV is parsed once and cached as .npz, reparsed only when it changes,
+    and kept in memory for the rest of the run.
+    '''
+    filename = acs_filename(table_id, acs_dir)
+    stat = os.stat(filename)
+    stamp = np.array([stat.st_size, stat.st_mtime])
+    if filename in _tables and np.array_equal(_tables[filename]['stamp'], stamp):
+        return _tables[filename]
+
+    cache_file = filename + ACS_CACHE_SUFFIX
+    table = None
+    if os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        if np.array_equal(cached['stamp'], stamp):
+            table = {'geoids': cached['geoids'], 'values': cached['values'],\
+                'columns': list(cached['columns']), 'stamp': stamp}
+
+    if table is None:
+        geoids, values, columns = _parse_acs_csv(filename)
+        np.savez(cache_file, geoids=geoids, values=values,\
+            columns=np.array(columns), stamp=stamp)
+        table = {'geoids': geoids, 'values': values, 'columns': columns,\
+            'stamp': stamp}
+
+    _tables[filename] = table
+    return table
+
+def attach_acs(df, attributes, geoid_col='GEOID', acs_dir=ACS_DIR):
+    '''
+    INPUT: df, list of (table ID, column, new column name), str, str
+    OUTPUT: df
+    Add the requested ACS attributes for each row's block group.  Each
+    table is matched to the frame once with a sorted-array lookup; every
+    attribute from it is then a single take.  Rows whose GEOID is missing
+    or not in the table get NaN.
+    '''
+    row_geoids = pd.to_numeric(df[geoid_col], errors='coerce').values
+    known = ~np.isnan(row_geoids)
+    row_geoids = np.where(known, row_geoids, -1).astype(np.int64)
+
+    by_table = {}
+    for table_id, column, name in attributes:
+        by_table.setdefault(table_id, []).append((column, name))
+
+    for table_id in sorted(by_table):
+        table = load_acs_table(table_id, acs_dir)
+        geoids = table['geoids']
+        pos = np.minimum(np.searchsorted(geoids, row_geoids), len(geoids) - 1)
+        matched = known & (geoids[pos] == row_geoids)
+
+        for column, name in by_table[table_id]:
+            values = np.empty(len(df))
+            values.fill(np.nan)
+            values[matched] = table['values'][pos[matched],\
+                table['columns'].index(column)]
+            df[name] = values
+
+    return df
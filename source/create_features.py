@@ -1,10 +1,20 @@
 import pandas as pd
 import numpy as np
-import fiona
-from shapely.geometry import shape, Polygon, MultiPolygon, Point,\
-    MultiLineString, MultiPoint
-import cPickle as pickle
-from geopy.distance import vincenty
+from collections import OrderedDict
+from pandas.tseries.holiday import USFederalHolidayCalendar
+from distances import landmark_distances
+from spatial_index import PolygonLookup, StreetIndex
+from backlog import BacklogCounter
+from pipeline import Stage, run_pipeline
+from parallel import ParallelRunner
+from instrument import RunLog
+from census import attach_acs, acs_filename
+from weather import WEATHER_CSV, load_daily_weather, add_window_features,\
+    attach_weather
+import storage
+from schema import compact_frame
+from neighbors import neighbor_features, WINDOW_DAYS
+from projection import X_COL, Y_COL, add_projected_coords
 
 # Lat-lons for key Seattle locations
 SEATTLE_LOC = (47.6062095, -122.3320708)
@@ -14,265 +24,181 @@ CONVENTION_CENTER_LOC = (47.611389, -122.33168)
 WOODLAND_PARK_ZOO_LOC = (47.6685394, -122.3536447)
 QUEENE_ANNE_LOC = (47.63747,-122.3578884)
 
-def _get_distance(df, origin):
+# Shapefiles, without the .shp extension
+NEIGHBORHOODS_SHP = 'data/Neighborhoods'
+BLOCK_GROUPS_SHP = 'data/tl_2013_53_bg_Seattle'
+STREETS_SHP = 'data/WGS84/Street_Network_Database'
+
+# Street segment properties attached to each pothole
+STREET_FEATURES = ['SND_FEACOD','ST_CODE','SEGMENT_TY','DIVIDED_CO','VEHICLE_US']
+
+# Block group economics: (ACS table, column, feature name).  B25077 is
+# median home value, B19013 median household income.
+CENSUS_ATTRIBUTES = [
+    ('B25077', 'HD01_VD01', 'Median_Home_Value'),
+    ('B25077', 'HD02_VD01', 'Home_Margin_of_Error'),
+    ('B19013', 'HD01_VD01', 'Median_Income'),
+    ('B19013', 'HD02_VD01', 'Income_Margin_of_Error'),
+    ]
+
+# Daily weather attached to each pothole
+WEATHER_FEATURES = ['Temp','Temp_min','Temp_max','Precip','Temp_lag1',\
+    'Precip_lag1','Precip_3d','Precip_7d']
+
+# Nearby earlier potholes attached to each pothole
+NEIGHBOR_FEATURES = ['nearby_potholes','nearby_repair_days']
+
+# First month of the fiscal year
+FY_START_MONTH = 7
+
+# Days off besides weekends
+HOLIDAY_CALENDAR = USFederalHolidayCalendar()
+
+# Distance column name -> landmark lat-lon
+LANDMARKS = OrderedDict([
+    ('Seattle_dist', SEATTLE_LOC),
+    ('Space_Needle_dist', SPACE_NEEDLE_LOC),
+    ('Pike_Place_dist', PIKE_PLACE_LOC),
+    ('Convention_Center_dist', CONVENTION_CENTER_LOC),
+    ('Woodland_Park_dist', WOODLAND_PARK_ZOO_LOC),
+    ('Queene_Anne_dist', QUEENE_ANNE_LOC)])
+
+# Landmark distance columns that feed min_dist
+MIN_DIST_LANDMARKS = ['Seattle_dist','Space_Needle_dist','Pike_Place_dist',\
+    'Convention_Center_dist','Woodland_Park_dist']
+
+def create_distances(df, landmarks=LANDMARKS, min_dist_cols=MIN_DIST_LANDMARKS,\
+    method='vincenty'):
     '''
-    INPUT: df, tuple
-    OUTPUT: pandas Series
-    Input dataframe has lat-lon coords for each row/pothole.
-    Returns Series containing distance from origin to each pothole.
-    '''
-    dists = []
-    for row in df.index.tolist():
-        point = df.ix[row,'latitude'], df.ix[row, 'longitude']
-        dist = vincenty(origin, point)
-        dists.append(dist.miles)
-    dists = pd.Series(dists, index=df.index)
-    return dists
-
-def create_distances(df):
-    '''
-    INPUT: df
+    INPUT: df, dict, list, str
     OUTPUT: df
     Pass in cleaned data as dataframe and add columns containing
-    distances to key landmarks in Seattle
+    distances in miles to key landmarks in Seattle, by default
     1. City center
     2. Space Needle
     3. Convention center
     4. Center of Queene Anne neighborhood
     5. Pike Place
     6. Woodland_Park_zoo_loc
+    landmarks maps each new column name to a lat-lon; all pothole-landmark
+    pairs are computed in one batched call.  method is 'vincenty'
+    (ellipsoidal, matches geopy's vincenty) or 'haversine' (faster).
     '''
-    df['Seattle_dist'] = _get_distance(df, SEATTLE_LOC)
-    df['Space_Needle_dist'] = _get_distance(df, SPACE_NEEDLE_LOC)  
-    df['Pike_Place_dist'] = _get_distance(df, PIKE_PLACE_LOC) 
-    df['Convention_Center_dist'] = _get_distance(df, CONVENTION_CENTER_LOC) 
-    df['Woodland_Park_dist'] = _get_distance(df, WOODLAND_PARK_ZOO_LOC) 
-    df['Queene_Anne_dist'] = _get_distance(df, QUEENE_ANNE_LOC) 
+    dists = landmark_distances(df['latitude'].values, df['longitude'].values,\
+        list(landmarks.values()), method=method)
+    for col, name in enumerate(landmarks):
+        df[name] = pd.Series(dists[:, col], index=df.index)
 
-    df['min_dist'] = df[['Seattle_dist','Space_Needle_dist','Pike_Place_dist',\
-        'Convention_Center_dist','Woodland_Park_dist']].min(axis=1)
+    df['min_dist'] = df[min_dist_cols].min(axis=1)
 
     return df
 
-def create_seasonality(df):
+def create_calendar_features(df, fy_start_month=FY_START_MONTH,\
+    holidays=HOLIDAY_CALENDAR):
     '''
-    INPUT: df
+    INPUT: df, int, holiday calendar or list of dates or None
     OUTPUT: df
     Pass in cleaned data as dataframe and add columns representing
-    seasonality trends
+    seasonality trends and weekday vs weekend effects:
+    INIT_Quarter, INIT_month, months_end_FY, dayofwk, b_weekend?,
+    b_holiday, days_from_wknd and wkdy_or_wknd.
+
+    Differences from the old create_seasonality/create_weekday:
+    months_end_FY counts months left in the fiscal year starting in
+    fy_start_month, so it runs 11..0 instead of going negative after June;
+    Saturday now counts as weekend in b_weekend? and wkdy_or_wknd; and
+    days_from_wknd is the number of days until the next weekend day or
+    holiday (0 on those days) instead of 6 - dayofwk.
     '''
-    quarters = [df.ix[row, 'INITDT_dt'].quarter for row in df.index.tolist()]
-    df['INIT_Quarter'] = pd.Series(quarters, index = df.index)
-
-    days = [6 - df.ix[row, 'INITDT_dt'].month for row in df.index.tolist()]
-    df['months_end_FY'] = pd.Series(days, index = df.index)
-
-    months = [df.ix[row, 'INITDT_dt'].month for row in df.index.tolist()]
-    df['INIT_month'] = pd.Series(months, index = df.index)
+    init = df['INITDT_dt'].dt
+    dates = init.normalize()
+
+    df['INIT_Quarter'] = init.quarter
+    df['INIT_month'] = init.month
+    df['months_end_FY'] = (fy_start_month - 1 - init.month) % 12
+
+    df['dayofwk'] = init.dayofweek
+    df['b_weekend?'] = df['dayofwk'] >= 5
+    df['wkdy_or_wknd'] = np.where(df['b_weekend?'], 'weekend', 'weekday')
+
+    # Flag every day off in the span, then measure the gap from each
+    # init date to the next one; a weekend is never more than 5 days away
+    first, last = dates.min(), dates.max() + pd.Timedelta(days=7)
+    days = pd.DatetimeIndex(pd.date_range(first, last, freq='D'))
+    if holidays is None:
+        holiday_dates = pd.DatetimeIndex([])
+    elif hasattr(holidays, 'holidays'):
+        holiday_dates = holidays.holidays(first, last)
+    else:
+        holiday_dates = pd.DatetimeIndex(pd.to_datetime(list(holidays)))
+    off = np.asarray((days.dayofweek >= 5) | days.isin(holiday_dates))
+
+    day_offsets = (dates - first).dt.days.values
+    off_offsets = np.nonzero(off)[0]
+    df['b_holiday'] = off[day_offsets] & ~df['b_weekend?'].values
+    df['days_from_wknd'] = off_offsets[np.searchsorted(off_offsets,\
+        day_offsets)] - day_offsets
 
     return df
 
-def create_weekday(df):
-    '''
-    INPUT: df
-    OUTPUT: df
-    Pass in cleaned data as dataframe and add columns representing
-    weekday vs weekend effects
-    '''
-    dayofwk = [df.ix[row, 'INITDT_dt'].weekday() for row in df.index.tolist()]
-    days_from_wknd = map(lambda x: 6-x if x != 6 or x != 7 else 0, dayofwk)
-    wkdy_or_wknd = ['weekday' if elem in range(0,6,1) else 'weekend' for elem in dayofwk]
-    
-    df['dayofwk'] = pd.Series(dayofwk, index = df.index)
-    df['b_weekend?'] = df['dayofwk'] > 5
-    df['days_from_wknd'] = pd.Series(days_from_wknd, index = df.index)
-    df['wkdy_or_wknd'] = pd.Series(wkdy_or_wknd, index = df.index)
-    
-    return df
-
-def _get_potholes(df):
-    '''
-    INPUT: df
-    OUTPUT: None
-    Create geometries for all potholes, get their indices and pickle as a tuple
-    '''
-    all_potholes = MultiPoint([Point(x, y) for x, y in zip(df['longitude'],\
-        df['latitude'])])
-    all_potholes = (all_potholes, df.index.tolist())
-
-    with open('all_potholes.pkl', 'w') as f:
-        pickle.dump(all_potholes, f)
-
-def get_neighborhoods(df):
+def get_neighborhoods(df, hoods=None):
     '''
-    INPUT: df
+    INPUT: df, PolygonLookup or None
     OUTPUT: df
     Pass in the cleaned data as a dataframe and add a new column
     containing the neighborhood the pothole belongs to
     '''
-    # Read in shapefile of Seattle neighborhoods
-    shapefilename = 'data/Neighborhoods'
-    shp = fiona.open(shapefilename+'.shp')
-    
-    # Get neighborhood polys and their indices
-    polys = [shape(pol['geometry']) for pol in shp]
-    shp.close()
-    neighborhood_index = [i+1 for i in range(len(polys))]
-
-    # Associate each neighborhood polygon with its index
-    neighborhoods_tup = []
-    mpolys = MultiPolygon(polys)
-    for hood in xrange(len(polys)):
-        neighborhoods_tup.append((mpolys[hood],\
-        neighborhood_index[hood]))
-
-    # Get potholes
-    with open('all_potholes.pkl') as f:
-        all_potholes = pickle.load(f)
-    
-    # Extract the neighborhood index associated with each pothole
-    neighborhood_label = []
-    for hole in xrange(df.shape[0]):
-        found = False
-        for hood in xrange(len(neighborhoods_tup)):
-            # if neighborhoods_tup[hood][0].contains(potholes_tup[hole][0]):
-            if neighborhoods_tup[hood][0].contains(all_potholes[0][hole]):
-                neighborhood_label.append(neighborhoods_tup[hood][1])
-                found = True
-        if not found:
-            neighborhood_label.append('')
+    # Index the Seattle neighborhoods shapefile; labels are 1-based
+    # neighborhood indices
+    if hoods is None:
+        hoods = load_neighborhoods()
 
     # Add labels to dataframe
-    df['neighborhood_label'] = pd.Series(neighborhood_label,\
-        index = all_potholes[1])
+    df['neighborhood_label'] = pd.Series(hoods.label(df[X_COL].values,\
+        df[Y_COL].values), index=df.index)
 
     return df
 
-def _lookup_housing(df, filename):
-    '''
-    INPUT: df, filename path to lookup table
-    OUTPUT: df with econ value added to dataframe
+def get_census_economic_vals(df, block_groups=None):
     '''
-    # Read in, prep, join housing value data
-    df_econ = pd.read_csv(filename, skiprows=range(1,2))
-    df_econ.rename(columns={'GEO.id2':'GEOID'}, inplace=True)
-    df_econ['GEOID'] = df_econ['GEOID'].astype('unicode')
-
-    df = df.reset_index()
-    df = pd.merge(df, df_econ, how='left', on='GEOID')
-    df = df.set_index('index')
-
-    # Convert economic values to floats, NaNs if not possible
-    df['HD01_VD01'] = df['HD01_VD01'].\
-        convert_objects(convert_numeric=True)
-    df['HD02_VD01'] = df['HD02_VD01'].\
-        convert_objects(convert_numeric=True)
-
-    # Rename economic values
-    df.rename(columns={'HD01_VD01': 'Median_Home_Value',\
-                       'HD02_VD01': 'Home_Margin_of_Error'}, inplace=True)
-
-    return df
-
-def _lookup_income(df, filename):
-    '''
-    INPUT: df, filename path to lookup table
-    OUTPUT: df with income value added to dataframe
-    '''
-    # Read in, prep, join housing value data
-    df_econ = pd.read_csv(filename, skiprows=range(1,3))
-    df_econ.rename(columns={'GEO.id2':'GEOID'}, inplace=True)
-    df_econ['GEOID'] = df_econ['GEOID'].astype('unicode')
-
-    df = df.reset_index()
-    df = pd.merge(df, df_econ, how='left', on='GEOID')
-    df = df.set_index('index')
-
-    # Convert economic values to floats, NaNs if not possible
-    df['HD01_VD01'] = df['HD01_VD01'].\
-        convert_objects(convert_numeric=True)
-    df['HD02_VD01'] = df['HD02_VD01'].\
-        convert_objects(convert_numeric=True)
-
-    # Rename economic values
-    df.rename(columns={'HD01_VD01': 'Median_Income',\
-                       'HD02_VD01': 'Income_Margin_of_Error'}, inplace=True)
-
-    return df
-
-def get_census_economic_vals(df):
-    '''
-    INPUT: df
+    INPUT: df, PolygonLookup or None
     OUTPUT: df
     Pass in the cleaned data as a dataframe and add new columns
     containing income and economic values based on census data.
     '''
-    # Read in shapefile of Seattle block groups
-    shapefilename = 'data/tl_2013_53_bg_Seattle'
-    shp = fiona.open(shapefilename+'.shp')
-
-    # Get block group polys
-    polys = [shape(pol['geometry']) for pol in shp]
-
-    # Associate each block group polygon with its GEOID
-    block_group_tup = []
-    idx = 0
-    mpolys = MultiPolygon(polys)
-    for feature in shp:
-        block_group_tup.append((mpolys[idx],\
-        feature['properties']['GEOID']))
-        idx += 1
-    shp.close()
-
-    # Get potholes
-    with open('all_potholes.pkl') as f:
-        all_potholes = pickle.load(f)
-
-    # Extract the block group GEOID associated with each pothole
-    block_group_label = []
-    for hole in xrange(len(all_potholes[0])):
-        found = False
-        for group in xrange(len(block_group_tup)):
-            if block_group_tup[group][0].contains(all_potholes[0][hole]):
-                block_group_label.append(block_group_tup[group][1])
-                found = True
-        if not found:
-            block_group_label.append('')
+    # Index the Seattle block groups shapefile by GEOID
+    if block_groups is None:
+        block_groups = load_block_groups()
 
     # Add block group to dataframe
-    df['GEOID'] = pd.Series(block_group_label,\
-        index = all_potholes[1])
- 
-    df = _lookup_housing(df, 'data/ACS_13_5YR_B25077_with_ann.csv')
-    df = _lookup_income(df, 'data/ACS_13_5YR_B19013_with_ann.csv')
+    df['GEOID'] = pd.Series(block_groups.label(df[X_COL].values,\
+        df[Y_COL].values), index=df.index)
+
+    df = attach_acs(df, CENSUS_ATTRIBUTES)
 
     return df
 
-def get_pothole_count(df):
+def get_pothole_count(df, backlog=None):
     '''
+    INPUT: df, BacklogCounter or None
+    OUTPUT: df
     Pass in the cleaned data as a dataframe and add new columns representing
     daily and cumulative number of potholes on each day a pothole was initiated.
+    Pass a BacklogCounter already holding earlier work orders to count
+    them as well; this frame's orders are added to it.
     '''
-    df_number_potholes = pd.DataFrame(df.groupby('INITDT_dt')['OBJECTID'].\
+    df['INITDT_date_only'] = df['INITDT_dt'].dt.normalize()
+
+    df_number_potholes = pd.DataFrame(df.groupby('INITDT_date_only')['OBJECTID'].\
         count()).reset_index()
     df_number_potholes.rename(columns={'OBJECTID': 'Number_potholes'}, inplace=True)
 
-    cum_potholes = []
-    for date_item in xrange(df_number_potholes.shape[0]):
-        total = 0
-        for each_item in df.index.tolist():
-            if (df.ix[each_item, 'INITDT_date_only'] + df.ix[each_item, 'DURATION']\
-            > df_number_potholes.ix[date_item, 'INITDT_date_only'])\
-            and (df_number_potholes.ix[date_item, 'INITDT_date_only']\
-            >= df.ix[each_item, 'INITDT_date_only']):
-                total += 1
-        cum_potholes.append(total)
-
-    df_number_potholes['cumul_potholes'] = cum_potholes
-    df_number_potholes.to_pickle('df_number_potholes.pkl')
-
-    df['INITDT_date_only'] = df['INITDT_dt'].apply( lambda x: x.date())
-    df['INITDT_date_only'] = pd.to_datetime(df.INITDT_date_only)
+    # Active backlog on every day from a sweep over init/finish events
+    if backlog is None:
+        backlog = BacklogCounter()
+    backlog.add(df['INITDT_dt'].values, df['DURATION'].values)
+    df_number_potholes['cumul_potholes'] = backlog.active_on(\
+        df_number_potholes['INITDT_date_only'].values)
 
     df = df.reset_index()
     df = pd.merge(df, df_number_potholes, how='left', on='INITDT_date_only')
@@ -280,111 +206,132 @@ def get_pothole_count(df):
 
     return df
 
-def get_temp(df):
+def get_neighbor_features(df):
     '''
     INPUT: df
-    OUTPUt: df
-    Pass in the cleaned data as a dataframe and add a new column representing
-    avg temp on day when pothole is initiated
+    OUTPUT: df
+    Pass in the cleaned data as a dataframe and add new columns with the
+    number of potholes reported nearby in the days before each one, and
+    the mean repair time of those already repaired (see neighbors.py).
     '''
-    df_weather = pd.read_csv('data/weather.csv')
-    df_weather = df_weather[['date','Time','Temp.']]
-    df_weather.rename(columns={'Temp.': 'Temp'}, inplace=True)
-    df_weather['dt'] = pd.to_datetime(df_weather.apply(lambda x: x['date']\
-        + ' ' + x['Time'], 1))
-    df_weather = df_weather.set_index('dt')
-    df_weather = df_weather.drop(['date','Time'], axis=1)
-    df_weather = df_weather.apply(lambda x: x.str[:-5])
-    df_weather = df_weather.convert_objects(convert_numeric=True)
-    df_weather = df_weather.resample('D', how='mean')
-
-    df['INITDT_date_only'] = df['INITDT_dt'].apply( lambda x: x.date())
-    df['INITDT_date_only'] = pd.to_datetime(df.INITDT_date_only)
+    features = neighbor_features(df)
+    for col in NEIGHBOR_FEATURES:
+        df[col] = features[col]
+    return df
 
-    df = df.reset_index()
-    df = pd.merge(df, df_weather, how='left', left_on='INITDT_date_only', right_index=True)
-    df = df.set_index('index')
+def get_temp(df, daily=None):
+    '''
+    INPUT: df, daily weather df or None
+    OUTPUt: df
+    Pass in the cleaned data as a dataframe and add new columns representing
+    the weather on the day the pothole is initiated: avg, min and max temp,
+    precipitation, the previous day's values and recent rain totals.
+    '''
+    if daily is None:
+        daily = load_weather()
 
-    return df
+    return attach_weather(df, WEATHER_FEATURES, daily=daily)
 
-def get_closest_distance_features(df):
+def get_closest_distance_features(df, streets=None, max_distance=None):
     '''
-    INPUT: df
+    INPUT: df, StreetIndex or None, float or None
     OUTPUT: df
-    Pass in the cleaned data as a dataframe and add a new column
+    Pass in the cleaned data as a dataframe and add new columns
     containing closest distance features based on a Seattle street
-    network database.
+    network database.  Potholes with no street segment within
+    max_distance metres get NaN street features.
     '''
-    # Read in shapefile
-    shapefilename = 'data/WGS84/Street_Network_Database'
-    shp = fiona.open(shapefilename+'.shp')
-
-    # Get street segments
-    segs = [shape(seg['geometry']) for seg in shp]
-
-    # Associate each feature with a list of the desired features
-    street_feature_list = []
-    for feature in shp:
-        feature_list = [feature['properties']['SND_FEACOD']]
-        feature_list.append(feature['properties']['ST_CODE'])
-        feature_list.append(feature['properties']['SEGMENT_TY'])
-        feature_list.append(feature['properties']['DIVIDED_CO'])
-        feature_list.append(feature['properties']['VEHICLE_US'])
-        street_feature_list.append(feature_list)
-    shp.close()
-
-    # Get potholes
-    with open('all_potholes.pkl') as f:
-        all_potholes = pickle.load(f)
-
-    # Compute closest distance from pothole to street geom;
-    # Associate the street geom features with the closest pothole
-    street_features = []
-    msegs = MultiLineString(segs)
-    for hole in xrange(len(all_potholes[0])):
-        found = False
-        smallest_dist = 100.
-        for street in xrange(len(msegs)):
-            dist = all_potholes[0][hole].distance(msegs[street])
-            if dist < smallest_dist:
-                found = True
-                smallest_dist = dist
-                smallest_dist_street_feature = street_feature_list[street]
-        street_features.append(smallest_dist_street_feature)
-        if not found:   
-            street_features.append([])
-
-    # Add street geom features to dataframe
-    df['SND_FEACOD'] = pd.Series([elem[0] for elem in street_features],\
-        index = all_potholes[1])
-
-    df['ST_CODE'] = pd.Series([elem[1] for elem in street_features],\
-        index = all_potholes[1])
+    # Index the street network shapefile
+    if streets is None:
+        streets = load_streets()
 
-    df['SEGMENT_TY'] = pd.Series([elem[2] for elem in street_features],\
-        index = all_potholes[1])
+    # Associate the closest street segment's features with each pothole
+    street_features = streets.nearest_attributes(df[X_COL].values,\
+        df[Y_COL].values, max_distance=max_distance)
 
-    df['DIVIDED_CO'] = pd.Series([elem[3] for elem in street_features],\
-        index = all_potholes[1])
-
-    df['VEHICLE_US'] = pd.Series([elem[4] for elem in street_features],\
-        index = all_potholes[1])
+    # Add street geom features to dataframe
+    for col, name in enumerate(STREET_FEATURES):
+        df[name] = pd.Series([elem[col] for elem in street_features],\
+            index=df.index)
 
     return df
 
+def load_neighborhoods():
+    return PolygonLookup.from_shapefile(NEIGHBORHOODS_SHP, projected=True)
+
+def load_block_groups():
+    return PolygonLookup.from_shapefile(BLOCK_GROUPS_SHP, label_field='GEOID',\
+        projected=True)
+
+def load_weather():
+    return add_window_features(load_daily_weather(WEATHER_CSV))
+
+def load_streets():
+    return StreetIndex.from_shapefile(STREETS_SHP, STREET_FEATURES,\
+        projected=True)
+
+# The feature pipeline: each stage's input columns, output columns,
+# external files and the indexes it is given.  Stages are cached
+# separately and only rerun when stale; the backlog and neighbour counts
+# look back over a bounded time, so new work orders only rerun the
+# latest time buckets.  Potholes are projected to metres once, by the
+# first stage, and every spatial stage after it uses those coordinates
+# against shapefiles projected when loaded.
+STAGES = [
+    Stage('projection', add_projected_coords, ['latitude','longitude'],\
+        [X_COL, Y_COL]),
+    Stage('distances', create_distances, ['latitude','longitude'],\
+        list(LANDMARKS) + ['min_dist']),
+    Stage('calendar', create_calendar_features, ['INITDT_dt'],\
+        ['INIT_Quarter','INIT_month','months_end_FY','dayofwk','b_weekend?',\
+        'wkdy_or_wknd','b_holiday','days_from_wknd']),
+    Stage('neighborhoods', get_neighborhoods, [X_COL, Y_COL],\
+        ['neighborhood_label'], files=[NEIGHBORHOODS_SHP+'.shp',\
+        NEIGHBORHOODS_SHP+'.dbf'], resources={'hoods': load_neighborhoods}),
+    Stage('census', get_census_economic_vals, [X_COL, Y_COL],\
+        ['GEOID','Median_Home_Value','Home_Margin_of_Error','Median_Income',\
+        'Income_Margin_of_Error'], files=[BLOCK_GROUPS_SHP+'.shp',\
+        BLOCK_GROUPS_SHP+'.dbf'] + sorted(set(acs_filename(table_id)\
+        for table_id, _, _ in CENSUS_ATTRIBUTES)),\
+        resources={'block_groups': load_block_groups}),
+    Stage('pothole_count', get_pothole_count, ['OBJECTID','INITDT_dt','DURATION'],\
+        ['INITDT_date_only','Number_potholes','cumul_potholes'], row_local=False,\
+        time_column='INITDT_dt', end_column='DURATION'),
+    Stage('neighbors', get_neighbor_features, [X_COL, Y_COL, 'INITDT_dt',\
+        'FLDENDDT_dt','DURATION_td'], NEIGHBOR_FEATURES,\
+        row_local=False, time_column='INITDT_dt', lookback_days=WINDOW_DAYS),
+    Stage('temp', get_temp, ['INITDT_dt'], WEATHER_FEATURES, files=[WEATHER_CSV],\
+        resources={'daily': load_weather}),
+    Stage('streets', get_closest_distance_features, [X_COL, Y_COL],\
+        STREET_FEATURES, files=[STREETS_SHP+'.shp', STREETS_SHP+'.dbf'],\
+        resources={'streets': load_streets}),
+    ]
+
+def build_features(name='geo_cleaned', stages=STAGES, n_workers=1, log=None):
+    '''
+    INPUT: str name of stored stage output, list of Stages, int or None,
+           RunLog or None
+    OUTPUT: df
+    Read in the geocoded data and add every feature.  Only stages whose
+    code, files or input rows changed since the last run do any work.
+    Row-local stages are spread over n_workers processes (None for one
+    per core).  Each stage is recorded in log, if given.
+    '''
+    df = storage.read_frame(name)
+    if n_workers == 1:
+        return run_pipeline(df, stages, log=log)
+    with ParallelRunner(stages, n_workers=n_workers) as runner:
+        return run_pipeline(df, stages, runner=runner, log=log)
+
 def main():
-    df = pd.read_pickle('df_geo_cleaned.pkl')
-    _get_potholes(df)
-    df = create_distances(df)
-    df = create_seasonality(df)
-    df = create_weekday(df)
-    df = get_neighborhoods(df)
-    df = get_census_economic_vals(df)
-    df = get_pothole_count(df)
-    df = get_temp(df)
-    df = get_closest_distance_features(df)
-    df.to_pickle('df_features.pkl')
+    log = RunLog()
+    df = build_features(n_workers=None, log=log)
+    with log.step('compact_features', rows_in=len(df)) as record:
+        df, report = compact_frame(df)
+        record['bytes_saved'] = int(report['bytes_saved'].sum())
+    print report.to_string()
+    with log.step('write_features', rows_in=len(df)):
+        storage.write_frame(df, 'features')
 
 if __name__ == '__main__':
     main()
-    
\ No newline at end of file
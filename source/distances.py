@@ -0,0 +1,171 @@
+import math
+import numpy as np
+
+# WGS-84 ellipsoid (km), as used by geopy's vincenty
+WGS84_A = 6378.137
+WGS84_B = 6356.7523142
+WGS84_F = 1 / 298.257223563
+
+# Mean earth radius (km), as used by geopy's great_circle
+EARTH_RADIUS_KM = 6371.009
+
+KM_PER_MILE = 1.609344
+
+def haversine_miles(lats, lons, origins):
+    '''
+    INPUT: array of N lats, array of N lons, list of L (lat, lon) tuples
+    OUTPUT: N x L numpy array
+    Great circle distance in miles from every point to every origin on a
+    spherical earth.  Roughly 0.5% off the ellipsoidal distance, but needs
+    no iteration.
+    '''
+    lat1, lon1, lat2, lon2 = _broadcast(lats, lons, origins)
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    return dist / KM_PER_MILE
+
+def vincenty_miles(lats, lons, origins, tol=1e-12, max_iter=200):
+    '''
+    INPUT: array of N lats, array of N lons, list of L (lat, lon) tuples
+    OUTPUT: N x L numpy array
+    Ellipsoidal (Vincenty inverse) distance in miles from every point to
+    every origin.  All N x L pairs iterate together; at the default tol the
+    result agrees with geopy's per-point vincenty to better than 1e-6 miles
+    (a few millimetres) for city-scale distances.  Points with a missing
+    coordinate get NaN distances.
+    '''
+    lat1, lon1, lat2, lon2 = _broadcast(lats, lons, origins)
+
+    f = WGS84_F
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    L = lon2 - lon1
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    for _ in range(max_iter):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 +
+            (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        # Coincident points have sin_sigma == 0; their distance is zero
+        safe_sin_sigma = np.where(sin_sigma == 0, 1., sin_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / safe_sin_sigma
+        cos_sq_alpha = 1 - sin_alpha ** 2
+
+        # Points on the equator have cos_sq_alpha == 0
+        safe_cos_sq_alpha = np.where(cos_sq_alpha == 0, 1., cos_sq_alpha)
+        cos2_sigma_m = np.where(cos_sq_alpha == 0, 0.,
+            cos_sigma - 2 * sinU1 * sinU2 / safe_cos_sq_alpha)
+
+        C = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma *
+            (cos2_sigma_m + C * cos_sigma * (-1 + 2 * cos2_sigma_m ** 2)))
+
+        # Missing coordinates never converge; they come out as NaN
+        if np.all((np.abs(lam - lam_prev) < tol) | np.isnan(lam)):
+            break
+    else:
+        raise ValueError('Vincenty formula failed to converge')
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos2_sigma_m + B / 4 * (cos_sigma *
+        (-1 + 2 * cos2_sigma_m ** 2) - B / 6 * cos2_sigma_m *
+        (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos2_sigma_m ** 2)))
+    dist = WGS84_B * A * (sigma - delta_sigma)
+
+    return dist / KM_PER_MILE
+
+def vincenty_miles_point(lat, lon, origins, tol=1e-12, max_iter=200):
+    '''
+    INPUT: float, float, list of L (lat, lon) tuples
+    OUTPUT: list of L floats
+    vincenty_miles for a single point, in plain Python floats.  Same
+    formula and stopping rule; for one point it avoids numpy's per-call
+    overhead, which dominates at that size.
+    '''
+    f = WGS84_F
+    U2 = math.atan((1 - f) * math.tan(math.radians(lat)))
+    sinU2, cosU2 = math.sin(U2), math.cos(U2)
+
+    dists = []
+    for origin_lat, origin_lon in origins:
+        U1 = math.atan((1 - f) * math.tan(math.radians(origin_lat)))
+        sinU1, cosU1 = math.sin(U1), math.cos(U1)
+        L = math.radians(lon) - math.radians(origin_lon)
+
+        lam = L
+        for _ in range(max_iter):
+            sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+            sin_sigma = math.sqrt((cosU2 * sin_lam) ** 2 +
+                (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+            if sin_sigma == 0:
+                break
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = math.atan2(sin_sigma, cos_sigma)
+            sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            cos2_sigma_m = cos_sigma - 2 * sinU1 * sinU2 / cos_sq_alpha\
+                if cos_sq_alpha != 0 else 0.
+            C = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma *
+                (cos2_sigma_m + C * cos_sigma * (-1 + 2 * cos2_sigma_m ** 2)))
+            if abs(lam - lam_prev) < tol or math.isnan(lam):
+                break
+        else:
+            raise ValueError('Vincenty formula failed to converge')
+
+        if sin_sigma == 0:
+            dists.append(0.)
+            continue
+        u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = B * sin_sigma * (cos2_sigma_m + B / 4 * (cos_sigma *
+            (-1 + 2 * cos2_sigma_m ** 2) - B / 6 * cos2_sigma_m *
+            (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos2_sigma_m ** 2)))
+        dists.append(WGS84_B * A * (sigma - delta_sigma) / KM_PER_MILE)
+
+    return dists
+
+def landmark_distances(lats, lons, origins, method='vincenty'):
+    '''
+    INPUT: array of N lats, array of N lons, list of L (lat, lon) tuples, str
+    OUTPUT: N x L numpy array
+    Distance in miles from every point to every origin in one batched call.
+    method is 'vincenty' (ellipsoidal) or 'haversine' (spherical, faster).
+    '''
+    if method == 'vincenty':
+        return vincenty_miles(lats, lons, origins)
+    elif method == 'haversine':
+        return haversine_miles(lats, lons, origins)
+    raise ValueError('Unknown distance method: %s' % method)
+
+def _broadcast(lats, lons, origins):
+    '''
+    INPUT: array of N lats, array of N lons, list of L (lat, lon) tuples
+    OUTPUT: four N x L arrays, in radians
+    Shape points as a column and origins as a row so every formula above
+    evaluates all pairs at once.
+    '''
+    lats = np.radians(np.asarray(lats, dtype=float))[:, np.newaxis]
+    lons = np.radians(np.asarray(lons, dtype=float))[:, np.newaxis]
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+
+    lat1 = np.broadcast_to(origins[:, 0], (lats.shape[0], origins.shape[0]))
+    lon1 = np.broadcast_to(origins[:, 1], lat1.shape)
+    lat2 = np.broadcast_to(lats, lat1.shape)
+    lon2 = np.broadcast_to(lons, lat1.shape)
+
+    return lat1, lon1, lat2, lon2
@@ -0,0 +1,132 @@
+import zlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Levels seen fewer times than this in the fitting data share their
+# column's 'other' slot, as do levels first seen after fitting
+MIN_COUNT = 10
+
+# Name given to each column's 'other' slot in feature_names
+OTHER = '__other__'
+
+class CategoricalEncoder(object):
+    '''
+    One-hot encodes categorical columns into a sparse design matrix whose
+    layout is fixed when the encoder is fit, so train, test and scoring
+    data always get the same columns in the same order.
+
+    The matrix holds the numeric columns first, then one block per
+    categorical column: slot 0 for rare and unseen levels, then one slot
+    per kept level in sorted order.  With n_hash, levels are instead
+    hashed into n_hash shared slots, so no vocabulary has to be kept and
+    unseen levels still get a column of their own (up to collisions).
+    '''
+    def __init__(self, columns, numeric=(), min_count=MIN_COUNT, n_hash=None):
+        self.columns = list(columns)
+        self.numeric = list(numeric)
+        self.min_count = min_count
+        self.n_hash = n_hash
+        self.vocabularies = None
+
+    def fit(self, df):
+        '''
+        INPUT: df
+        OUTPUT: self
+        Learn each column's levels seen at least min_count times.
+        '''
+        self.vocabularies = {}
+        if self.n_hash is None:
+            for col in self.columns:
+                codes, levels = _factorize_text(df[col])
+                counts = pd.Series(np.bincount(codes[codes >= 0],\
+                    minlength=len(levels)), index=levels).groupby(level=0).sum()
+                self.vocabularies[col] = sorted(counts.index[counts >=\
+                    self.min_count])
+        return self
+
+    @property
+    def n_features(self):
+        if self.n_hash is not None:
+            return len(self.numeric) + self.n_hash
+        return len(self.numeric) + sum(len(self.vocabularies[col]) + 1\
+            for col in self.columns)
+
+    @property
+    def feature_names(self):
+        names = list(self.numeric)
+        if self.n_hash is not None:
+            return names + ['hash_%d' % i for i in range(self.n_hash)]
+        for col in self.columns:
+            names.append('%s=%s' % (col, OTHER))
+            names.extend('%s=%s' % (col, level) for level in\
+                self.vocabularies[col])
+        return names
+
+    def _column_indices(self, df):
+        '''
+        INPUT: df
+        OUTPUT: N x C int array, matrix column of each row's level per
+                categorical column
+        '''
+        indices = np.empty((len(df), len(self.columns)), dtype=np.int32)
+        offset = len(self.numeric)
+        for j, col in enumerate(self.columns):
+            codes, levels = _factorize_text(df[col])
+            # Missing values have code -1, which picks the last slot
+            if self.n_hash is not None:
+                slots = np.array([zlib.crc32(('%s=%s' % (col, level))\
+                    .encode('utf-8')) & 0xffffffff for level in\
+                    levels + [OTHER]], dtype=np.int64) % self.n_hash
+                indices[:, j] = offset + slots[codes]
+            else:
+                vocab = self.vocabularies[col]
+                slots = np.append(pd.Index(vocab, dtype=object)\
+                    .get_indexer(levels) + 1, 0)
+                indices[:, j] = offset + slots[codes]
+                offset += len(vocab) + 1
+        return indices
+
+    def transform(self, df):
+        '''
+        INPUT: df
+        OUTPUT: scipy.sparse CSR matrix, N x n_features
+        Every row has its numeric values plus a 1 in one slot per
+        categorical column.  Missing categorical values count as unseen.
+        '''
+        if self.vocabularies is None:
+            raise ValueError('CategoricalEncoder is not fit')
+        n, n_numeric = len(df), len(self.numeric)
+        nnz = n_numeric + len(self.columns)
+
+        indices = np.empty((n, nnz), dtype=np.int32)
+        data = np.ones((n, nnz))
+        indices[:, :n_numeric] = np.arange(n_numeric)
+        if n_numeric:
+            data[:, :n_numeric] = df[self.numeric].values.astype(float)
+        indices[:, n_numeric:] = self._column_indices(df)
+
+        # 32-bit row offsets unless the matrix is too large for them
+        index_dtype = np.int32 if n * nnz < 2**31 else np.int64
+        X = sparse.csr_matrix((data.ravel(), indices.ravel().astype(index_dtype, copy=False),\
+            np.arange(0, n * nnz + 1, nnz, dtype=index_dtype)),\
+            shape=(n, self.n_features))
+        # Hashed levels can collide within a row
+        X.sum_duplicates()
+        return X
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+def _factorize_text(series):
+    '''
+    INPUT: Series
+    OUTPUT: array of int codes (-1 for missing), list of str levels
+    Levels are compared as text, so that a street code read back as an
+    int still matches the one learned as a float.  Only the distinct
+    values are converted.
+    '''
+    codes, uniques = pd.factorize(series)
+    levels = ['%d' % v if isinstance(v, float) and v.is_integer() else str(v)\
+        for v in uniques]
+    return codes, levels
@@ -0,0 +1,166 @@
+import copy
+import time
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import stats
+from sklearn.base import clone
+import sklearn.metrics as skm
+
+N_FOLDS = 5
+RANDOM_STATE = 67
+
+# Confidence level of the intervals in the summary
+CI_LEVEL = 0.95
+
+# Data shared with the worker processes.  Handed to each worker once, by
+# the pool initializer, rather than with every task; forked workers get
+# it without copying, spawned ones (Windows, macOS) unpickle it once.
+_shared = {}
+
+def _share(X, y, folds):
+    '''
+    INPUT: dict of feature set name -> (encoder or None, data), array,
+           list of folds
+    OUTPUT: None
+    '''
+    _shared['X'] = X
+    _shared['y'] = y
+    _shared['folds'] = folds
+
+def make_folds(df, n_folds=N_FOLDS, time_col=None, random_state=RANDOM_STATE):
+    '''
+    INPUT: df, int, str or None, int
+    OUTPUT: list of (train positions, test positions)
+    Shuffled k-fold splits, or with time_col forward-chaining splits: the
+    rows are ordered by time and cut into n_folds + 1 blocks, and fold k
+    trains on blocks 0..k and tests on block k + 1, so no fold is scored
+    on work orders older than ones it was trained on.
+    '''
+    n = len(df)
+    if time_col is None:
+        order = np.random.RandomState(random_state).permutation(n)
+        blocks = np.array_split(order, n_folds)
+        return [(np.sort(np.concatenate(blocks[:k] + blocks[k+1:])),\
+            np.sort(blocks[k])) for k in range(n_folds)]
+
+    order = np.argsort(df[time_col].values, kind='mergesort')
+    blocks = np.array_split(order, n_folds + 1)
+    return [(np.sort(np.concatenate(blocks[:k+1])), np.sort(blocks[k+1]))\
+        for k in range(n_folds)]
+
+def _score_task(task):
+    '''
+    INPUT: (feature set name, estimator name, estimator, fold number)
+    OUTPUT: dict of fold results
+    Fit a fresh copy of the estimator (and of the feature set's encoder,
+    if it has one) on the fold's training rows and score its
+    probabilities on the test rows.
+    '''
+    set_name, est_name, estimator, fold = task
+    encoder, X = _shared['X'][set_name]
+    y = _shared['y']
+    train, test = _shared['folds'][fold]
+
+    if encoder is None:
+        X_train, X_test = X[train], X[test]
+    else:
+        # Levels are learnt from the training rows only
+        encoder = copy.deepcopy(encoder)
+        X_train = encoder.fit_transform(X.iloc[train])
+        X_test = encoder.transform(X.iloc[test])
+
+    model = clone(estimator)
+    start = time.time()
+    model.fit(X_train, y[train])
+    fit_s = time.time() - start
+
+    start = time.time()
+    proba = model.predict_proba(X_test)[:, 1]
+    predict_s = time.time() - start
+
+    y_test = y[test]
+    auc = skm.roc_auc_score(y_test, proba) if len(np.unique(y_test)) == 2\
+        else np.nan
+    return {'feature_set': set_name, 'estimator': est_name, 'fold': fold,\
+        'n_train': len(train), 'n_test': len(test), 'auc': auc,\
+        'accuracy': skm.accuracy_score(y_test, proba >= 0.5),\
+        'log_loss': skm.log_loss(y_test, proba, labels=[0, 1]),\
+        'fit_s': fit_s, 'predict_s': predict_s}
+
+def evaluate(df, feature_sets, estimators, target, folds, n_workers=None):
+    '''
+    INPUT: df, dict of name -> list of predictor columns or encoder, dict
+           of name -> unfitted estimator, str target column, list from
+           make_folds, int or None
+    OUTPUT: df with one row per feature set, estimator and fold
+    Score every estimator on every feature set over the same folds.  A
+    feature set given as an encoder (see encoding.py) is scored on the
+    sparse matrix it builds; a copy of it is fit in each fold on the
+    training rows alone, and the encoder passed in is left unfit.  The
+    (feature set, estimator, fold) fits run on n_workers processes (None
+    for one per core); estimators are then given n_jobs=1 so the pool is
+    not oversubscribed.
+    '''
+    n_workers = n_workers or multiprocessing.cpu_count()
+    X = dict((name, (cols, df[cols.numeric + cols.columns]) if\
+        hasattr(cols, 'fit_transform') else\
+        (None, df[cols].values.astype(float)))\
+        for name, cols in feature_sets.items())
+    y = df[target].values.astype(int)
+    _share(X, y, folds)
+
+    tasks = []
+    for set_name in feature_sets:
+        for est_name, estimator in estimators.items():
+            if n_workers > 1 and\
+                estimator.get_params().get('n_jobs') not in (None, 1):
+                estimator = clone(estimator).set_params(n_jobs=1)
+            for fold in range(len(folds)):
+                tasks.append((set_name, est_name, estimator, fold))
+
+    try:
+        if n_workers == 1:
+            results = [_score_task(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(n_workers, initializer=_share,\
+                initargs=(X, y, folds))
+            try:
+                results = pool.map(_score_task, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _shared.clear()
+
+    return pd.DataFrame(results, columns=['feature_set', 'estimator', 'fold',\
+        'n_train', 'n_test', 'auc', 'accuracy', 'log_loss', 'fit_s',\
+        'predict_s'])
+
+def summarize(results, level=CI_LEVEL):
+    '''
+    INPUT: df from evaluate, float
+    OUTPUT: df
+    Mean of each metric over folds per feature set and estimator, with a
+    t-interval on the fold AUCs, best AUC first.
+    '''
+    rows = []
+    for (set_name, est_name), group in results.groupby(['feature_set',\
+        'estimator'], sort=False):
+        aucs = group['auc'].dropna().values
+        half = np.nan
+        if len(aucs) > 1:
+            half = stats.t.ppf(0.5 + level / 2., len(aucs) - 1) *\
+                aucs.std(ddof=1) / np.sqrt(len(aucs))
+        rows.append(OrderedDict([('feature_set', set_name),\
+            ('estimator', est_name), ('folds', len(group)),\
+            ('auc', aucs.mean() if len(aucs) else np.nan),\
+            ('auc_ci_low', aucs.mean() - half if len(aucs) else np.nan),\
+            ('auc_ci_high', aucs.mean() + half if len(aucs) else np.nan),\
+            ('accuracy', group['accuracy'].mean()),\
+            ('log_loss', group['log_loss'].mean()),\
+            ('fit_s', group['fit_s'].mean()),\
+            ('predict_s', group['predict_s'].mean())]))
+    return pd.DataFrame(rows).sort_values('auc', ascending=False)\
+        .reset_index(drop=True)
@@ -2,14 +2,19 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from mpl_toolkits.basemap import Basemap
-from shapely.geometry import Point, Polygon, MultiPoint, MultiPolygon
+from shapely.geometry import Polygon, MultiPoint, MultiPolygon
 from shapely.prepared import prep
-import fiona
+from shapely.ops import transform
 from matplotlib.collections import PatchCollection
 from descartes import PolygonPatch
 from matplotlib.colors import BoundaryNorm
 from matplotlib.cm import ScalarMappable
 from pysal.esda.mapclassify import Natural_Breaks
+import storage
+from geometry_cache import load_shapefile
+
+# Columns the maps need from the modelling data
+MAP_COLUMNS = ['latitude','longitude','DURATION_td','Median_Home_Value']
 
 def custom_colorbar(cmap, ncolors, labels, **kwargs):    
     '''Create a custom, discretized colorbar with correctly formatted/aligned labels.
@@ -35,9 +40,8 @@ def prep_seattle_neighborhoods(df):
     Generate neighborhood basemap and city potholes for Seattle.
     '''
     shapefilename = 'data/Neighborhoods'
-    shp = fiona.open(shapefilename+'.shp')
-    coords = shp.bounds
-    shp.close()
+    table = load_shapefile(shapefilename)
+    coords = table.bounds
 
     w, h = coords[2] - coords[0], coords[3] - coords[1]
     extra = 0.01
@@ -53,19 +57,23 @@ def prep_seattle_neighborhoods(df):
         urcrnrlat=coords[3] + (extra * h),\
         resolution='i',  suppress_ticks=True)
 
-    _out = m.readshapefile(shapefilename, name='seattle',\
-        drawbounds=False, color='none', zorder=2)
+    # Neighborhood outlines in map coordinates from the geometry cache, one
+    # row per part of a multi-part neighborhood as readshapefile gave them.
+    # Holes are kept, so potholes inside one are not put in the hood.
+    polys, names = [], []
+    for hood, name in zip(table.geometries(), table.field('S_HOOD')):
+        parts = hood.geoms if hood.geom_type == 'MultiPolygon' else [hood]
+        for part in parts:
+            polys.append(transform(m, Polygon(part.exterior, part.interiors)))
+            names.append(name)
 
     # Set up a map dataframe
-    df_map = pd.DataFrame({
-        'poly': [Polygon(hood_points) for hood_points in m.seattle],
-        'name': [hood['S_HOOD'] for hood in m.seattle_info]
-        })
+    df_map = pd.DataFrame({'poly': polys, 'name': names})
 
-     # Convert latitude and longitude, into Basemap cartesian map coordinates
-    mapped_points = [Point(m(mapped_x, mapped_y)) for mapped_x, mapped_y in\
-        zip(df['longitude'], df['latitude'])]
-    all_points = MultiPoint(mapped_points)
+    # Convert latitude and longitude into Basemap cartesian map coordinates,
+    # all points in one call; the other maps reuse them
+    df['map_x'], df['map_y'] = m(df['longitude'].values, df['latitude'].values)
+    all_points = MultiPoint(list(zip(df['map_x'].values, df['map_y'].values)))
 
     # Use prep to optimize polygons for faster computation
     hood_polygons = prep(MultiPolygon(list(df_map['poly'].values)))
@@ -186,8 +194,8 @@ def bubble_map(df, df_map, m, h, w):
     sizes = 200
     color = [x*5 for x in df['DURATION_td'].tolist()]
 
-    # Convert our latitude and longitude into Basemap cartesian map coordinates
-    xcart, ycart = m(df['longitude'].tolist(), df['latitude'].tolist())
+    # Basemap cartesian map coordinates from prep_seattle_neighborhoods
+    xcart, ycart = df['map_x'].values, df['map_y'].values
 
     # m.scatter(xcart, ycart, s=sizes, marker='o',color='lime', alpha=0.5)
     m.scatter(xcart, ycart, s=sizes, marker='o',c=color, alpha=0.5)
@@ -218,8 +226,8 @@ def map_econ_value(df, df_map, m, h, w):
     sizes = 100
     color = [x*5 for x in df['Median_Home_Value'].tolist()]
 
-    # Convert our latitude and longitude into Basemap cartesian map coordinates
-    xcart, ycart = m(df['longitude'].tolist(), df['latitude'].tolist()) 
+    # Basemap cartesian map coordinates from prep_seattle_neighborhoods
+    xcart, ycart = df['map_x'].values, df['map_y'].values
 
     # m.scatter(xcart, ycart, s=sizes, marker='o',color='darkred', alpha=0.5)
     m.scatter(xcart, ycart, s=sizes, marker='o',c=color, alpha=0.5)
@@ -232,7 +240,7 @@ def map_econ_value(df, df_map, m, h, w):
     plt.show()
 
 def main():
-    df = pd.read_pickle('df_95_features.pkl')
+    df = storage.read_frame('features_95', columns=MAP_COLUMNS)
     df_map, m, h, w, coords, city_points = prep_seattle_neighborhoods(df)
     chlor_map(df, df_map, m, h, w, coords, city_points)
     hexbin_map(df, df_map, m, h, w, coords, city_points)
@@ -0,0 +1,202 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import shapely
+from shapely import wkb
+from shapely.geometry import shape
+from projection import project_geometry, projection_key
+
+# Parsed shapefiles, as a directory next to the .shp holding one
+# directory per coordinate system
+GEOMETRY_CACHE_SUFFIX = '.geom'
+
+# Shapefile parts whose contents decide the cache key
+SOURCE_EXTENSIONS = ['.shp', '.dbf']
+
+SHAPELY2 = int(shapely.__version__.split('.')[0]) >= 2
+
+_tables = {}
+
+class GeometryTable(object):
+    '''
+    The features of one shapefile: geometries as concatenated WKB with an
+    offset per feature, and one array per attribute field.  Loaded from
+    the cache the arrays are memory-mapped, so nothing is read until
+    used; geometries are decoded from WKB on request.
+    '''
+    def __init__(self, blob, offsets, fields, bounds):
+        self.blob = blob
+        self.offsets = offsets
+        self.fields = fields
+        self.bounds = tuple(bounds)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def wkb(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def geometries(self):
+        '''
+        INPUT: None
+        OUTPUT: list of shapely geometries, in shapefile order
+        '''
+        blobs = [self.wkb(i) for i in range(len(self))]
+        if SHAPELY2:
+            return list(shapely.from_wkb(blobs))
+        return [wkb.loads(blob) for blob in blobs]
+
+    def field(self, name):
+        '''
+        INPUT: str property name
+        OUTPUT: list of values, None where the shapefile has none
+        '''
+        values, missing = self.fields[name]
+        values = values.tolist()
+        if missing is not None:
+            for i in np.nonzero(missing)[0]:
+                values[i] = None
+        return values
+
+def _source_hash(shapefilename):
+    h = hashlib.sha1()
+    for ext in SOURCE_EXTENSIONS:
+        with open(shapefilename + ext, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def _source_stamp(shapefilename):
+    stats = [os.stat(shapefilename + ext) for ext in SOURCE_EXTENSIONS]
+    return [[stat.st_size, stat.st_mtime] for stat in stats]
+
+def _field_arrays(values, kind):
+    '''
+    INPUT: list of property values, fiona field type ('int', 'float',
+           'str', ...)
+    OUTPUT: values array, bool array of missing values or None
+    Numbers are stored as numbers (float when an int field has gaps),
+    everything else as fixed-width text, so every array can be mapped.
+    '''
+    missing = np.array([v is None for v in values], dtype=bool)
+    if kind in ('int', 'float'):
+        if kind == 'int' and not missing.any():
+            return np.array(values, dtype=np.int64), None
+        return np.array([np.nan if v is None else v for v in values],\
+            dtype=float), None
+    text = np.array([u'' if v is None else u'%s' % v for v in values])
+    if text.dtype.kind != 'U':
+        text = text.astype('U1')
+    return text, missing if missing.any() else None
+
+def _parse_shapefile(shapefilename, projected):
+    '''
+    INPUT: str path without the .shp extension, bool
+    OUTPUT: GeometryTable held in memory
+    '''
+    # Only needed on a cache miss, and slow to import
+    import fiona
+    with fiona.open(shapefilename + '.shp') as shp:
+        kinds = dict((name, kind.split(':')[0]) for name, kind in\
+            shp.schema['properties'].items())
+        features = list(shp)
+
+    geoms = [shape(feature['geometry']) for feature in features]
+    if projected:
+        geoms = [project_geometry(geom) for geom in geoms]
+    blobs = [geom.wkb for geom in geoms]
+    offsets = np.concatenate([[0], np.cumsum([len(blob) for blob in blobs])])\
+        .astype(np.int64)
+    blob = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+
+    fields = dict((name, _field_arrays([feature['properties'][name] for\
+        feature in features], kind)) for name, kind in kinds.items())
+    if geoms:
+        corners = np.array([geom.bounds for geom in geoms])
+        bounds = [corners[:, 0].min(), corners[:, 1].min(),\
+            corners[:, 2].max(), corners[:, 3].max()]
+    else:
+        bounds = [np.nan] * 4
+    return GeometryTable(blob, offsets, fields, bounds)
+
+def _write_cache(path, table, key, stamp, crs):
+    '''
+    Write to a scratch directory and rename it into place, so a crash
+    never leaves a half-written cache.
+    '''
+    scratch = path + '.tmp%d' % os.getpid()
+    if os.path.exists(scratch):
+        shutil.rmtree(scratch)
+    os.makedirs(scratch)
+    np.save(os.path.join(scratch, 'wkb.npy'), table.blob)
+    np.save(os.path.join(scratch, 'offsets.npy'), table.offsets)
+    fields = []
+    for i, (name, (values, missing)) in enumerate(sorted(table.fields.items())):
+        np.save(os.path.join(scratch, 'field%d.npy' % i), values)
+        if missing is not None:
+            np.save(os.path.join(scratch, 'field%d_missing.npy' % i), missing)
+        fields.append([name, missing is not None])
+    with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+        json.dump({'key': key, 'stamp': stamp, 'crs': crs, 'fields': fields,\
+            'bounds': list(table.bounds)}, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(scratch, path)
+
+def _read_meta(path):
+    filename = os.path.join(path, 'meta.json')
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+def _read_cache(path, meta):
+    load = lambda name: np.load(os.path.join(path, name), mmap_mode='r')
+    fields = {}
+    for i, (name, has_missing) in enumerate(meta['fields']):
+        fields[name] = (load('field%d.npy' % i),\
+            load('field%d_missing.npy' % i) if has_missing else None)
+    return GeometryTable(load('wkb.npy'), load('offsets.npy'), fields,\
+        meta['bounds'])
+
+def load_shapefile(shapefilename, projected=False):
+    '''
+    INPUT: str path without the .shp extension, bool
+    OUTPUT: GeometryTable
+    Every feature of a lon-lat shapefile, projected to metres (see
+    projection.py) if projected.  The shapefile is parsed once and
+    cached as memory-mapped arrays keyed by a hash of its .shp and .dbf,
+    and for projected geometry by the projection's parameters; later runs
+    reparse it only when either changes.  The hash is skipped while the
+    files' sizes and modification times are unchanged.  Tables are also
+    kept in memory for the rest of the run.
+    '''
+    path = os.path.join(shapefilename + GEOMETRY_CACHE_SUFFIX,\
+        'projected' if projected else 'lonlat')
+    stamp = _source_stamp(shapefilename)
+    crs = projection_key() if projected else None
+    memo_key = (shapefilename, crs)
+    if memo_key in _tables and _tables[memo_key][0] == stamp:
+        return _tables[memo_key][1]
+
+    meta = _read_meta(path)
+    if meta is not None and meta['stamp'] == stamp and meta.get('crs') == crs:
+        table = _read_cache(path, meta)
+    else:
+        key = _source_hash(shapefilename)
+        if crs is not None:
+            key = hashlib.sha1((key + crs).encode('utf-8')).hexdigest()
+        if meta is not None and meta['key'] == key:
+            table = _read_cache(path, meta)
+            meta['stamp'] = stamp
+            with open(os.path.join(path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+        else:
+            _write_cache(path, _parse_shapefile(shapefilename, projected),\
+                key, stamp, crs)
+            table = _read_cache(path, _read_meta(path))
+
+    _tables[memo_key] = (stamp, table)
+    return table
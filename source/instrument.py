@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import socket
+import cProfile
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Where runs are logged, one JSON line per measured step
+METRICS_DIR = 'metrics'
+
+# A step is flagged when its time grows by more than this fraction
+REGRESSION_THRESHOLD = 0.2
+
+# Steps shorter than this, in seconds, are too noisy to flag
+MIN_SECONDS = 1.
+
+# Environment variables: a run id shared by the scripts of one nightly run
+# (so they log to one file), and a directory that turns on profiling
+RUN_ID_ENV = 'POTHOLE_RUN_ID'
+PROFILE_ENV = 'POTHOLE_PROFILE_DIR'
+
+def _live_children_cpu():
+    '''
+    INPUT: None
+    OUTPUT: float
+    User plus system time of the child processes still running, such as
+    the workers of an open ParallelRunner pool.  Read through psutil if
+    installed, else from /proc on Linux; 0 where neither is available.
+    '''
+    if psutil is not None:
+        total = 0.
+        for child in psutil.Process().children(recursive=True):
+            try:
+                times = child.cpu_times()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            total += times.user + times.system
+        return total
+
+    pids = []
+    try:
+        for task in os.listdir('/proc/self/task'):
+            with open('/proc/self/task/%s/children' % task) as f:
+                pids.extend(f.read().split())
+    except (IOError, OSError):
+        return 0.
+    ticks = float(os.sysconf('SC_CLK_TCK'))
+    total = 0.
+    for pid in pids:
+        try:
+            with open('/proc/%s/stat' % pid) as f:
+                # utime and stime follow the parenthesised command name
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (IOError, OSError):
+            continue
+        total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+def _cpu_seconds():
+    '''
+    INPUT: None
+    OUTPUT: float
+    User plus system time of this process and its children, finished
+    (once waited for; Unix only) or still running.
+    '''
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3] + _live_children_cpu()
+
+def _reset_peak_rss():
+    '''
+    INPUT: None
+    OUTPUT: bool
+    Reset the kernel's peak RSS mark for this process so the next reading
+    covers only the step being measured.  Linux only; False elsewhere.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+def _peak_rss_mb():
+    '''
+    INPUT: None
+    OUTPUT: float
+    Peak resident memory of this process in MB: since the last reset on
+    Linux, since start elsewhere (NaN on Windows without psutil).
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except (IOError, OSError):
+        pass
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        scale = 1024. ** 2 if sys.platform == 'darwin' else 1024.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024. ** 2
+    return float('nan')
+
+class RunLog(object):
+    '''
+    Records wall time, CPU time, peak RSS and row counts of each step of a
+    run as JSON lines in filename.  With profile_dir set, each step is also
+    run under cProfile and its stats are dumped to
+    profile_dir/<run id>.<step>.prof, for viewing with pstats or snakeviz.
+    Both default to the POTHOLE_RUN_ID and POTHOLE_PROFILE_DIR variables.
+
+        log = RunLog()
+        with log.step('geocode', rows_in=len(df)) as record:
+            df = do_geocoding(geolocator)
+            record['rows_out'] = len(df)
+    '''
+    def __init__(self, filename=None, profile_dir=None, run_id=None):
+        self.run_id = run_id or os.environ.get(RUN_ID_ENV) or\
+            time.strftime('%Y%m%dT%H%M%S')
+        if profile_dir is None:
+            profile_dir = os.environ.get(PROFILE_ENV)
+        if filename is None:
+            filename = os.path.join(METRICS_DIR, self.run_id + '.jsonl')
+        # Absolute, so steps that change directory still log to the same place
+        self.filename = os.path.abspath(filename)
+        self.profile_dir = profile_dir and os.path.abspath(profile_dir)
+        for path in (os.path.dirname(filename), profile_dir):
+            if path and not os.path.exists(path):
+                os.makedirs(path)
+
+    @contextmanager
+    def step(self, name, rows_in=None):
+        record = {'run_id': self.run_id, 'host': socket.gethostname(),\
+            'step': name, 'rows_in': rows_in, 'rows_out': None}
+        peak_reset = _reset_peak_rss()
+        profiler = cProfile.Profile() if self.profile_dir else None
+
+        start_wall, start_cpu = time.time(), _cpu_seconds()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_s'] = time.time() - start_wall
+            record['cpu_s'] = _cpu_seconds() - start_cpu
+            record['peak_rss_mb'] = _peak_rss_mb()
+            record['peak_rss_is_step'] = peak_reset
+            record['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(self.profile_dir,\
+                    '%s.%s.prof' % (self.run_id, name)))
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+def read_run(filename):
+    '''
+    INPUT: str
+    OUTPUT: dict of step name -> record
+    The records of a run log.  A step logged more than once keeps its
+    totals (times summed, row counts and peak memory from the largest).
+    '''
+    steps = {}
+    with open(filename) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            name = record['step']
+            if name not in steps:
+                steps[name] = record
+                continue
+            total = steps[name]
+            for key in ('wall_s', 'cpu_s'):
+                total[key] += record[key]
+            for key in ('rows_in', 'rows_out', 'peak_rss_mb'):
+                values = [v for v in (total[key], record[key]) if v is not None]
+                total[key] = max(values) if values else None
+    return steps
+
+def _per_row(record):
+    if record.get('rows_in'):
+        return record['wall_s'] / record['rows_in']
+    return None
+
+def compare_runs(old, new, threshold=REGRESSION_THRESHOLD, min_seconds=MIN_SECONDS):
+    '''
+    INPUT: dict, dict from read_run, float, float
+    OUTPUT: list of (step, old wall, new wall, verdict)
+    Compare each step's time in two runs.  A step that slowed down by more
+    than threshold is put down to data growth when its time per input row
+    stayed within threshold, and flagged as a regression otherwise.
+    '''
+    rows = []
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            rows.append((name, old.get(name, {}).get('wall_s'),\
+                new.get(name, {}).get('wall_s'),\
+                'only in new run' if name in new else 'only in old run'))
+            continue
+        old_wall, new_wall = old[name]['wall_s'], new[name]['wall_s']
+        verdict = 'ok'
+        if new_wall > old_wall * (1 + threshold) and new_wall >= min_seconds:
+            old_rate, new_rate = _per_row(old[name]), _per_row(new[name])
+            if old_rate and new_rate and new_rate <= old_rate * (1 + threshold):
+                verdict = 'slower: data growth'
+            else:
+                verdict = 'REGRESSION'
+        elif new_wall < old_wall / (1 + threshold):
+            verdict = 'faster'
+        rows.append((name, old_wall, new_wall, verdict))
+    return rows
+
+def _fmt(seconds):
+    return '%10.2f' % seconds if seconds is not None else '%10s' % '-'
+
+def main(argv=None):
+    '''
+    Usage: python instrument.py OLD.jsonl NEW.jsonl [threshold]
+
+    Print each step's time in both runs and exit with status 1 if any
+    step regressed.
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (2, 3):
+        print(main.__doc__)
+        return 2
+    threshold = float(argv[2]) if len(argv) == 3 else REGRESSION_THRESHOLD
+    old, new = read_run(argv[0]), read_run(argv[1])
+
+    rows = compare_runs(old, new, threshold)
+    print('%-24s %10s %10s  %s' % ('step', 'old s', 'new s', 'verdict'))
+    for name, old_wall, new_wall, verdict in rows:
+        rows_note = ''
+        if name in old and name in new:
+            rows_note = '  (rows %s -> %s)' % (old[name]['rows_in'],\
+                new[name]['rows_in'])
+        print('%-24s %s %s  %s%s' % (name, _fmt(old_wall), _fmt(new_wall),\
+            verdict, rows_note))
+    return 1 if any(row[3] == 'REGRESSION' for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from projection import X_COL, Y_COL
+
+# Other potholes counted as neighbours: within NEIGHBOR_RADIUS metres,
+# reported in the WINDOW_DAYS before
+NEIGHBOR_RADIUS = 200.
+WINDOW_DAYS = 14
+
+def neighbor_pairs(xy, times, radius=NEIGHBOR_RADIUS, window_days=WINDOW_DAYS):
+    '''
+    INPUT: N x 2 array of metres, array of datetime64, float, int
+    OUTPUT: array of pothole positions, array of neighbour positions
+    Every pair (i, j) with j within radius of i and reported in the
+    window before i.  Reports are cut into window-long time buckets, so
+    a pothole's neighbours are all in its own bucket or the one before;
+    a KD-tree per bucket finds the pairs close in space, and only those
+    are checked in time.  The cost grows with N log N plus the number of
+    pairs, not N squared.
+    '''
+    t = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+    window = np.timedelta64(window_days, 'D').astype('timedelta64[ns]')\
+        .astype(np.int64)
+    valid = np.nonzero(np.isfinite(xy).all(axis=1) &\
+        ~np.isnat(t.view('datetime64[ns]')))[0]
+    buckets = (t[valid] - t[valid].min()) // window if len(valid) else valid
+
+    order = np.argsort(buckets, kind='mergesort')
+    valid, buckets = valid[order], buckets[order]
+    edges = np.nonzero(np.diff(buckets))[0] + 1
+    members = dict((buckets[group[0]], valid[group]) for group in\
+        np.split(np.arange(len(valid)), edges) if len(group))
+
+    pairs_i, pairs_j = [], []
+    trees = {}
+    for bucket in sorted(members):
+        rows = members[bucket]
+        trees[bucket] = cKDTree(xy[rows])
+        trees.pop(bucket - 2, None)
+        for earlier in (bucket - 1, bucket):
+            if earlier not in trees:
+                continue
+            found = trees[bucket].sparse_distance_matrix(trees[earlier],\
+                radius, output_type='ndarray')
+            i, j = rows[found['i']], members[earlier][found['j']]
+            before = (t[j] < t[i]) & (t[j] >= t[i] - window)
+            pairs_i.append(i[before])
+            pairs_j.append(j[before])
+
+    if not pairs_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+def neighbor_features(df, radius=NEIGHBOR_RADIUS, window_days=WINDOW_DAYS):
+    '''
+    INPUT: df with projected coordinates (see projection.py), float, int
+    OUTPUT: df with columns nearby_potholes and nearby_repair_days
+    For each pothole, the number of other potholes reported within radius
+    metres in the window_days before it, and the mean repair time in days
+    of those already repaired by then (NaN if none were), so the feature
+    uses nothing unknown when the pothole is reported.
+    '''
+    xy = np.column_stack([df[X_COL].values, df[Y_COL].values])
+    i, j = neighbor_pairs(xy, df['INITDT_dt'].values, radius, window_days)
+
+    n = len(df)
+    counts = np.bincount(i, minlength=n)
+    repaired = np.asarray(df['FLDENDDT_dt'].values, dtype='datetime64[ns]')[j]\
+        <= np.asarray(df['INITDT_dt'].values, dtype='datetime64[ns]')[i]
+    days = df['DURATION_td'].values.astype(float)
+    n_repaired = np.bincount(i[repaired], minlength=n)
+    total = np.bincount(i[repaired], weights=days[j[repaired]], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_days = np.where(n_repaired > 0, total / n_repaired, np.nan)
+
+    return pd.DataFrame({'nearby_potholes': counts,\
+        'nearby_repair_days': mean_days}, index=df.index)
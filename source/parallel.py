@@ -0,0 +1,107 @@
+import multiprocessing
+import pandas as pd
+
+# Most rows handed to a worker at once.  Frames are split into at least
+# TASKS_PER_WORKER chunks per worker so a slow chunk doesn't idle the rest.
+CHUNK_ROWS = 50000
+TASKS_PER_WORKER = 4
+
+# Loaded resources (spatial indexes, lookup tables) by loader, per process
+_resources = {}
+
+def _loader_key(loader):
+    return (loader.__module__, loader.__name__)
+
+def load_resources(loaders):
+    '''
+    INPUT: iterable of functions taking no arguments
+    OUTPUT: None
+    Call each loader not yet called in this process and keep its result.
+    Used as the worker initializer, so every worker loads each resource
+    once rather than receiving a pickled copy with every task.
+    '''
+    for loader in loaders:
+        key = _loader_key(loader)
+        if key not in _resources:
+            _resources[key] = loader()
+
+def _stage_kwargs(stage):
+    '''
+    INPUT: Stage
+    OUTPUT: dict of keyword argument -> loaded resource
+    '''
+    load_resources(stage.resources.values())
+    return dict((name, _resources[_loader_key(loader)])\
+        for name, loader in stage.resources.items())
+
+def _run_chunk(task):
+    '''
+    INPUT: (int, Stage, df)
+    OUTPUT: (int, df of the stage's outputs)
+    '''
+    i, stage, chunk = task
+    return i, stage.func(chunk, **_stage_kwargs(stage))[stage.outputs]
+
+class ParallelRunner(object):
+    '''
+    Runs row_local stages on a process pool.  The frame is cut into
+    contiguous row chunks, each chunk runs in a worker and the outputs are
+    put back together in chunk order, so results match a serial run
+    exactly.  Other stages run in this process.
+
+    Nothing is left for the workers to inherit: each chunk travels with
+    its task and each worker loads the stages' resources once, in the pool
+    initializer.  Where the pool forks (Linux) the resources, loaded here
+    before it starts, are inherited instead and the initializer finds
+    them already there; where it spawns (Windows, macOS) each worker loads
+    its own, and the script must start the pipeline under
+    if __name__ == '__main__'.  context picks the start method (a
+    multiprocessing context, e.g. get_context('spawn')); by default the
+    platform's.  Use as a context manager, or call close() when done.
+    '''
+    def __init__(self, stages=(), n_workers=None, chunk_rows=CHUNK_ROWS,\
+        context=None):
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.chunk_rows = chunk_rows
+        self.context = context or multiprocessing
+        self.loaders = []
+        for stage in stages:
+            for loader in stage.resources.values():
+                if loader not in self.loaders:
+                    self.loaders.append(loader)
+        self.pool = None
+
+    def _get_pool(self):
+        if self.pool is None:
+            load_resources(self.loaders)
+            self.pool = self.context.Pool(self.n_workers,\
+                initializer=load_resources, initargs=(self.loaders,))
+        return self.pool
+
+    def apply(self, stage, df):
+        '''
+        INPUT: Stage, df of the stage's inputs
+        OUTPUT: df of the stage's outputs, indexed like df
+        '''
+        chunk_rows = min(self.chunk_rows,\
+            -(-len(df) // (self.n_workers * TASKS_PER_WORKER)))
+        if not stage.row_local or self.n_workers == 1 or len(df) <= chunk_rows:
+            return stage.func(df, **_stage_kwargs(stage))[stage.outputs]
+
+        tasks = [(i, stage, df.iloc[start:start + chunk_rows])\
+            for i, start in enumerate(range(0, len(df), chunk_rows))]
+        results = sorted(self._get_pool().imap_unordered(_run_chunk, tasks),\
+            key=lambda result: result[0])
+        return pd.concat([out for _, out in results])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
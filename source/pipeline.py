@@ -0,0 +1,478 @@
+import os
+import re
+import sys
+import shutil
+import hashlib
+import types
+import cPickle as pickle
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'feature_cache'
+
+# A row_local stage's shard is folded into the next new shard once fewer
+# than this fraction of its rows are still in the frame
+MIN_LIVE_FRACTION = 0.5
+
+# Default width of a time-bucketed stage's buckets
+BUCKET_DAYS = 28
+
+_DAY_NS = 24 * 3600 * 10**9
+
+# Bucket of rows with no time
+_NO_TIME = np.iinfo(np.int64).min
+
+class Stage(object):
+    '''
+    One step of the feature pipeline.
+
+    func takes a dataframe holding the input columns and returns it with
+    the output columns added.  files are the external files it reads.  A
+    row_local stage computes each row from that row's inputs alone, so
+    its outputs can be cached row by row.  resources maps keyword
+    arguments of func to functions that load them (e.g. a spatial index),
+    so a ParallelRunner can load them once per worker.
+
+    A stage that is not row_local but looks only a bounded time back
+    declares it with time_column, the column of each row's time, and
+    lookback_days: a row's outputs depend only on rows whose time is at
+    most lookback_days before its own, or, with end_column (end times, or
+    durations from time_column), on rows still open by then.  Its rows are
+    cached in bucket_days-wide time buckets and a bucket is only rerun
+    when one of those rows changed.  Other stages are rerun on the whole
+    frame whenever any input changes.
+
+    Bump version to invalidate the cache for changes the fingerprint
+    cannot see, such as an upgraded library.
+    '''
+    def __init__(self, name, func, inputs, outputs, files=(), row_local=True,\
+        resources=None, time_column=None, end_column=None, lookback_days=0,\
+        bucket_days=BUCKET_DAYS, version=0):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.files = list(files)
+        self.row_local = row_local
+        self.resources = dict(resources or {})
+        self.time_column = time_column
+        self.end_column = end_column
+        self.lookback_days = lookback_days
+        self.bucket_days = bucket_days
+        self.version = version
+
+    def fingerprint(self):
+        '''
+        INPUT: None
+        OUTPUT: str
+        Hash of everything besides the input rows that decides the
+        outputs: the stage's declaration, its files, and the code of func
+        and its resource loaders (see _hash_function).
+        '''
+        h = hashlib.sha1()
+        h.update(repr((self.name, self.inputs, self.outputs, self.row_local,\
+            self.time_column, self.end_column, self.lookback_days,\
+            self.bucket_days, self.version)).encode('utf-8'))
+        for filename in self.files:
+            h.update(_file_hash(filename).encode('utf-8'))
+        for name in sorted(self.resources):
+            h.update(name.encode('utf-8'))
+            _hash_function(self.resources[name], h)
+        _hash_function(self.func, h)
+        return h.hexdigest()
+
+_file_hashes = {}
+
+def _file_hash(filename):
+    '''
+    INPUT: str
+    OUTPUT: str
+    Content hash of a file, remembered per (path, size, mtime).
+    '''
+    stat = os.stat(filename)
+    memo_key = (filename, stat.st_size, stat.st_mtime)
+    if memo_key not in _file_hashes:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _file_hashes[memo_key] = h.hexdigest()
+    return _file_hashes[memo_key]
+
+# Values of these types are hashed by value when a stage's code uses them
+_DATA_TYPES = (int, long, float, complex, bool, str, unicode, type(None),\
+    tuple, list, dict, set, frozenset, np.generic)
+
+def _stable_repr(value):
+    '''
+    INPUT: object
+    OUTPUT: str
+    repr of plain data that is the same from run to run; anything else is
+    represented by its type alone, as its repr may hold an address.
+    '''
+    if isinstance(value, (tuple, list)):
+        return '%s(%s)' % (type(value).__name__,\
+            ','.join(_stable_repr(v) for v in value))
+    if isinstance(value, OrderedDict):
+        return 'OrderedDict(%s)' % ','.join('%s:%s' % (_stable_repr(k),\
+            _stable_repr(v)) for k, v in value.items())
+    if isinstance(value, dict):
+        return '{%s}' % ','.join(sorted('%s:%s' % (_stable_repr(k),\
+            _stable_repr(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return '{%s}' % ','.join(sorted(_stable_repr(v) for v in value))
+    if isinstance(value, types.CodeType):
+        return _stable_repr((value.co_code, value.co_consts, value.co_names))
+    if isinstance(value, _DATA_TYPES):
+        return repr(value)
+    return '<%s>' % type(value).__name__
+
+def _code_names(code):
+    '''
+    INPUT: code object
+    OUTPUT: set of global and attribute names used, nested code included
+    '''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+def _module_file(obj):
+    '''
+    INPUT: module, function or class
+    OUTPUT: str path of the .py file defining it, or None
+    '''
+    module = obj if isinstance(obj, types.ModuleType) else\
+        sys.modules.get(getattr(obj, '__module__', None))
+    filename = getattr(module, '__file__', None)
+    if filename is None:
+        return None
+    filename = os.path.abspath(filename)
+    return filename[:-1] if filename.endswith('.pyc') else filename
+
+def _module_closure(filename, found):
+    '''
+    INPUT: str path of a module, set of paths found so far
+    OUTPUT: None
+    Add the module and every module it imports from its own directory,
+    transitively, to found.
+    '''
+    if filename in found:
+        return
+    found.add(filename)
+    with open(filename) as f:
+        source = f.read()
+    directory = os.path.dirname(filename)
+    for line in re.findall(r'^\s*(?:from\s+(\w+)\s+import|import\s+([\w, ]+))',\
+        source, re.M):
+        for name in re.findall(r'\w+', line[0] or line[1]):
+            path = os.path.join(directory, name + '.py')
+            if os.path.exists(path):
+                _module_closure(path, found)
+
+def _hash_function(func, h, seen=None):
+    '''
+    INPUT: function, hashlib object, set or None
+    OUTPUT: None
+    Feed h everything about func that decides what it computes: its
+    bytecode and constants, its defaults, the plain-data globals it reads
+    (e.g. LANDMARKS), and the functions it calls.  Functions from its own
+    module are followed into their code; anything else it uses from a
+    module in the same directory (spatial_index, projection, ...) brings
+    in the source of that module and of the modules it imports.  Library
+    modules are not hashed.
+    '''
+    if seen is None:
+        seen = set()
+    if func in seen:
+        return
+    seen.add(func)
+
+    code = func.__code__
+    h.update(_stable_repr((code.co_code, code.co_consts, code.co_names,\
+        func.__defaults__, getattr(func, '__kwdefaults__', None))).encode('utf-8'))
+
+    home = _module_file(func)
+    directory = os.path.dirname(home) if home else None
+    modules = set()
+    for name in sorted(_code_names(code)):
+        if name not in func.__globals__:
+            continue
+        value = func.__globals__[name]
+        if isinstance(value, (types.FunctionType, types.ModuleType, type)):
+            filename = _module_file(value)
+            if filename is None or os.path.dirname(filename) != directory:
+                continue
+            if isinstance(value, types.FunctionType) and filename == home:
+                _hash_function(value, h, seen)
+            else:
+                _module_closure(filename, modules)
+        elif isinstance(value, _DATA_TYPES):
+            h.update(('%s=%s' % (name, _stable_repr(value))).encode('utf-8'))
+    for filename in sorted(modules):
+        h.update(_file_hash(filename).encode('utf-8'))
+
+def _row_hashes(df, columns):
+    '''
+    INPUT: df, list of column names
+    OUTPUT: uint64 numpy array
+    One content hash per row of the given columns.
+    '''
+    return pd.util.hash_pandas_object(df[columns], index=False).values
+
+def _stage_dir(stage, cache_dir):
+    '''
+    INPUT: Stage, str
+    OUTPUT: str
+    The stage's cache directory, emptied first if it was made by
+    different code or files.  It holds the fingerprint and one pickled
+    shard of outputs, indexed by row hash, per file.
+    '''
+    directory = os.path.join(cache_dir, stage.name)
+    meta = os.path.join(directory, 'fingerprint')
+    fingerprint = stage.fingerprint()
+    if os.path.exists(meta):
+        with open(meta) as f:
+            if f.read() == fingerprint:
+                return directory
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    with open(meta, 'w') as f:
+        f.write(fingerprint)
+    return directory
+
+def _shard_names(directory):
+    return [name[:-4] for name in os.listdir(directory) if name.endswith('.pkl')]
+
+def _read_shard(directory, name):
+    with open(os.path.join(directory, name + '.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+def _write_shard(directory, name, outputs):
+    '''
+    INPUT: str, str, df
+    OUTPUT: None
+    Written under a temporary name and renamed, so a crash never leaves
+    a partial shard behind.
+    '''
+    filename = os.path.join(directory, name + '.pkl')
+    with open(filename + '.tmp', 'wb') as f:
+        pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(filename):
+        os.remove(filename)
+    os.rename(filename + '.tmp', filename)
+
+def _remove_shard(directory, name):
+    os.remove(os.path.join(directory, name + '.pkl'))
+
+def _compute(df, stage, rows, row_hashes, runner):
+    '''
+    INPUT: df, Stage, bool array of rows to pass, uint64 array, runner
+    OUTPUT: df of the stage's outputs for those rows, indexed by row hash
+    '''
+    inputs = df.loc[rows, stage.inputs].copy()
+    if runner is None:
+        computed = stage.func(inputs)
+    else:
+        computed = runner.apply(stage, inputs)
+    computed = computed.loc[df.index[rows], stage.outputs]
+    computed.index = row_hashes[rows]
+    return computed
+
+def _run_row_local(df, stage, directory, row_hashes, runner):
+    '''
+    INPUT: df, Stage, str, uint64 array, ParallelRunner or None
+    OUTPUT: df of outputs indexed by row hash
+    Rows not in any shard are computed and written as one new shard.
+    Shards whose rows have all left the frame are deleted, and those
+    mostly gone are folded into the new shard, so the cache stays close
+    to the size of the frame without rewriting it every run.
+    '''
+    live = pd.Index(row_hashes)
+    kept, fold = [], []
+    for name in _shard_names(directory):
+        shard = _read_shard(directory, name)
+        still = shard.index.isin(live)
+        if still.all():
+            kept.append(shard)
+        else:
+            if still.mean() >= MIN_LIVE_FRACTION:
+                kept.append(shard[still])
+                continue
+            fold.append(shard[still])
+            _remove_shard(directory, name)
+
+    cached = pd.concat(kept + fold) if kept or fold else\
+        pd.DataFrame(columns=stage.outputs)
+    todo = ~live.isin(cached.index)
+    new = fold
+    if todo.any():
+        new = new + [_compute(df, stage, todo, row_hashes, runner)]
+    if new:
+        shard = pd.concat(new)
+        shard = shard[~shard.index.duplicated()]
+        if len(shard):
+            _write_shard(directory, hashlib.sha1(\
+                np.sort(shard.index.values).tobytes()).hexdigest(), shard)
+        cached = pd.concat(kept + [shard])
+    return cached
+
+def _time_buckets(df, stage, row_hashes):
+    '''
+    INPUT: df, Stage, uint64 array
+    OUTPUT: int array of each row's bucket, dict of bucket -> key,
+            int array of rows and int array of buckets they are context for
+    Rows are put in bucket_days-wide buckets of their time, counted from
+    the epoch so they do not move when earlier rows are added; rows with
+    no time make up bucket _NO_TIME, which is its own context.  The context of a bucket is every row its
+    rows may depend on: those with a time before the bucket's end and
+    still open (or, without end_column, reported) within lookback_days
+    of its start.  A bucket's key hashes the row hashes of its context,
+    which its own rows are part of, so the key changes exactly when its
+    outputs may.
+    '''
+    n = len(df)
+    if stage.time_column is None:
+        # No declared window: the whole frame is one bucket
+        buckets = np.zeros(n, dtype=np.int64)
+        nat = np.zeros(n, dtype=bool)
+        last = buckets
+    else:
+        t = np.asarray(df[stage.time_column].values, dtype='datetime64[ns]')
+        nat = np.isnat(t)
+        t = t.astype(np.int64)
+        width = stage.bucket_days * _DAY_NS
+        buckets = t // width
+        if stage.end_column is None:
+            end = t
+        else:
+            values = df[stage.end_column].values
+            if np.issubdtype(values.dtype, np.timedelta64):
+                end_dt = t.view('datetime64[ns]') +\
+                    np.asarray(values, dtype='timedelta64[ns]')
+            else:
+                end_dt = np.asarray(values, dtype='datetime64[ns]')
+            end = end_dt.astype(np.int64)
+            # Still open: context for every bucket after its own
+            end[np.isnat(end_dt)] = np.iinfo(np.int64).max - width
+        top = buckets[~nat].max() if (~nat).any() else 0
+        last = (np.minimum(end, top * width) + stage.lookback_days * _DAY_NS)\
+            // width
+        last = np.clip(last, buckets, top)
+
+    # Expand each dated row into the buckets it is context for
+    rows = np.nonzero(~nat)[0]
+    spans = (last[rows] - buckets[rows] + 1)
+    context_rows = np.repeat(rows, spans)
+    context_buckets = np.repeat(buckets[rows], spans) + np.arange(spans.sum()) -\
+        np.repeat(np.cumsum(spans) - spans, spans)
+
+    # Only buckets that hold rows of their own are computed
+    own = np.unique(buckets[rows])
+    keep = np.isin(context_buckets, own)
+    context_rows, context_buckets = context_rows[keep], context_buckets[keep]
+
+    order = np.lexsort((row_hashes[context_rows], context_buckets))
+    context_rows, context_buckets = context_rows[order], context_buckets[order]
+    edges = np.nonzero(np.diff(context_buckets))[0] + 1
+    keys = {}
+    for group in np.split(np.arange(len(context_rows)), edges):
+        if len(group):
+            bucket = context_buckets[group[0]]
+            keys[bucket] = hashlib.sha1(str(bucket).encode('utf-8') + b'|' +\
+                row_hashes[context_rows[group]].tobytes()).hexdigest()
+    if nat.any():
+        keys[_NO_TIME] = hashlib.sha1(b'NaT|' +\
+            np.sort(row_hashes[nat]).tobytes()).hexdigest()
+
+    buckets = buckets.copy()
+    buckets[nat] = _NO_TIME
+    return buckets, keys, context_rows, context_buckets
+
+def _run_bucketed(df, stage, directory, row_hashes, runner):
+    '''
+    INPUT: df, Stage, str, uint64 array, ParallelRunner or None
+    OUTPUT: df of outputs indexed by row hash
+    Buckets whose key has a shard are read from it.  The rest are
+    computed together, in one call on their rows and their context, and
+    each written to a shard of its own.  Shards of keys no longer in the
+    frame are deleted.
+    '''
+    row_buckets, keys, context_rows, context_buckets =\
+        _time_buckets(df, stage, row_hashes)
+    names = set(_shard_names(directory))
+    wanted = set(keys.values())
+    for name in names - wanted:
+        _remove_shard(directory, name)
+
+    outputs = [_read_shard(directory, key) for key in keys.values()\
+        if key in names]
+    stale = np.array([bucket for bucket, key in keys.items()\
+        if key not in names], dtype=np.int64)
+    if len(stale):
+        rows = np.isin(row_buckets, stale)
+        rows[context_rows[np.isin(context_buckets, stale)]] = True
+        computed = _compute(df, stage, rows, row_hashes, runner)
+
+        # Keep each stale bucket's own rows, dropping the context
+        targets = row_buckets[rows]
+        mine = np.isin(targets, stale)
+        computed, targets = computed[mine], targets[mine]
+        order = np.argsort(targets, kind='mergesort')
+        computed, targets = computed.iloc[order], targets[order]
+        edges = np.nonzero(np.diff(targets))[0] + 1
+        for group in np.split(np.arange(len(targets)), edges):
+            shard = computed.iloc[group]
+            shard = shard[~shard.index.duplicated()]
+            _write_shard(directory, keys[targets[group[0]]], shard)
+            outputs.append(shard)
+
+    if not outputs:
+        return pd.DataFrame(columns=stage.outputs)
+    return pd.concat(outputs)
+
+def run_stage(df, stage, cache_dir=CACHE_DIR, runner=None):
+    '''
+    INPUT: df, Stage, str, ParallelRunner or None
+    OUTPUT: df
+    Add the stage's outputs to df, computing only what the cache lacks:
+    the rows with unseen inputs for a row_local stage, the time buckets
+    with changed rows or context for a time-bucketed one (everything for
+    other stages when any input row changed).  The work is done by runner
+    if given, otherwise in this process.
+    '''
+    directory = _stage_dir(stage, cache_dir)
+    row_hashes = _row_hashes(df, stage.inputs)
+    if stage.row_local:
+        outputs = _run_row_local(df, stage, directory, row_hashes, runner)
+    else:
+        outputs = _run_bucketed(df, stage, directory, row_hashes, runner)
+    outputs = outputs[~outputs.index.duplicated()]
+
+    for name in stage.outputs:
+        df[name] = outputs[name].reindex(row_hashes).values
+
+    return df
+
+def run_pipeline(df, stages, cache_dir=CACHE_DIR, runner=None, log=None):
+    '''
+    INPUT: df, list of Stages, str, ParallelRunner or None, RunLog or None
+    OUTPUT: df
+    Run the stages in order.  Each stage may use columns produced by the
+    stages before it.  Each stage is recorded in log, if given.
+    '''
+    for stage in stages:
+        missing = [col for col in stage.inputs if col not in df]
+        if missing:
+            raise ValueError('Stage %s is missing input columns %s' %\
+                (stage.name, missing))
+        if log is None:
+            df = run_stage(df, stage, cache_dir, runner)
+            continue
+        with log.step(stage.name, rows_in=len(df)) as record:
+            df = run_stage(df, stage, cache_dir, runner)
+            record['rows_out'] = len(df)
+    return df
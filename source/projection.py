@@ -0,0 +1,114 @@
+import math
+import numpy as np
+from shapely.ops import transform
+
+# Every geometry stage works in NAD83 / Washington North (EPSG:32148),
+# a Lambert conformal conic in metres: distances and buffers are then
+# plain Euclidean and thresholds can be given in metres.  NAD83 and the
+# WGS84 lat-lons of the geocoder differ by about a metre here, which is
+# ignored.
+CRS = 'EPSG:32148'
+
+# Projected coordinate columns added to the pothole frame
+X_COL = 'x_m'
+Y_COL = 'y_m'
+
+# GRS80 ellipsoid
+_A = 6378137.
+_F = 1 / 298.257222101
+_E = math.sqrt(_F * (2 - _F))
+
+# Standard parallels, origin and false easting of the zone
+_LAT_1 = math.radians(48 + 44 / 60.)
+_LAT_2 = math.radians(47 + 30 / 60.)
+_LAT_0 = math.radians(47.)
+_LON_0 = math.radians(-(120 + 50 / 60.))
+_X_0 = 500000.
+_Y_0 = 0.
+
+def _m(lat):
+    return np.cos(lat) / np.sqrt(1 - (_E * np.sin(lat)) ** 2)
+
+def _t(lat):
+    e_sin = _E * np.sin(lat)
+    return np.tan(math.pi / 4 - lat / 2) /\
+        ((1 - e_sin) / (1 + e_sin)) ** (_E / 2)
+
+_N = (math.log(_m(_LAT_1)) - math.log(_m(_LAT_2))) /\
+    (math.log(_t(_LAT_1)) - math.log(_t(_LAT_2)))
+_AF = _A * _m(_LAT_1) / (_N * _t(_LAT_1) ** _N)
+_RHO_0 = _AF * _t(_LAT_0) ** _N
+
+def projection_key():
+    '''
+    INPUT: None
+    OUTPUT: str
+    The CRS and every parameter of the projection, to key data projected
+    with it (see geometry_cache.py).
+    '''
+    return repr((CRS, _A, _F, _LAT_1, _LAT_2, _LAT_0, _LON_0, _X_0, _Y_0))
+
+def project(lons, lats):
+    '''
+    INPUT: array of lons, array of lats
+    OUTPUT: array of x, array of y in metres
+    Forward projection of whole arrays at once; NaN stays NaN.
+    '''
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    rho = _AF * _t(lats) ** _N
+    theta = _N * (lons - _LON_0)
+    return _X_0 + rho * np.sin(theta), _Y_0 + _RHO_0 - rho * np.cos(theta)
+
+def project_point(lon, lat):
+    '''
+    INPUT: float, float
+    OUTPUT: float x, float y in metres
+    project for a single point, in plain Python.
+    '''
+    lat, lon = math.radians(lat), math.radians(lon)
+    e_sin = _E * math.sin(lat)
+    t = math.tan(math.pi / 4 - lat / 2) / ((1 - e_sin) / (1 + e_sin)) ** (_E / 2)
+    rho = _AF * t ** _N
+    theta = _N * (lon - _LON_0)
+    return _X_0 + rho * math.sin(theta), _Y_0 + _RHO_0 - rho * math.cos(theta)
+
+def unproject(xs, ys, tol=1e-12, max_iter=15):
+    '''
+    INPUT: array of x, array of y in metres, float, int
+    OUTPUT: array of lons, array of lats
+    Inverse of project; latitude is found by fixed-point iteration.
+    '''
+    dx = np.asarray(xs, dtype=float) - _X_0
+    dy = _RHO_0 - (np.asarray(ys, dtype=float) - _Y_0)
+    rho = np.sqrt(dx ** 2 + dy ** 2)
+    t = (rho / _AF) ** (1 / _N)
+    lons = np.arctan2(dx, dy) / _N + _LON_0
+
+    lats = math.pi / 2 - 2 * np.arctan(t)
+    for _ in range(max_iter):
+        e_sin = _E * np.sin(lats)
+        new = math.pi / 2 - 2 * np.arctan(t * ((1 - e_sin) / (1 + e_sin)) ** (_E / 2))
+        done = np.nanmax(np.abs(new - lats)) < tol if np.size(new) else True
+        lats = new
+        if done:
+            break
+    return np.degrees(lons), np.degrees(lats)
+
+def project_geometry(geom):
+    '''
+    INPUT: shapely geometry in lon-lat
+    OUTPUT: shapely geometry in metres
+    Each coordinate sequence is projected as one array.
+    '''
+    return transform(project, geom)
+
+def add_projected_coords(df):
+    '''
+    INPUT: df with longitude and latitude
+    OUTPUT: df
+    Add X_COL and Y_COL, the potholes in metres, for every later spatial
+    stage to use instead of projecting again.
+    '''
+    df[X_COL], df[Y_COL] = project(df['longitude'].values, df['latitude'].values)
+    return df
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+import build_models
+
+# The original implementations that were replaced, kept as references for
+# the tests and as baselines for benchmark.py
+
+def brute_force_nearest(lines, lons, lats):
+    '''
+    INPUT: list of LineStrings, array of lons, array of lats
+    OUTPUT: int array of line positions
+    The original get_closest_distance_features search: measure every
+    pothole against every segment.
+    '''
+    nearest = []
+    for lon, lat in zip(lons, lats):
+        point = Point(lon, lat)
+        smallest_dist = np.inf
+        smallest_street = -1
+        for street in range(len(lines)):
+            dist = point.distance(lines[street])
+            if dist < smallest_dist:
+                smallest_dist = dist
+                smallest_street = street
+        nearest.append(smallest_street)
+    return np.array(nearest)
+
+def legacy_cumul_potholes(df):
+    '''
+    INPUT: df
+    OUTPUT: df
+    The original get_pothole_count double loop, kept as the reference for
+    cumul_potholes: for each init date, count the work orders started on
+    or before it whose date-only init + DURATION is still after it.
+    '''
+    df = df.copy()
+    df['INITDT_date_only'] = pd.to_datetime(df['INITDT_dt'].apply(\
+        lambda x: x.date()))
+    df_number_potholes = pd.DataFrame(df.groupby('INITDT_date_only')\
+        ['OBJECTID'].count()).reset_index()
+
+    cum_potholes = []
+    for date_item in range(df_number_potholes.shape[0]):
+        total = 0
+        for each_item in df.index.tolist():
+            if (df.loc[each_item, 'INITDT_date_only'] + df.loc[each_item, 'DURATION']\
+            > df_number_potholes.loc[date_item, 'INITDT_date_only'])\
+            and (df_number_potholes.loc[date_item, 'INITDT_date_only']\
+            >= df.loc[each_item, 'INITDT_date_only']):
+                total += 1
+        cum_potholes.append(total)
+
+    df_number_potholes['cumul_potholes'] = cum_potholes
+    return df_number_potholes
+
+def legacy_calendar_features(df):
+    '''
+    INPUT: df
+    OUTPUT: df
+    The original create_seasonality and create_weekday loops, kept as the
+    reference for create_calendar_features.
+    '''
+    df = df.copy()
+    rows = df.index.tolist()
+    df['INIT_Quarter'] = [df.loc[row, 'INITDT_dt'].quarter for row in rows]
+    df['months_end_FY'] = [6 - df.loc[row, 'INITDT_dt'].month for row in rows]
+    df['INIT_month'] = [df.loc[row, 'INITDT_dt'].month for row in rows]
+
+    dayofwk = [df.loc[row, 'INITDT_dt'].weekday() for row in rows]
+    df['dayofwk'] = dayofwk
+    df['b_weekend?'] = df['dayofwk'] > 5
+    df['days_from_wknd'] = [6-x if x != 6 or x != 7 else 0 for x in dayofwk]
+    df['wkdy_or_wknd'] = ['weekday' if elem in range(0,6,1) else 'weekend'\
+        for elem in dayofwk]
+    return df
+
+def legacy_dummies(df, columns):
+    '''
+    INPUT: df, list of categorical columns
+    OUTPUT: df
+    The base predictors joined by dense indicator frames, one
+    pd.get_dummies per column, as select_predictors used to build them.
+    '''
+    return pd.concat([df[build_models.BASE_PREDICTORS]] +\
+        [pd.get_dummies(df[col]) for col in columns], axis=1)
+
+def legacy_clean_count(filename):
+    '''
+    INPUT: str
+    OUTPUT: int
+    Rows kept by the original whole-file clean_data: inferred datetime
+    parsing and the same COMPLETED / date-order / zero-duration filters.
+    '''
+    df = pd.read_csv(filename)
+    df['INITDT_dt'] = pd.to_datetime(df['INITDT'])
+    df['FLDENDDT_dt'] = pd.to_datetime(df['FLDENDDT'])
+    df = df[df['WO_STATUS'] == 'COMPLETED']
+    df = df[df['INITDT_dt'] < df['FLDENDDT_dt']]
+    df = df[(df['FLDENDDT_dt'] - df['INITDT_dt']) != pd.Timedelta(0)]
+    return len(df)
@@ -0,0 +1,168 @@
+import re
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Text columns with at most this many distinct values per row are stored
+# as categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+# Floats are narrowed to float32 when no value moves by more than this
+# fraction of itself
+FLOAT_RTOL = 1e-6
+
+# Kept at full precision: geocodes are joined against shapes again later
+KEEP_FLOAT64 = ['latitude', 'longitude']
+
+# Columns that are a function of others, in an order they can be rebuilt
+# in.  compact_frame drops one only when it matches its derivation.
+DERIVED_COLUMNS = OrderedDict([
+    ('DURATION', (['FLDENDDT_dt', 'INITDT_dt'],\
+        lambda df: df['FLDENDDT_dt'] - df['INITDT_dt'])),
+    ('DURATION_td', (['DURATION'],\
+        lambda df: np.floor(df['DURATION'] / np.timedelta64(1, 'D')))),
+    ('INITDT_date_only', (['INITDT_dt'],\
+        lambda df: df['INITDT_dt'].dt.normalize())),
+    ('wkdy_or_wknd', (['b_weekend?'],\
+        lambda df: pd.Series(np.where(df['b_weekend?'], 'weekend', 'weekday'),\
+            index=df.index))),
+    ])
+
+def _same(a, b):
+    '''
+    INPUT: Series, Series
+    OUTPUT: bool
+    Equal values, missing in the same rows.
+    '''
+    if len(a) != len(b):
+        return False
+    a, b = a.values, np.asarray(b)
+    missing = pd.isnull(a)
+    if not np.array_equal(missing, pd.isnull(b)):
+        return False
+    return bool((a[~missing] == b[~missing]).all())
+
+def _narrow(series):
+    '''
+    INPUT: Series
+    OUTPUT: Series, str describing the change or None
+    The series in the smallest dtype that holds its values.
+    '''
+    dtype = series.dtype
+    if dtype == object or str(dtype) in ('str', 'string'):
+        levels = series.dropna().unique()
+        if len(levels) and all(isinstance(v, (bool, np.bool_)) for v in levels):
+            if series.notnull().all():
+                return series.astype(bool), 'bool'
+            return series, None
+        if all(isinstance(v, basestring) for v in levels) and\
+            len(levels) <= MAX_CATEGORY_RATIO * len(series):
+            return series.astype('category'), 'category'
+        return series, None
+
+    if dtype.kind in 'iu':
+        narrowed = pd.to_numeric(series, downcast='unsigned' if\
+            series.min() >= 0 else 'integer')
+        return narrowed, 'int' if narrowed.dtype != dtype else None
+
+    if dtype.kind == 'f':
+        values = series.values
+        finite = values[np.isfinite(values)]
+        if len(finite) == len(values) and (finite == np.round(finite)).all():
+            narrowed, _ = _narrow(series.astype(np.int64))
+            return narrowed, 'int'
+        if series.name in KEEP_FLOAT64 or dtype == np.float32:
+            return series, None
+        narrowed = series.astype(np.float32)
+        error = np.abs(narrowed.values.astype(np.float64) - values)
+        if (error[np.isfinite(values)] <= FLOAT_RTOL *\
+            np.abs(finite)).all():
+            return narrowed, 'float32'
+        return series, None
+
+    return series, None
+
+def compact_frame(df, drop_derived=True):
+    '''
+    INPUT: df, bool
+    OUTPUT: df, df report with one row per column
+    Enforce a compact schema: integer-valued numbers become the smallest
+    integer type, other floats float32 unless that loses precision,
+    columns of Python bools become bool, repetitive text becomes
+    categorical and, with drop_derived, columns in DERIVED_COLUMNS that
+    equal their derivation are dropped (restore_derived rebuilds them).
+    The report gives each column's dtype and bytes before and after.
+    '''
+    drop = []
+    if drop_derived:
+        for col, (sources, derive) in DERIVED_COLUMNS.items():
+            if col in df and all(src in df for src in sources) and\
+                _same(df[col], derive(df)):
+                drop.append(col)
+
+    rows = []
+    out = OrderedDict()
+    for col in df.columns:
+        before = int(df[col].memory_usage(index=False, deep=True))
+        if col in drop:
+            action, series = 'dropped (derived)', None
+        else:
+            series, action = _narrow(df[col])
+            out[col] = series
+        rows.append(OrderedDict([('column', col),\
+            ('dtype_before', str(df[col].dtype)),\
+            ('dtype_after', str(series.dtype) if series is not None else ''),\
+            ('action', action or ''), ('bytes_before', before),\
+            ('bytes_after', int(series.memory_usage(index=False, deep=True))\
+                if series is not None else 0)]))
+
+    report = pd.DataFrame(rows)
+    report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+    compact = pd.DataFrame(out, index=df.index)
+    return compact, report.sort_values('bytes_saved', ascending=False)\
+        .reset_index(drop=True)
+
+def restore_derived(df):
+    '''
+    INPUT: df
+    OUTPUT: df
+    Add back the derived columns compact_frame dropped, wherever their
+    sources are present.
+    '''
+    for col, (sources, derive) in DERIVED_COLUMNS.items():
+        if col not in df and all(src in df for src in sources):
+            df[col] = derive(df)
+    return df
+
+def record_type(name, columns):
+    '''
+    INPUT: str, list of column names
+    OUTPUT: class
+    A record class with one slot per column, for code that walks a frame
+    row by row.  Slots take a fraction of the memory of a dict per row
+    and attribute access is as fast as on any object.  Column names that
+    are not identifiers (b_weekend?) have the offending characters
+    replaced by '_'.
+    '''
+    fields = tuple(re.sub(r'\W', '_', col) for col in columns)
+
+    def __init__(self, *values):
+        for field, value in zip(fields, values):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return '%s(%s)' % (name, ', '.join('%s=%r' % (field,\
+            getattr(self, field)) for field in fields))
+
+    return type(name, (object,), {'__slots__': fields, '__init__': __init__,\
+        '__repr__': __repr__})
+
+def iter_records(df, columns=None, name='WorkOrder'):
+    '''
+    INPUT: df, list or None, str
+    OUTPUT: generator of records, one per row
+    '''
+    columns = list(df.columns) if columns is None else list(columns)
+    record = record_type(name, columns)
+    for values in df[columns].itertuples(index=False):
+        yield record(*values)
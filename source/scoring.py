@@ -0,0 +1,287 @@
+import gc
+import math
+import time
+import threading
+from Queue import Queue, Empty
+import numpy as np
+import pandas as pd
+from distances import landmark_distances, vincenty_miles_point
+from spatial_index import CellGrid
+from projection import project, project_point
+from census import attach_acs
+import create_features
+from artifact import MODEL_DIR, save_artifact, load_artifact
+
+# Name of the model served by OnlineScorer, saved by save_scoring_model
+# under MODEL_DIR
+SCORING_MODEL = 'scoring'
+
+# Micro-batching: score as soon as MAX_BATCH reports are waiting, or
+# MAX_WAIT seconds after the first one arrived
+MAX_BATCH = 64
+MAX_WAIT = 0.002
+
+# Batches smaller than this are scored one report at a time
+SCALAR_BATCH = 8
+
+def save_scoring_model(model, predictors, df, target='long_repair',\
+    categoricals=(), name=SCORING_MODEL, root=MODEL_DIR):
+    '''
+    INPUT: fitted estimator, list of predictor columns, df it was fit on,
+           str, list of categorical columns, str, str
+    OUTPUT: str path of the saved version
+    Save a model as a versioned artifact (see artifact.py) with what is
+    needed to serve it: its predictors in order and the training medians
+    used to fill missing lookups.
+    '''
+    fill_values = dict((col, float(df[col].median())) for col in predictors)
+    return save_artifact(name, model, df, predictors, target,\
+        categoricals=categoricals, fill_values=fill_values, root=root)
+
+def load_scoring_model(name=SCORING_MODEL, root=MODEL_DIR):
+    '''
+    INPUT: str model name or version path, str
+    OUTPUT: ModelArtifact
+    The newest saved version, its arrays memory-mapped.
+    '''
+    return load_artifact(name, root=root)
+
+def settle_heap():
+    '''
+    INPUT: None
+    OUTPUT: None
+    Call once after loading the scorer.  The lookups and model are large,
+    long-lived object graphs; a full garbage collection walking them
+    stalls scoring for tens of milliseconds.  Collect once now, then keep
+    them out of later collections (gc.freeze where available, otherwise
+    full collections are made rare).
+    '''
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    else:
+        threshold0, threshold1, _ = gc.get_threshold()
+        gc.set_threshold(threshold0, threshold1, 1000)
+
+class OnlineScorer(object):
+    '''
+    Scores new work orders from their location and init time alone.
+
+    Everything a feature needs is reduced at startup to plain arrays: block
+    group home values by polygon position behind a CellGrid, temperatures
+    and backlog counts by day offset, landmark coordinates.  Scoring a
+    batch is then a handful of numpy operations, with no pandas and no
+    file access.  Days past the end of the weather or backlog history use
+    the last day known.
+    '''
+    def __init__(self, artifact, block_groups, daily, backlog, n_cells=256):
+        '''
+        INPUT: ModelArtifact from load_scoring_model, PolygonLookup of block groups
+               labelled by GEOID and projected to metres, daily weather df (see weather.py),
+               BacklogCounter holding the work order history, int
+        OUTPUT: None
+        '''
+        self.model = artifact.model
+        self.predictors = artifact.features
+        self.fill = np.array([artifact.fill_values[col] for col in self.predictors])
+
+        self.block_groups = CellGrid(block_groups, n_cells)
+        homes = attach_acs(pd.DataFrame({'GEOID': block_groups.labels}),\
+            create_features.CENSUS_ATTRIBUTES)
+        self.home_values = np.append(homes['Median_Home_Value'].values, np.nan)
+
+        self.weather_first_day = np.datetime64(daily.index[0], 'D')
+        self.weather = dict((col, daily[col].values.astype(float))\
+            for col in daily.columns)
+
+        self.backlog_first_day = backlog.first_day
+        self.backlog_counts = backlog.counts.astype(float)
+
+        self.origins = [create_features.LANDMARKS[col] for col in\
+            create_features.MIN_DIST_LANDMARKS]
+
+        # Linear models are scored directly from their coefficients
+        self.coef = None
+        if hasattr(self.model, 'coef_'):
+            self.coef = self.model.coef_[0].astype(float)
+            self.intercept = float(self.model.intercept_[0])
+
+        # Plain Python copies for features_one
+        self.fill_list = self.fill.tolist()
+        self.coef_list = self.coef.tolist() if self.coef is not None else None
+        self.weather_first_day_int = int(self.weather_first_day.astype(np.int64))
+        self.backlog_first_day_int = int(self.backlog_first_day.astype(np.int64))
+
+        self._features = {'min_dist': self._min_dist,\
+            'Median_Home_Value': self._home_value,\
+            'cumul_potholes': self._backlog}
+        unknown = [col for col in self.predictors if col not in\
+            self._features and col not in self.weather]
+        if unknown:
+            raise ValueError('No online lookup for predictors %s' % unknown)
+
+    def _min_dist(self, lats, lons, days):
+        return landmark_distances(lats, lons, self.origins).min(axis=1)
+
+    def _home_value(self, lats, lons, days):
+        return self.home_values[self.block_groups.lookup(*project(lons, lats))]
+
+    def _backlog(self, lats, lons, days):
+        offsets = (days - self.backlog_first_day).astype(np.int64)
+        inside = offsets >= 0
+        values = np.zeros(len(days))
+        values[inside] = self.backlog_counts[np.minimum(offsets[inside],\
+            len(self.backlog_counts) - 1)]
+        return values
+
+    def _weather(self, col, days):
+        values = self.weather[col]
+        offsets = (days - self.weather_first_day).astype(np.int64)
+        return values[np.clip(offsets, 0, len(values) - 1)]
+
+    def features(self, lats, lons, init_dts):
+        '''
+        INPUT: array of lats, array of lons, array of datetime64
+        OUTPUT: N x P float array, columns in predictor order
+        '''
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        days = np.asarray(init_dts, dtype='datetime64[ns]').astype('datetime64[D]')
+
+        X = np.empty((len(lats), len(self.predictors)))
+        for col, name in enumerate(self.predictors):
+            if name in self._features:
+                X[:, col] = self._features[name](lats, lons, days)
+            else:
+                X[:, col] = self._weather(name, days)
+
+        missing = np.isnan(X)
+        if missing.any():
+            X[missing] = np.broadcast_to(self.fill, X.shape)[missing]
+        return X
+
+    def features_one(self, lat, lon, init_dt):
+        '''
+        INPUT: float, float, datetime64
+        OUTPUT: list of P floats, in predictor order
+        features for a single report, in plain Python.
+        '''
+        day = int(np.datetime64(init_dt, 'D').astype(np.int64))
+        values = []
+        for name, fill in zip(self.predictors, self.fill_list):
+            if name == 'min_dist':
+                value = min(vincenty_miles_point(lat, lon, self.origins))
+            elif name == 'Median_Home_Value':
+                value = self.home_values[self.block_groups.lookup_point(\
+                    *project_point(lon, lat))]
+            elif name == 'cumul_potholes':
+                offset = day - self.backlog_first_day_int
+                value = 0. if offset < 0 else\
+                    self.backlog_counts[min(offset, len(self.backlog_counts) - 1)]
+            else:
+                series = self.weather[name]
+                offset = day - self.weather_first_day_int
+                value = series[min(max(offset, 0), len(series) - 1)]
+            values.append(fill if value != value else float(value))
+        return values
+
+    def score(self, lats, lons, init_dts):
+        '''
+        INPUT: array of lats, array of lons, array of datetime64
+        OUTPUT: array of probabilities of missing the repair target
+        Batches smaller than SCALAR_BATCH are scored report by report,
+        which beats numpy's per-call overhead at that size.
+        '''
+        if len(lats) < SCALAR_BATCH:
+            X = [self.features_one(lat, lon, dt) for lat, lon, dt in\
+                zip(lats, lons, init_dts)]
+            if self.coef is not None:
+                return np.array([1. / (1. + math.exp(-(self.intercept +\
+                    sum(c * x for c, x in zip(self.coef_list, row)))))\
+                    for row in X])
+            return self.model.predict_proba(np.array(X))[:, 1]
+
+        X = self.features(lats, lons, init_dts)
+        if self.coef is not None:
+            return 1. / (1. + np.exp(-(X.dot(self.coef) + self.intercept)))
+        return self.model.predict_proba(X)[:, 1]
+
+class _Pending(object):
+    '''
+    A submitted report's score, set by the batching thread.
+    '''
+    def __init__(self, lat, lon, init_dt):
+        self.request = (lat, lon, init_dt)
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.finished = None
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise RuntimeError('Scoring timed out')
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+class MicroBatcher(object):
+    '''
+    Collects reports submitted one at a time from any thread and scores
+    them together on one background thread, trading at most max_wait
+    seconds of latency for numpy's per-batch efficiency.
+    '''
+    def __init__(self, scorer, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, lat, lon, init_dt):
+        '''
+        INPUT: float, float, datetime64 or datetime
+        OUTPUT: object whose result() returns the score
+        '''
+        pending = _Pending(lat, lon, init_dt)
+        self.queue.put(pending)
+        return pending
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0\
+                        else self.queue.get_nowait()
+                except Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            self._score(batch)
+
+    def _score(self, batch):
+        lats, lons, init_dts = zip(*[pending.request for pending in batch])
+        try:
+            scores = self.scorer.score(lats, lons,\
+                np.array(init_dts, dtype='datetime64[ns]'))
+        except Exception as e:
+            scores = [None] * len(batch)
+            for pending in batch:
+                pending.error = e
+        finished = time.time()
+        for pending, value in zip(batch, scores):
+            pending.value = value
+            pending.finished = finished
+            pending.done.set()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
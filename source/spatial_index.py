@@ -0,0 +1,361 @@
+import math
+import numpy as np
+import shapely
+from shapely.geometry import Point, box
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+from scipy.spatial import cKDTree
+from geometry_cache import load_shapefile
+
+# Shapely 2 answers bulk STRtree queries with index arrays; 1.x returns
+# the matching geometries one query point at a time.
+SHAPELY2 = int(shapely.__version__.split('.')[0]) >= 2
+
+class PolygonLookup(object):
+    '''
+    Point-in-polygon labeller for the polygons of one shapefile.
+
+    Polygons are loaded once and held in an STRtree, so labelling N points
+    costs one bulk index query plus a covers test against the few polygons
+    whose bounding box holds each point.
+
+    Tie-break: a point is matched if a polygon covers it, boundary
+    included.  A point on a shared boundary (or inside overlapping
+    polygons) takes the label of the polygon that comes first in the
+    shapefile, so every point gets exactly one label or the missing value.
+    '''
+    def __init__(self, polys, labels):
+        '''
+        INPUT: list of shapely polygons, list of labels (same length)
+        OUTPUT: None
+        '''
+        self.polys = list(polys)
+        self.labels = np.asarray(labels, dtype=object)
+        self.tree = STRtree(self.polys)
+        if not SHAPELY2:
+            self._prepared = [prep(poly) for poly in self.polys]
+            self._poly_index = dict((id(poly), i) for i, poly in\
+                enumerate(self.polys))
+
+    @classmethod
+    def from_shapefile(cls, shapefilename, label_field=None, projected=False):
+        '''
+        INPUT: str path without the .shp extension, str or None, bool
+        OUTPUT: PolygonLookup
+        Read every polygon of a lon-lat shapefile, through the geometry
+        cache, projected to metres (see projection.py) if projected.
+        Labels are taken from the label_field property, or are the
+        1-based feature order if None.
+        '''
+        table = load_shapefile(shapefilename, projected=projected)
+        polys = table.geometries()
+        if label_field is None:
+            labels = [i+1 for i in range(len(table))]
+        else:
+            labels = table.field(label_field)
+
+        return cls(polys, labels)
+
+    def lookup(self, xs, ys):
+        '''
+        INPUT: array of N x coords, array of N y coords
+        OUTPUT: int array of N polygon positions, -1 where no polygon matches
+        '''
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        matches = np.empty(len(xs), dtype=int)
+        matches.fill(-1)
+
+        if SHAPELY2:
+            points = shapely.points(xs, ys)
+            hole_idx, poly_idx = self.tree.query(points, predicate='covered_by')
+
+            # Lowest polygon position wins the tie-break
+            order = np.lexsort((poly_idx, hole_idx))
+            hole_idx, poly_idx = hole_idx[order], poly_idx[order]
+            first = np.unique(hole_idx, return_index=True)[1]
+            matches[hole_idx[first]] = poly_idx[first]
+            return matches
+
+        for hole in range(len(xs)):
+            point = Point(xs[hole], ys[hole])
+            candidates = sorted(self._poly_index[id(poly)] for poly in\
+                self.tree.query(point))
+            for candidate in candidates:
+                if self._prepared[candidate].covers(point):
+                    matches[hole] = candidate
+                    break
+
+        return matches
+
+    def label(self, xs, ys, missing=''):
+        '''
+        INPUT: array of N x coords, array of N y coords, missing label
+        OUTPUT: object array of N labels
+        Label each point with the polygon it falls in, or missing.
+        '''
+        matches = self.lookup(xs, ys)
+        labels = np.empty(len(matches), dtype=object)
+        labels.fill(missing)
+        found = matches >= 0
+        labels[found] = self.labels[matches[found]]
+        return labels
+
+class CellGrid(object):
+    '''
+    Constant-time front for a PolygonLookup, for scoring a few points at
+    a time.
+
+    The polygons' extent is cut into n_cells x n_cells cells.  A cell that
+    only one polygon touches, and that polygon covers entirely, is resolved
+    ahead of time, as is a cell no polygon touches.  Points in those cells
+    are answered by array indexing; points in the remaining cells, along
+    polygon boundaries, go to the PolygonLookup.  Answers are the same as
+    PolygonLookup.lookup.
+    '''
+    def __init__(self, polygons, n_cells=256):
+        '''
+        INPUT: PolygonLookup, int
+        OUTPUT: None
+        '''
+        self.polygons = polygons
+        bounds = np.array([poly.bounds for poly in polygons.polys])
+        self.x0, self.y0 = bounds[:, 0].min(), bounds[:, 1].min()
+        self.dx = (bounds[:, 2].max() - self.x0) / n_cells
+        self.dy = (bounds[:, 3].max() - self.y0) / n_cells
+        self.n_cells = n_cells
+
+        # -2 marks cells that need the exact lookup
+        self.cells = np.empty((n_cells, n_cells), dtype=int)
+        self.cells.fill(-2)
+        ix, iy = np.meshgrid(np.arange(n_cells), np.arange(n_cells),\
+            indexing='ij')
+        ix, iy = ix.ravel(), iy.ravel()
+        boxes = [box(self.x0 + i * self.dx, self.y0 + j * self.dy,\
+            self.x0 + (i + 1) * self.dx, self.y0 + (j + 1) * self.dy)\
+            for i, j in zip(ix, iy)]
+
+        if SHAPELY2:
+            cell_idx, poly_idx = polygons.tree.query(boxes, predicate='intersects')
+            touching = np.bincount(cell_idx, minlength=len(boxes))
+            self.cells[ix[touching == 0], iy[touching == 0]] = -1
+            single = touching[cell_idx] == 1
+            cell_idx, poly_idx = cell_idx[single], poly_idx[single]
+            covered = shapely.covers(np.asarray(polygons.polys,\
+                dtype=object)[poly_idx], np.asarray(boxes, dtype=object)[cell_idx])
+            self.cells[ix[cell_idx[covered]], iy[cell_idx[covered]]] =\
+                poly_idx[covered]
+            return
+
+        for cell, cell_box in enumerate(boxes):
+            touching = [polygons._poly_index[id(poly)] for poly in\
+                polygons.tree.query(cell_box) if poly.intersects(cell_box)]
+            if not touching:
+                self.cells[ix[cell], iy[cell]] = -1
+            elif len(touching) == 1 and\
+                polygons._prepared[touching[0]].covers(cell_box):
+                self.cells[ix[cell], iy[cell]] = touching[0]
+
+    def lookup(self, xs, ys):
+        '''
+        INPUT: array of N x coords, array of N y coords
+        OUTPUT: int array of N polygon positions, -1 where no polygon matches
+        '''
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        ix = np.floor((xs - self.x0) / self.dx)
+        iy = np.floor((ys - self.y0) / self.dy)
+        inside = (ix >= 0) & (ix < self.n_cells) & (iy >= 0) & (iy < self.n_cells)
+
+        # Points outside the grid may still lie on its far edges
+        matches = np.empty(len(xs), dtype=int)
+        matches.fill(-2)
+        matches[inside] = self.cells[ix[inside].astype(int), iy[inside].astype(int)]
+
+        exact = matches == -2
+        if exact.any():
+            matches[exact] = self.polygons.lookup(xs[exact], ys[exact])
+        return matches
+
+    def lookup_point(self, x, y):
+        '''
+        INPUT: float, float
+        OUTPUT: int polygon position, -1 if no polygon matches
+        lookup for a single point, without building arrays.
+        '''
+        ix = int(math.floor((x - self.x0) / self.dx))
+        iy = int(math.floor((y - self.y0) / self.dy))
+        if 0 <= ix < self.n_cells and 0 <= iy < self.n_cells:
+            match = self.cells[ix, iy]
+            if match != -2:
+                return int(match)
+        return int(self.polygons.lookup([x], [y])[0])
+
+class StreetIndex(object):
+    '''
+    Nearest-segment index over the line features of one shapefile.
+
+    Every line is cut into straight edges no longer than max_edge, and the
+    edge midpoints go into a KD-tree.  A point is never further from an
+    edge than from that edge's midpoint, and never more than half an edge
+    length closer, so the tree's nearest midpoints give a short candidate
+    list whose exact point-to-edge distances are computed in bulk.  Any
+    point whose candidate list cannot be proven complete falls back to a
+    radius query, so results are exact.
+    '''
+    def __init__(self, lines, attributes=None, max_edge=None):
+        '''
+        INPUT: list of shapely (Multi)LineStrings, list of per-line
+               attribute lists or None, float or None
+        OUTPUT: None
+        max_edge defaults to twice the median edge length.
+        '''
+        starts, ends, owners = [], [], []
+        for i, line in enumerate(lines):
+            parts = line.geoms if hasattr(line, 'geoms') else [line]
+            for part in parts:
+                coords = np.asarray(part.coords, dtype=float)[:, :2]
+                starts.append(coords[:-1])
+                ends.append(coords[1:])
+                owners.append(np.repeat(i, len(coords) - 1))
+        starts = np.concatenate(starts)
+        ends = np.concatenate(ends)
+        owners = np.concatenate(owners)
+
+        # Split long edges so no midpoint is far from its edge
+        lengths = np.hypot(*(ends - starts).T)
+        if max_edge is None:
+            max_edge = 2 * np.median(lengths[lengths > 0])
+        pieces = np.maximum(np.ceil(lengths / max_edge), 1).astype(int)
+        edge = np.repeat(np.arange(len(starts)), pieces)
+        step = np.arange(len(edge)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        frac0 = (step / pieces[edge].astype(float))[:, np.newaxis]
+        frac1 = ((step + 1) / pieces[edge].astype(float))[:, np.newaxis]
+        delta = ends[edge] - starts[edge]
+
+        self.starts = starts[edge] + frac0 * delta
+        self.ends = starts[edge] + frac1 * delta
+        self.owners = owners[edge]
+        self.half_length = np.hypot(*(self.ends - self.starts).T).max() / 2
+        self.tree = cKDTree((self.starts + self.ends) / 2)
+        self.n_lines = len(lines)
+        self.attributes = attributes
+
+    @classmethod
+    def from_shapefile(cls, shapefilename, fields, max_edge=None,\
+        projected=False):
+        '''
+        INPUT: str path without the .shp extension, list of property
+               names, float or None, bool
+        OUTPUT: StreetIndex
+        Lines of a lon-lat shapefile, through the geometry cache,
+        projected to metres if projected.
+        '''
+        table = load_shapefile(shapefilename, projected=projected)
+        lines = table.geometries()
+        attributes = [list(values) for values in\
+            zip(*[table.field(field) for field in fields])]
+
+        return cls(lines, attributes, max_edge=max_edge)
+
+    def nearest(self, xs, ys, k=1, max_distance=None):
+        '''
+        INPUT: array of N x coords, array of N y coords, int, float or None
+        OUTPUT: N x k float array of distances, N x k int array of line
+                positions
+        The k nearest lines to each point, closest first.  Slots with no
+        line (fewer than k lines, or none within max_distance) hold a
+        distance of NaN and a position of -1.
+        '''
+        points = np.column_stack([np.asarray(xs, dtype=float),\
+            np.asarray(ys, dtype=float)])
+        n_points = len(points)
+        n_edges = len(self.owners)
+
+        # Nearest edge midpoints are the candidates for every point at once
+        n_cand = min(n_edges, max(8, 4 * k))
+        mid_dist, cand = self.tree.query(points, k=n_cand)
+        mid_dist = mid_dist.reshape(n_points, n_cand)
+        cand = cand.reshape(n_points, n_cand)
+        rows = np.repeat(np.arange(n_points), n_cand)
+        dists, lines = self._best_lines(rows, cand.ravel(), points, n_points, k)
+
+        # Candidates are complete once the furthest midpoint looked at is
+        # beyond any edge that could still beat the k-th result
+        bound = dists[:, -1].copy()
+        bound[np.isnan(bound)] = np.inf
+        if max_distance is not None:
+            bound = np.minimum(bound, max_distance)
+        redo = (mid_dist[:, -1] < bound + self.half_length) &\
+            (n_cand < n_edges)
+
+        for row in np.nonzero(redo)[0]:
+            if np.isinf(bound[row]):
+                cand_row = np.arange(n_edges)
+            else:
+                cand_row = np.asarray(self.tree.query_ball_point(points[row],\
+                    bound[row] + self.half_length), dtype=int)
+            if len(cand_row):
+                dists[row], lines[row] = self._best_lines(\
+                    np.zeros(len(cand_row), dtype=int), cand_row,\
+                    points[row:row+1], 1, k)
+
+        if max_distance is not None:
+            too_far = ~(dists <= max_distance)
+            dists[too_far] = np.nan
+            lines[too_far] = -1
+
+        return dists, lines
+
+    def nearest_attributes(self, xs, ys, max_distance=None):
+        '''
+        INPUT: array of N x coords, array of N y coords, float or None
+        OUTPUT: list of N attribute lists
+        Attributes of the closest line to each point; a list of NaNs for
+        points with no line in range.
+        '''
+        n_fields = len(self.attributes[0]) if self.attributes else 0
+        missing = [np.nan] * n_fields
+        lines = self.nearest(xs, ys, k=1, max_distance=max_distance)[1][:, 0]
+        return [self.attributes[line] if line >= 0 else missing\
+            for line in lines]
+
+    def _best_lines(self, rows, edges, points, n_points, k):
+        '''
+        INPUT: int array of point rows, int array of candidate edges,
+               N x 2 points, int, int
+        OUTPUT: N x k float array of distances, N x k int array of lines
+        Exact distance from each point to its candidate edges, reduced to
+        the k closest distinct lines per point.
+        '''
+        a = self.starts[edges]
+        ab = self.ends[edges] - a
+        ap = points[rows] - a
+        ab_sq = (ab ** 2).sum(axis=1)
+        t = np.where(ab_sq > 0, (ap * ab).sum(axis=1) /\
+            np.where(ab_sq > 0, ab_sq, 1.), 0.)
+        t = np.clip(t, 0., 1.)
+        dist = np.hypot(*(ap - t[:, np.newaxis] * ab).T)
+        owners = self.owners[edges]
+
+        # Keep each line's closest edge, then rank lines by distance
+        order = np.lexsort((dist, owners, rows))
+        rows, owners, dist = rows[order], owners[order], dist[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (owners[1:] != owners[:-1])
+        rows, owners, dist = rows[first], owners[first], dist[first]
+
+        order = np.lexsort((dist, rows))
+        rows, owners, dist = rows[order], owners[order], dist[order]
+        starts = np.searchsorted(rows, np.arange(n_points))
+        rank = np.arange(len(rows)) - starts[rows]
+        keep = rank < k
+
+        dists = np.empty((n_points, k))
+        dists.fill(np.nan)
+        lines = np.empty((n_points, k), dtype=int)
+        lines.fill(-1)
+        dists[rows[keep], rank[keep]] = dist[keep]
+        lines[rows[keep], rank[keep]] = owners[keep]
+
+        return dists, lines
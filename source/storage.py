@@ -0,0 +1,148 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Root directory of the columnar stage outputs
+STORE_DIR = 'store'
+
+# Stage outputs are split into year=YYYY directories on this column
+PARTITION_COL = 'INITDT_dt'
+
+# Low-cardinality labels stored dictionary-encoded
+CATEGORICAL_COLUMNS = ['neighborhood_label','GEOID','SND_FEACOD','ST_CODE',\
+    'SEGMENT_TY','DIVIDED_CO','VEHICLE_US','wkdy_or_wknd','WO_STATUS']
+
+# The frame index is kept in this column
+INDEX_COL = '__row__'
+
+# Schema metadata key for what Parquet cannot hold itself: the index name
+# and the timedelta columns, which are stored as int64 nanoseconds
+META_KEY = b'storage'
+
+def _to_table(df):
+    '''
+    INPUT: df
+    OUTPUT: pyarrow Table
+    Move the index into a column, store timedeltas as int64 nanoseconds
+    and dictionary-encode the categorical columns.  Categories keep their
+    type, so numeric labels come back numeric; only labels of mixed
+    types, such as neighborhood numbers and '', are stored as strings,
+    which Parquet needs.  Text columns with no values in df are typed as
+    text anyway, so they read back together with the other files.
+    '''
+    df = df.copy()
+    meta = {'index_name': df.index.name, 'timedelta_columns': {}}
+    df[INDEX_COL] = df.index
+    for col in df.columns:
+        if df[col].dtype.kind == 'm':
+            meta['timedelta_columns'][col] = str(df[col].dtype)
+            df[col] = df[col].values.astype('timedelta64[ns]').view(np.int64)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            values = df[col].astype('category')
+            categories = values.cat.categories
+            if categories.inferred_type.startswith('mixed'):
+                values = values.cat.rename_categories(\
+                    [str(c) for c in categories])
+            df[col] = values
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    schema = table.schema
+    for i, field in enumerate(schema):
+        if field.type == pa.null():
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+        elif pa.types.is_dictionary(field.type) and\
+            field.type.value_type == pa.null():
+            schema = schema.set(i, pa.field(field.name,\
+                pa.dictionary(field.type.index_type, pa.string())))
+    if schema != table.schema:
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[META_KEY] = json.dumps(meta).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+def _write_next(table, path):
+    '''
+    INPUT: pyarrow Table, str
+    OUTPUT: None
+    Write table to the next numbered file in directory path, so files
+    list in the order they were written.
+    '''
+    if not os.path.exists(path):
+        os.makedirs(path)
+    n = len([f for f in os.listdir(path) if f.endswith('.parquet')])
+    pq.write_table(table, os.path.join(path, 'part-%05d.parquet' % n))
+
+def write_frame(df, name, root=STORE_DIR, partition_col=PARTITION_COL):
+    '''
+    INPUT: df, str, str, str or None
+    OUTPUT: None
+    Replace the stored output called name with df, as Parquet files
+    partitioned by year of partition_col (unpartitioned if None or the
+    column is absent).
+    '''
+    delete_frame(name, root=root)
+    append_frame(df, name, root=root, partition_col=partition_col)
+
+def delete_frame(name, root=STORE_DIR):
+    '''
+    INPUT: str, str
+    OUTPUT: None
+    Remove the stored output called name, if there is one.
+    '''
+    path = os.path.join(root, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+def append_frame(df, name, root=STORE_DIR, partition_col=PARTITION_COL):
+    '''
+    INPUT: df, str, str, str or None
+    OUTPUT: None
+    Add df's rows to the stored output called name as new Parquet files,
+    one per year of partition_col.
+    '''
+    path = os.path.join(root, name)
+    if partition_col in df and df[partition_col].isnull().any():
+        raise ValueError('%s has missing values to partition on' % partition_col)
+    if partition_col not in df:
+        _write_next(_to_table(df), path)
+        return
+    for year, part in df.groupby(df[partition_col].dt.year, sort=True):
+        _write_next(_to_table(part), os.path.join(path, 'year=%d' % year))
+
+def read_frame(name, columns=None, years=None, root=STORE_DIR):
+    '''
+    INPUT: str, list or None, list or None, str
+    OUTPUT: df
+    Load a stored output.  Only the requested columns are read, and only
+    the partitions for the requested years are opened.  Rows come back
+    grouped by year, in the order they were written within each year,
+    under their original index.
+    '''
+    filters = None
+    if years is not None:
+        filters = [('year', 'in', list(years))]
+    if columns is not None:
+        columns = list(columns) + [INDEX_COL]
+
+    table = pq.read_table(os.path.join(root, name), columns=columns,\
+        filters=filters)
+    meta = json.loads(table.schema.metadata[META_KEY].decode('utf-8'))
+    df = table.to_pandas()
+    df = df.set_index(INDEX_COL)
+    df.index.name = meta['index_name']
+    for col, dtype in meta['timedelta_columns'].items():
+        if col in df:
+            df[col] = pd.to_timedelta(df[col].values, unit='ns').astype(dtype)
+    if 'year' in df and (columns is None or 'year' not in columns):
+        df = df.drop('year', axis=1)
+    # Parquet keeps the dictionary of string labels only
+    for col in CATEGORICAL_COLUMNS:
+        if col in df and df[col].dtype.name != 'category':
+            df[col] = df[col].astype('category')
+    return df
@@ -0,0 +1,294 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString, Polygon
+from spatial_index import PolygonLookup, StreetIndex
+from projection import project_geometry
+import create_features
+import census
+import weather
+
+# The cleaning scripts live next to this directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),\
+    '..', 'clean'))
+import clean_seattle_data
+
+# Synthetic work orders, cities and input files, shared by benchmark.py
+# and the tests
+
+# Rough extent of Seattle, lon-lat
+SEATTLE_BOUNDS = (-122.44, 47.49, -122.23, 47.74)
+
+# Synthetic city: polygon tilings sized like the real shapefiles (about
+# 120 neighborhoods, 480 block groups) and a grid of about 30k segments
+NEIGHBORHOOD_GRID = (10, 12)
+BLOCK_GROUP_GRID = (20, 24)
+STREET_BLOCKS = 120
+
+# Days of history in the synthetic work orders and weather
+HISTORY_DAYS = 5 * 365
+
+def make_street_grid(n_blocks, bounds=SEATTLE_BOUNDS, jitter=0.2, seed=0):
+    '''
+    INPUT: int, tuple, float, int
+    OUTPUT: list of LineStrings, list of attribute lists
+    Synthetic street network: an n_blocks x n_blocks grid of one-block
+    segments over bounds, with interior nodes jittered by a fraction of a
+    block so segments are not axis-aligned.
+    '''
+    rng = np.random.RandomState(seed)
+    xs = np.linspace(bounds[0], bounds[2], n_blocks + 1)
+    ys = np.linspace(bounds[1], bounds[3], n_blocks + 1)
+    gx, gy = np.meshgrid(xs, ys, indexing='ij')
+    dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+    gx[1:-1, 1:-1] += rng.uniform(-jitter, jitter, gx[1:-1, 1:-1].shape) * dx
+    gy[1:-1, 1:-1] += rng.uniform(-jitter, jitter, gy[1:-1, 1:-1].shape) * dy
+
+    lines = []
+    for i in range(n_blocks + 1):
+        for j in range(n_blocks + 1):
+            if i < n_blocks:
+                lines.append(LineString([(gx[i, j], gy[i, j]),\
+                    (gx[i+1, j], gy[i+1, j])]))
+            if j < n_blocks:
+                lines.append(LineString([(gx[i, j], gy[i, j]),\
+                    (gx[i, j+1], gy[i, j+1])]))
+
+    attributes = [[i % 7, 'ST%d' % (i % 500), 'SEG%d' % (i % 3), i % 2,\
+        'VEH%d' % (i % 4)] for i in range(len(lines))]
+
+    return lines, attributes
+
+def make_pothole_coords(n, bounds=SEATTLE_BOUNDS, seed=1):
+    '''
+    INPUT: int, tuple, int
+    OUTPUT: array of n lons, array of n lats
+    Uniformly scattered pothole locations inside bounds.
+    '''
+    rng = np.random.RandomState(seed)
+    lons = rng.uniform(bounds[0], bounds[2], n)
+    lats = rng.uniform(bounds[1], bounds[3], n)
+    return lons, lats
+
+def make_work_orders(n, start='2010-01-01', days=365, seed=2):
+    '''
+    INPUT: int, str, int, int
+    OUTPUT: df
+    Synthetic completed work orders with the cleaned-data datetime and
+    duration columns.  Init times fall anywhere in the day; repair times
+    are skewed like the real data, from minutes to a few weeks.
+    '''
+    rng = np.random.RandomState(seed)
+    init = pd.Timestamp(start) + pd.to_timedelta(\
+        rng.randint(0, days * 24 * 60, n), unit='m')
+    duration = pd.to_timedelta(np.ceil(rng.exponential(3 * 24 * 60, n)),\
+        unit='m')
+
+    df = pd.DataFrame({'OBJECTID': np.arange(n), 'INITDT_dt': init,\
+        'DURATION': duration})
+    df['FLDENDDT_dt'] = df['INITDT_dt'] + df['DURATION']
+    df['DURATION_td'] = df['DURATION'] / np.timedelta64(1, 'D')
+    return df
+
+def make_feature_frame(n, seed=3):
+    '''
+    INPUT: int, int
+    OUTPUT: df
+    Synthetic work orders with the column mix of the features frame:
+    datetimes, floats, small integers and string labels.
+    '''
+    rng = np.random.RandomState(seed)
+    df = make_work_orders(n, days=5 * 365, seed=seed)
+    df['longitude'], df['latitude'] = make_pothole_coords(n, seed=seed)
+    df['ADDRDESC'] = ['%d AVE NE BETWEEN NE %dTH ST AND NE %dTH ST' %\
+        (i % 90, i % 80, i % 80 + 1) for i in rng.randint(0, 10**6, n)]
+    df['neighborhood_label'] = rng.randint(1, 120, n)
+    df['GEOID'] = ['530330%06d' % i for i in rng.randint(0, 480, n)]
+    df['SND_FEACOD'] = rng.randint(1, 8, n)
+    df['ST_CODE'] = ['ST%d' % i for i in rng.randint(0, 400, n)]
+    for col in ['Temp', 'Median_Home_Value', 'Median_Income', 'min_dist']:
+        df[col] = rng.normal(size=n)
+    df['cumul_potholes'] = rng.randint(0, 300, n)
+    return df
+
+def make_raw_csv(filename, n, seed=4):
+    '''
+    INPUT: str, int, int
+    OUTPUT: None
+    Write a synthetic Pothole_Repairs_Seattle.csv: a mix of completed
+    and open orders, some with end before init or equal to it.
+    '''
+    rng = np.random.RandomState(seed)
+    df = make_work_orders(n, days=5 * 365, seed=seed)
+    end = df['FLDENDDT_dt'].copy()
+    backwards = rng.rand(n) < 0.03
+    end[backwards] = df['INITDT_dt'][backwards] - pd.Timedelta(hours=5)
+    same = rng.rand(n) < 0.02
+    end[same] = df['INITDT_dt'][same]
+
+    fmt = clean_seattle_data.RAW_DATETIME_FORMAT
+    raw = pd.DataFrame({'OBJECTID': df['OBJECTID'],\
+        'WOKEY': ['WO%07d' % i for i in df['OBJECTID']],\
+        'LOCATION': ['(47.6, -122.3)'] * n,\
+        'ADDRDESC': ['%d AVE NE AND NE %dTH ST' % (i % 90, i % 80)\
+            for i in df['OBJECTID']],\
+        'WO_STATUS': np.where(rng.rand(n) < 0.9, 'COMPLETED', 'OPEN'),\
+        'INITDT': df['INITDT_dt'].dt.strftime(fmt),\
+        'FLDSTARTDT': df['INITDT_dt'].dt.strftime(fmt),\
+        'FLDENDDT': end.dt.strftime(fmt)})
+    raw.loc[raw['WO_STATUS'] == 'OPEN', 'FLDENDDT'] = ''
+    raw.to_csv(filename, index=False)
+
+def make_potholes(n, days=HISTORY_DAYS, seed=5):
+    '''
+    INPUT: int, int, int
+    OUTPUT: df
+    Synthetic geo_cleaned frame: work orders with locations.
+    '''
+    df = make_work_orders(n, days=days, seed=seed)
+    df['longitude'], df['latitude'] = make_pothole_coords(n, seed=seed)
+    return df
+
+def make_polygon_tiling(nx, ny, bounds=SEATTLE_BOUNDS, jitter=0.2, seed=6):
+    '''
+    INPUT: int, int, tuple, float, int
+    OUTPUT: list of Polygons
+    nx x ny quadrilaterals tiling bounds without gaps or overlaps: a grid
+    whose interior nodes are jittered, like make_street_grid.
+    '''
+    rng = np.random.RandomState(seed)
+    xs = np.linspace(bounds[0], bounds[2], nx + 1)
+    ys = np.linspace(bounds[1], bounds[3], ny + 1)
+    gx, gy = np.meshgrid(xs, ys, indexing='ij')
+    dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+    gx[1:-1, 1:-1] += rng.uniform(-jitter, jitter, gx[1:-1, 1:-1].shape) * dx
+    gy[1:-1, 1:-1] += rng.uniform(-jitter, jitter, gy[1:-1, 1:-1].shape) * dy
+
+    return [Polygon([(gx[i, j], gy[i, j]), (gx[i+1, j], gy[i+1, j]),\
+        (gx[i+1, j+1], gy[i+1, j+1]), (gx[i, j+1], gy[i, j+1])])\
+        for i in range(nx) for j in range(ny)]
+
+def make_geoids(n):
+    '''
+    INPUT: int
+    OUTPUT: list of str
+    Block group GEOIDs in King County (state 53, county 033).
+    '''
+    return ['530330%04d%02d' % (i // 4 + 1, i % 4 + 1) for i in range(n)]
+
+def make_acs_table(filename, geoids, median=300000., seed=7):
+    '''
+    INPUT: str, list of str, float, int
+    OUTPUT: None
+    Write a factfinder ACS download: an estimate and a margin of error
+    per block group, with the description row under the header and a few
+    suppressed ('-') and top-coded ('1000000+') values.
+    '''
+    rng = np.random.RandomState(seed)
+    n = len(geoids)
+    estimate = np.round(median * rng.lognormal(0, 0.4, n)).astype(int)
+    margin = np.round(estimate * rng.uniform(0.05, 0.3, n)).astype(int)
+    estimate, margin = estimate.astype(object), margin.astype(object)
+    estimate[rng.rand(n) < 0.02] = '-'
+    estimate[rng.rand(n) < 0.01] = '1000000+'
+
+    df = pd.DataFrame({'GEO.id': ['1500000US' + g for g in geoids],\
+        'GEO.id2': geoids, 'GEO.display-label': ['Block Group'] * n,\
+        'HD01_VD01': estimate, 'HD02_VD01': margin},\
+        columns=['GEO.id', 'GEO.id2', 'GEO.display-label', 'HD01_VD01',\
+        'HD02_VD01'])
+    header = pd.DataFrame([['Id', 'Id2', 'Geography', 'Estimate; Total',\
+        'Margin of Error; Total']], columns=df.columns)
+    pd.concat([header, df]).to_csv(filename, index=False)
+
+def make_weather_csv(filename, start='2010-01-01', days=HISTORY_DAYS, seed=8):
+    '''
+    INPUT: str, str, int, int
+    OUTPUT: None
+    Write hourly NOAA-style observations: readings with units, a seasonal
+    temperature cycle, rain on some hours and 'N/A' when dry.
+    '''
+    rng = np.random.RandomState(seed)
+    hours = pd.DatetimeIndex(pd.Timestamp(start) +\
+        pd.to_timedelta(np.arange(days * 24), unit='h'))
+    # Plain arrays: pandas indexes have no numpy string operations
+    dayofyear, hour = np.asarray(hours.dayofyear), np.asarray(hours.hour)
+    temp = 52 + 14 * np.sin(2 * np.pi * (dayofyear - 110) / 365.) +\
+        5 * np.sin(2 * np.pi * (hour - 9) / 24.) + rng.normal(0, 3, len(hours))
+    rain = rng.exponential(0.04, len(hours))
+    precip = np.where(rng.rand(len(hours)) < 0.15,\
+        np.char.add(np.round(rain, 2).astype(str), ' in'), 'N/A')
+
+    pd.DataFrame({'date': hours.strftime('%Y-%m-%d'),\
+        'Time': hours.strftime('%I:%M %p'),\
+        'Temp.': np.char.add(np.round(temp, 1).astype(str), ' F'),\
+        'Precip': precip}).to_csv(filename, index=False)
+
+def timed(log, name, n, func, *args, **kwargs):
+    '''
+    INPUT: RunLog, str, int or None, function, arguments
+    OUTPUT: what func returns
+    Run func as a logged step called name@n, or name for one-off setup;
+    just run it if log is None.
+    '''
+    if log is None:
+        return func(*args, **kwargs)
+    step = name if n is None else '%s@%d' % (name, n)
+    with log.step(step, rows_in=n) as record:
+        result = func(*args, **kwargs)
+        if hasattr(result, '__len__'):
+            record['rows_out'] = len(result)
+    print('%-40s %8.2fs' % (record['step'], record['wall_s']))
+    return result
+
+def make_city(root, log=None):
+    '''
+    INPUT: str, RunLog or None
+    OUTPUT: dict of neighborhoods, block groups, streets and daily weather
+    Build a synthetic city: write ACS tables and a weather CSV under
+    root/data (the feature functions read ACS tables from data/, so run
+    them from root) and build the spatial indexes, logging each build.
+    '''
+    os.makedirs(os.path.join(root, 'data'))
+    geoids = make_geoids(BLOCK_GROUP_GRID[0] * BLOCK_GROUP_GRID[1])
+    for seed, (table_id, column, _) in enumerate(\
+        create_features.CENSUS_ATTRIBUTES):
+        filename = os.path.join(root, census.acs_filename(table_id))
+        if not os.path.exists(filename):
+            make_acs_table(filename, geoids, seed=seed)
+    weather_csv = os.path.join(root, 'data', 'weather.csv')
+    make_weather_csv(weather_csv)
+
+    city = {}
+    # Shapes are drawn in lon-lat and projected, as the shapefile loaders do
+    city['hoods'] = timed(log, 'build_neighborhoods', None, PolygonLookup,\
+        [project_geometry(poly) for poly in make_polygon_tiling(*NEIGHBORHOOD_GRID)],\
+        [str(i + 1) for i in range(NEIGHBORHOOD_GRID[0] * NEIGHBORHOOD_GRID[1])])
+    city['block_groups'] = timed(log, 'build_block_groups', None,\
+        PolygonLookup, [project_geometry(poly) for poly in\
+        make_polygon_tiling(*BLOCK_GROUP_GRID, seed=9)], geoids)
+    lines, attributes = make_street_grid(STREET_BLOCKS)
+    city['streets'] = timed(log, 'build_streets', None, StreetIndex,\
+        [project_geometry(line) for line in lines], attributes)
+    city['daily'] = timed(log, 'load_weather', None, lambda:\
+        weather.add_window_features(weather.load_daily_weather(weather_csv)))
+    return city
+
+def write_street_shapefile(shapefilename, n_blocks=STREET_BLOCKS):
+    '''
+    INPUT: str path without the .shp extension, int
+    OUTPUT: None
+    Write make_street_grid as a lon-lat shapefile with the STREET_FEATURES
+    properties.
+    '''
+    import fiona
+    lines, attributes = make_street_grid(n_blocks)
+    kinds = ['int', 'str', 'str', 'int', 'str']
+    schema = {'geometry': 'LineString', 'properties':\
+        list(zip(create_features.STREET_FEATURES, kinds))}
+    with fiona.open(shapefilename + '.shp', 'w', driver='ESRI Shapefile',\
+        schema=schema) as shp:
+        shp.writerecords({'geometry': line.__geo_interface__,\
+            'properties': dict(zip(create_features.STREET_FEATURES, values))}\
+            for line, values in zip(lines, attributes))
@@ -0,0 +1,181 @@
+import time
+import json
+import random
+import sqlite3
+import hashlib
+import itertools
+import cPickle as pickle
+import numpy as np
+import pandas as pd
+import sklearn.metrics as skm
+from sklearn.ensemble import RandomForestClassifier
+
+# Random forest settings searched
+PARAM_GRID = {
+    'max_depth': [None, 8, 16, 32],
+    'min_samples_leaf': [1, 5, 20, 50],
+    'max_features': ['sqrt', 0.3, 0.6],
+    }
+
+# Successive halving: each round keeps the best 1/ETA of the candidates and
+# gives them ETA times the training rows and trees, from MIN_ROWS rows and
+# MIN_TREES trees up to the full data and MAX_TREES trees
+ETA = 3
+MIN_ROWS = 5000
+MIN_TREES = 20
+MAX_TREES = 500
+
+# Scored results, one row per candidate and budget; lets a stopped search
+# resume where it left off
+TUNING_CACHE = 'tuning_cache.sqlite'
+
+RANDOM_STATE = 67
+
+class TuningCache(object):
+    '''
+    On-disk scores keyed by data fingerprint, settings and budget.  Like
+    GeocodeCache, every result is written as soon as it is known.
+    '''
+    def __init__(self, filename=TUNING_CACHE):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS scores '
+            '(key TEXT PRIMARY KEY, result TEXT)')
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute('SELECT result FROM scores WHERE key = ?',\
+            (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, result):
+        self.conn.execute('INSERT OR REPLACE INTO scores VALUES (?, ?)',\
+            (key, json.dumps(result, sort_keys=True)))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def _data_fingerprint(X, y, train, test):
+    h = hashlib.sha1()
+    for arr in (X, y, train, test):
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+def _subsample(y, train, rows, rng):
+    '''
+    INPUT: target array, train positions, int, RandomState
+    OUTPUT: array of positions
+    A random rows of the training positions, drawn class by class in
+    proportion, so a rare class is still in a small sample.
+    '''
+    if rows >= len(train):
+        return train
+    labels = y[train]
+    parts = []
+    for label in np.unique(labels):
+        members = train[labels == label]
+        k = max(1, int(round(rows * len(members) / float(len(train)))))
+        parts.append(rng.choice(members, min(k, len(members)), replace=False))
+    return np.sort(np.concatenate(parts))
+
+def _score(params, X, y, train, test, rows, trees, random_state):
+    '''
+    INPUT: dict, arrays, int, int, int
+    OUTPUT: dict
+    Fit a forest with params and the given number of trees on a
+    stratified subsample of rows training rows, and score it on the test
+    rows.
+    '''
+    rng = np.random.RandomState(random_state)
+    sample = _subsample(y, train, rows, rng)
+
+    model = RandomForestClassifier(n_estimators=trees, n_jobs=-1,\
+        random_state=random_state, **params)
+    start = time.time()
+    model.fit(X[sample], y[sample])
+    fit_s = time.time() - start
+
+    start = time.time()
+    proba = model.predict_proba(X[test])[:, 1]
+    predict_s = time.time() - start
+
+    return {'auc': skm.roc_auc_score(y[test], proba), 'fit_s': fit_s,\
+        'predict_ms_per_1k': predict_s / len(test) * 1e6,\
+        'model_bytes': len(pickle.dumps(model, pickle.HIGHEST_PROTOCOL))}
+
+def _candidates(grid, n_candidates, random_state):
+    '''
+    INPUT: dict of setting -> values, int or None, int
+    OUTPUT: list of dicts
+    Every combination in grid, or a random n_candidates of them.
+    '''
+    names = sorted(grid)
+    combos = [dict(zip(names, values)) for values in\
+        itertools.product(*[grid[name] for name in names])]
+    if n_candidates is not None and n_candidates < len(combos):
+        combos = random.Random(random_state).sample(combos, n_candidates)
+    return combos
+
+def successive_halving(X, y, train, test, grid=PARAM_GRID, n_candidates=None,\
+    eta=ETA, min_rows=MIN_ROWS, min_trees=MIN_TREES, max_trees=MAX_TREES,\
+    cache=None, random_state=RANDOM_STATE):
+    '''
+    INPUT: predictor array, target array, train positions, test positions,
+           dict, int or None, int, int, int, int, TuningCache or None, int
+    OUTPUT: df with one row per candidate and budget scored
+    Score every candidate on a small budget of rows and trees, keep the
+    best 1/eta by AUC, and repeat with eta times the budget until one
+    candidate is left or the full budget is reached.  Scores already in
+    cache are reused, so an interrupted search resumes where it stopped.
+    Both the training and the test rows must hold both classes, or there
+    is no AUC to rank by.
+    '''
+    for name, positions in (('training', train), ('test', test)):
+        if len(np.unique(y[positions])) < 2:
+            raise ValueError('The %s rows hold a single class; AUC is '\
+                'undefined, choose a split with both' % name)
+    fingerprint = _data_fingerprint(X, y, train, test)
+    survivors = _candidates(grid, n_candidates, random_state)
+    rows, trees = min(min_rows, len(train)), min(min_trees, max_trees)
+
+    results = []
+    for rnd in itertools.count():
+        scored = []
+        for params in survivors:
+            key = json.dumps([fingerprint, params, rows, trees, random_state],\
+                sort_keys=True)
+            result = cache.get(key) if cache is not None else None
+            if result is None:
+                result = _score(params, X, y, train, test, rows, trees,\
+                    random_state)
+                if cache is not None:
+                    cache.put(key, result)
+            record = dict(params, round=rnd, rows=rows, trees=trees, **result)
+            results.append(record)
+            scored.append((result['auc'], params))
+
+        full_budget = rows >= len(train) and trees >= max_trees
+        if len(survivors) == 1 or full_budget:
+            break
+        scored.sort(key=lambda item: -item[0])
+        survivors = [params for _, params in scored[:max(1, len(scored) // eta)]]
+        rows, trees = min(rows * eta, len(train)), min(trees * eta, max_trees)
+
+    return pd.DataFrame(results)
+
+def pareto_front(results, objectives=(('auc', True), ('fit_s', False),\
+    ('model_bytes', False))):
+    '''
+    INPUT: df from successive_halving, tuple of (column, higher is better)
+    OUTPUT: df
+    The scored models no other model beats on every objective at once,
+    best AUC first.
+    '''
+    values = np.column_stack([results[col].values * (1 if higher else -1)\
+        for col, higher in objectives])
+    keep = np.ones(len(values), dtype=bool)
+    for i in range(len(values)):
+        dominated = (values >= values[i]).all(axis=1) &\
+            (values > values[i]).any(axis=1)
+        keep[i] = not dominated.any()
+    return results[keep].sort_values('auc', ascending=False)
@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Hourly NOAA observations as downloaded, one row per reading
+WEATHER_CSV = 'data/weather.csv'
+
+# Raw columns: readings carry their units, e.g. '45.0 F' or '0.02 in'
+RAW_TEMP_COL = 'Temp.'
+RAW_PRECIP_COL = 'Precip'
+
+# Daily table, as .npz next to the source CSV
+WEATHER_CACHE_SUFFIX = '.daily.npz'
+
+DAILY_COLUMNS = ['Temp', 'Temp_min', 'Temp_max', 'Precip']
+
+# Trailing windows, in days, for the rolling precipitation totals
+PRECIP_WINDOWS = [3, 7]
+
+_daily = {}
+
+def _leading_number(s):
+    '''
+    INPUT: pandas Series of str
+    OUTPUT: float pandas Series
+    The number a reading starts with; NaN for '-', 'N/A' and the like.
+    '''
+    return pd.to_numeric(s.astype(str).str.extract(r'^\s*(-?\d+\.?\d*)',\
+        expand=False), errors='coerce')
+
+def _parse_weather_csv(filename):
+    '''
+    INPUT: str
+    OUTPUT: df of daily values indexed by a complete daily DatetimeIndex
+    Reduce the hourly readings to one row per day: mean, min and max
+    temperature and total precipitation.  Days without readings are NaN.
+    '''
+    raw = pd.read_csv(filename, dtype=str)
+    days = pd.to_datetime(raw['date']).dt.normalize()
+
+    hourly = pd.DataFrame({'day': days, 'Temp': _leading_number(raw[RAW_TEMP_COL])})
+    if RAW_PRECIP_COL in raw:
+        hourly['Precip'] = _leading_number(raw[RAW_PRECIP_COL])
+    else:
+        hourly['Precip'] = np.nan
+
+    grouped = hourly.groupby('day')
+    daily = pd.DataFrame({'Temp': grouped['Temp'].mean(),\
+        'Temp_min': grouped['Temp'].min(),\
+        'Temp_max': grouped['Temp'].max(),\
+        'Precip': grouped['Precip'].sum(min_count=1)})[DAILY_COLUMNS]
+
+    return daily.reindex(pd.date_range(daily.index.min(), daily.index.max()))
+
+def load_daily_weather(filename=WEATHER_CSV):
+    '''
+    INPUT: str
+    OUTPUT: df indexed by day, with DAILY_COLUMNS
+    The daily weather table.  The CSV is parsed once and cached as .npz,
+    reparsed only when it changes, and kept in memory for the rest of
+    the run.
+    '''
+    stat = os.stat(filename)
+    stamp = np.array([stat.st_size, stat.st_mtime])
+    if filename in _daily and np.array_equal(_daily[filename][0], stamp):
+        return _daily[filename][1]
+
+    cache_file = filename + WEATHER_CACHE_SUFFIX
+    daily = None
+    if os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        if np.array_equal(cached['stamp'], stamp):
+            index = pd.date_range(pd.Timestamp(cached['first_day'].item()),\
+                periods=len(cached['values']))
+            daily = pd.DataFrame(cached['values'], index=index,\
+                columns=DAILY_COLUMNS)
+
+    if daily is None:
+        daily = _parse_weather_csv(filename)
+        np.savez(cache_file, values=daily.values.astype(float),\
+            first_day=np.datetime64(daily.index[0], 'D'), stamp=stamp)
+
+    _daily[filename] = (stamp, daily)
+    return daily
+
+def add_window_features(daily, windows=PRECIP_WINDOWS):
+    '''
+    INPUT: df from load_daily_weather, list of int
+    OUTPUT: df
+    Add the previous day's values (suffix _lag1) and trailing precipitation
+    totals over each window, the day itself included (Precip_3d, ...).
+    '''
+    daily = daily.copy()
+    for col in DAILY_COLUMNS:
+        daily[col + '_lag1'] = daily[col].shift(1)
+    for window in windows:
+        daily['Precip_%dd' % window] = daily['Precip'].rolling(window,\
+            min_periods=1).sum()
+    return daily
+
+def attach_weather(df, columns, date_col='INITDT_dt', daily=None):
+    '''
+    INPUT: df, list of column names, str, df or None
+    OUTPUT: df
+    Add each row's daily weather.  The table covers every day in its range,
+    so a row's day maps straight to a position; days outside the range or
+    missing dates get NaN.
+    '''
+    if daily is None:
+        daily = add_window_features(load_daily_weather())
+
+    days = df[date_col].values.astype('datetime64[D]')
+    pos = (days - np.datetime64(daily.index[0], 'D')).astype(np.int64)
+    known = ~np.isnat(days) & (pos >= 0) & (pos < len(daily))
+
+    for col in columns:
+        values = np.empty(len(df))
+        values.fill(np.nan)
+        values[known] = daily[col].values[pos[known]]
+        df[col] = values
+
+    return df
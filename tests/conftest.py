@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules under test are flat scripts run from their own directories
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _dir in ('source', 'clean'):
+    sys.path.insert(0, os.path.join(_ROOT, _dir))
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from addresses import normalize_address, location_keys
+
+def test_spelling_variants_share_a_key():
+    variants = ['12th Avenue NE between NE 45th Street and NE 47th St',
+                '12TH AVE NE BTWN NE 47TH ST & NE 45TH ST',
+                "12th Ave. Northeast bet. NE 45th St / Northeast 47th Street"]
+    keys = set(normalize_address(text) for text in variants)
+    assert keys == set(['12TH AVE NE BETWEEN NE 45TH ST AND NE 47TH ST'])
+
+def test_intersections_sort_their_streets():
+    assert normalize_address('Pine Street & Third Avenue') ==\
+        normalize_address('3rd Ave and Pine St') == '3RD AVE AND PINE ST'
+    assert normalize_address('Pine St&3rd Ave') == '3RD AVE AND PINE ST'
+
+def test_single_street_is_abbreviated():
+    assert normalize_address("Martin Luther King Jr Way South") ==\
+        'MARTIN LUTHER KING JR WAY S'
+    assert normalize_address('First Avenue') == '1ST AVE'
+
+def test_missing_addresses_get_no_key():
+    assert normalize_address(np.nan) is None
+    assert normalize_address(None) is None
+    assert normalize_address(' ., ') is None
+
+def test_location_keys_dedup_ratio_counts_keyed_rows():
+    addrdescs = pd.Series(['Pine St & 3rd Ave', '3RD AVENUE AND PINE STREET',
+        'First Avenue', '1st Ave', '1ST AVE', np.nan, None])
+    keys, ratio = location_keys(addrdescs)
+    assert keys.isnull().tolist() == [False] * 5 + [True] * 2
+    assert keys.nunique() == 2
+    assert ratio == 2.5
+    assert location_keys(pd.Series([np.nan]))[1] == 1.
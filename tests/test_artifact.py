@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+import artifact
+import build_models
+from synthetic import make_feature_frame
+
+PREDICTORS = build_models.BASE_PREDICTORS
+
+@pytest.fixture
+def saved():
+    tmp = tempfile.mkdtemp()
+    df = make_feature_frame(2000)
+    df['long_repair'] = (df['DURATION_td'] > 3).astype(int)
+    model = RandomForestClassifier(n_estimators=5, random_state=0)\
+        .fit(df[PREDICTORS].values, df['long_repair'].values)
+    path = artifact.save_artifact('rf', model, df, PREDICTORS, 'long_repair',\
+        categoricals=['neighborhood_label'], root=tmp)
+    yield path, model, df
+    shutil.rmtree(tmp)
+
+def test_loaded_model_predicts_the_same(saved):
+    path, model, df = saved
+    X = df[PREDICTORS].values
+    for loaded in [artifact.load_artifact(path),\
+        artifact.load_artifact(path, mmap=False),\
+        artifact.load_artifact('rf', root=os.path.dirname(os.path.dirname(path)),\
+            verify=True)]:
+        assert loaded.features == PREDICTORS
+        assert np.array_equal(loaded.model.predict_proba(X), model.predict_proba(X))
+    artifact.load_artifact(path).check_frame(df)
+
+def test_drifted_data_is_refused(saved):
+    path, model, df = saved
+    loaded = artifact.load_artifact(path)
+    drifted = df.copy()
+    drifted['Temp'] = drifted['Temp'].astype(str)
+    with pytest.raises(artifact.SchemaError):
+        loaded.check_frame(drifted)
+    with pytest.raises(artifact.SchemaError):
+        loaded.check_frame(df.assign(neighborhood_label=df['neighborhood_label'] + 1))
+    with pytest.raises(artifact.SchemaError):
+        loaded.check_frame(df.drop('Temp', axis=1))
+    with pytest.raises(artifact.SchemaError):
+        artifact.load_artifact(path, features=PREDICTORS[::-1])
+
+def test_changed_estimator_file_is_refused(saved):
+    path, model, df = saved
+    estimator = os.path.join(path, artifact.ESTIMATOR_FILE)
+    with open(estimator, 'r+b') as f:
+        f.seek(100)
+        byte = f.read(1)
+        f.seek(100)
+        f.write(bytes(bytearray([ord(byte) ^ 0xff])))
+    # Same size: only caught by the checksum
+    with pytest.raises(artifact.SchemaError):
+        artifact.load_artifact(path, verify=True)
+    with open(estimator, 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(artifact.SchemaError):
+        artifact.load_artifact(path)
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from backlog import BacklogCounter, WorkOrderIndex
+from synthetic import make_work_orders
+from reference import legacy_cumul_potholes
+
+def test_backlog_matches_legacy():
+    df = make_work_orders(300)
+    expected = legacy_cumul_potholes(df)
+    backlog = BacklogCounter()
+    backlog.add(df['INITDT_dt'].values, df['DURATION'].values)
+    assert np.array_equal(backlog.active_on(expected['INITDT_date_only'].values),\
+        expected['cumul_potholes'].values)
+
+def test_backlog_added_in_batches_matches_one_pass():
+    df = make_work_orders(2000)
+    days = pd.date_range('2009-12-25', '2011-02-01', freq='D').values
+    whole = BacklogCounter()
+    whole.add(df['INITDT_dt'].values, df['DURATION'].values)
+    batched = BacklogCounter()
+    for batch in np.array_split(np.arange(len(df))[::-1], 4):
+        batched.add(df['INITDT_dt'].values[batch], df['DURATION'].values[batch])
+    assert np.array_equal(batched.active_on(days), whole.active_on(days))
+
+def _work_orders_with_open(n):
+    rng = np.random.RandomState(10)
+    df = make_work_orders(n, days=3 * 365)
+    df['neighborhood_label'] = rng.randint(1, 30, n)
+    df.loc[df.index[:20], 'FLDENDDT_dt'] = pd.NaT
+    return df
+
+def _is_open(df, t):
+    start, end = df['INITDT_dt'], df['FLDENDDT_dt']
+    return (start <= t) & ((end > t) | end.isnull())
+
+def test_open_at_matches_scan():
+    df = _work_orders_with_open(5000)
+    index = WorkOrderIndex(df, groups=['neighborhood_label'])
+    times = pd.Timestamp('2010-01-01') + pd.to_timedelta(\
+        np.random.RandomState(11).randint(0, 3 * 365 * 24, 50), unit='h')
+    assert list(index.open_at(times)) == [_is_open(df, t).sum() for t in times]
+
+    t = times[0]
+    by_hood = index.open_at([t], by='neighborhood_label').iloc[0]
+    scanned = df[_is_open(df, t)].groupby('neighborhood_label').size()\
+        .reindex(by_hood.index, fill_value=0)
+    assert np.array_equal(by_hood.values, scanned.values)
+
+    # A single time gives a single count, or one per group
+    assert index.open_at(t) == _is_open(df, t).sum()
+    assert np.array_equal(index.open_at(t, by='neighborhood_label').values,\
+        scanned.values)
+
+def test_open_during_and_breached_match_scan():
+    df = _work_orders_with_open(5000)
+    index = WorkOrderIndex(df)
+    start, end = df['INITDT_dt'], df['FLDENDDT_dt']
+    lo = pd.Timestamp('2011-03-07')
+    hi = lo + pd.Timedelta(days=7)
+    during = df.index[(start < hi) & ((end > lo) | end.isnull())]
+    assert sorted(index.open_during(lo, hi)) == sorted(during)
+
+    sla = pd.Timedelta(days=3)
+    due = start + sla
+    breached = df.index[(due >= lo) & (due < hi) & ((end > due) | end.isnull())]
+    assert sorted(index.breached(lo, hi, sla)) == sorted(breached)
+
+def test_grouped_open_during_and_breached_match_scan():
+    df = _work_orders_with_open(5000)
+    df.loc[df.index[::40], 'neighborhood_label'] = np.nan
+    index = WorkOrderIndex(df, groups=['neighborhood_label'])
+    lo = pd.Timestamp('2011-03-07')
+    hi = lo + pd.Timedelta(days=7)
+    levels = sorted(df['neighborhood_label'].dropna().unique())
+
+    for grouped, flat in [\
+        (index.open_during(lo, hi, by='neighborhood_label'),\
+            index.open_during(lo, hi)),\
+        (index.breached(lo, hi, by='neighborhood_label'),\
+            index.breached(lo, hi))]:
+        assert list(grouped) == levels
+        hoods = df.loc[flat, 'neighborhood_label']
+        for level in levels:
+            assert sorted(grouped[level]) == sorted(hoods.index[hoods == level])
@@ -0,0 +1,66 @@
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import build_models
+import create_features
+import storage
+from schema import compact_frame
+from synthetic import make_feature_frame
+
+def _features(n=2000):
+    '''A frame with every column create_features.py writes.'''
+    rng = np.random.RandomState(5)
+    df = make_feature_frame(n)
+    df['DURATION_td'] = np.floor(df['DURATION'] / np.timedelta64(1, 'D'))
+    df['INITDT_date_only'] = df['INITDT_dt'].dt.normalize()
+    for col in ['WOKEY', 'LOCATION', 'address']:
+        df[col] = ['%s%d' % (col, i) for i in range(n)]
+    for col in create_features.LANDMARKS:
+        df[col] = rng.rand(n)
+    for col in create_features.WEATHER_FEATURES:
+        df[col] = rng.rand(n)
+    for col in create_features.NEIGHBOR_FEATURES:
+        df[col] = rng.rand(n)
+    df['b_weekend?'] = rng.rand(n) < 0.3
+    df['wkdy_or_wknd'] = np.where(df['b_weekend?'], 'weekend', 'weekday')
+    df['SEGMENT_TY'] = rng.randint(1, 12, n)
+    df['DIVIDED_CO'] = rng.randint(0, 3, n)
+    df['VEHICLE_US'] = rng.randint(0, 4, n)
+
+    # Gaps the final cleaning fills or drops
+    df['neighborhood_label'] = df['neighborhood_label'].astype(object)
+    df.loc[df.index[::11], 'neighborhood_label'] = ''
+    df['SND_FEACOD'] = df['SND_FEACOD'].astype(float)
+    df.loc[df.index[::13], 'SND_FEACOD'] = np.nan
+    df.loc[df.index[::17], 'ST_CODE'] = np.nan
+    df.loc[df.index[::7], 'Precip'] = np.nan
+    df.loc[df.index[::5], 'nearby_repair_days'] = np.nan
+    return df
+
+def test_prep_reads_the_compacted_store():
+    df = _features()
+    expected = build_models.clean_prep_before_model(df.copy())
+    compact, _ = compact_frame(df)
+    assert 'DURATION' not in compact
+    tmp = tempfile.mkdtemp()
+    try:
+        storage.write_frame(compact, 'features', root=tmp)
+        prepped = build_models.clean_prep_before_model(root=tmp)
+    finally:
+        shutil.rmtree(tmp)
+
+    assert sorted(prepped.index) == sorted(expected.index)
+    assert sorted(prepped.columns) == sorted(expected.columns)
+    prepped = prepped.loc[expected.index]
+    assert not prepped.isnull().values.any()
+    for col in expected.columns:
+        kind = expected[col].dtype.kind
+        if kind in 'mM':
+            assert (prepped[col].values == expected[col].values).all(), col
+        elif kind in 'biuf':
+            assert np.allclose(prepped[col].values.astype(float),\
+                expected[col].values.astype(float), rtol=1e-6), col
+        else:
+            assert (prepped[col].astype(str).values ==\
+                expected[col].astype(str).values).all(), col
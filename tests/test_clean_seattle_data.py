@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import storage
+import clean_seattle_data
+from synthetic import make_raw_csv
+from reference import legacy_clean_count
+
+def test_streamed_clean_keeps_the_same_rows():
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'Pothole_Repairs_Seattle.csv')
+        make_raw_csv(filename, 5000)
+        # The first chunk has no LOCATION text at all
+        raw = pd.read_csv(filename, dtype=str)
+        raw.loc[:699, 'LOCATION'] = np.nan
+        raw.to_csv(filename, index=False)
+        expected = legacy_clean_count(filename)
+
+        whole = clean_seattle_data.clean_data(filename, root=tmp)
+        whole_df = storage.read_frame('all_cleaned', root=tmp)
+        streamed = clean_seattle_data.clean_data(filename, chunksize=700,\
+            root=tmp)
+        streamed_df = storage.read_frame('all_cleaned', root=tmp)
+
+        assert whole == streamed == expected
+        assert len(streamed_df) == expected
+        pd.testing.assert_frame_equal(streamed_df.sort_index(),\
+            whole_df.sort_index())
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import create_features
+from synthetic import make_work_orders
+from reference import legacy_calendar_features
+
+def test_calendar_features_match_legacy_except_intended_fixes():
+    df = make_work_orders(1000, days=3 * 365)
+    old = legacy_calendar_features(df)
+    new = create_features.create_calendar_features(df.copy())
+
+    for col in ['INIT_Quarter', 'INIT_month', 'dayofwk']:
+        assert np.array_equal(new[col].values, old[col].values)
+
+    # The fiscal year count wraps instead of going negative after June
+    assert np.array_equal(new['months_end_FY'].values,\
+        old['months_end_FY'].values % 12)
+
+    # Saturday is weekend now
+    saturday = (old['dayofwk'] == 5).values
+    assert np.array_equal(new['b_weekend?'].values,\
+        old['b_weekend?'].values | saturday)
+    assert np.array_equal(new['wkdy_or_wknd'].values,\
+        np.where(saturday, 'weekend', old['wkdy_or_wknd'].values))
+
+    # Days to the next Saturday, Sunday or federal holiday, 0 on them;
+    # the legacy count was days to Sunday
+    dates = df['INITDT_dt'].dt.normalize()
+    holidays = set(create_features.HOLIDAY_CALENDAR.holidays(dates.min(),\
+        dates.max() + pd.Timedelta(days=7)))
+    to_holiday = []
+    for date in dates:
+        k = 0
+        while date + pd.Timedelta(days=k) not in holidays and k < 7:
+            k += 1
+        to_holiday.append(k)
+    weekend = new['b_weekend?'].values
+    expected = np.where(weekend, 0, np.minimum(old['days_from_wknd'].values - 1,\
+        to_holiday))
+    assert np.array_equal(new['days_from_wknd'].values, expected)
+    assert np.array_equal(new['b_holiday'].values,\
+        np.array([date in holidays for date in dates]) & ~weekend)
@@ -0,0 +1,26 @@
+import numpy as np
+from geopy.distance import vincenty
+from distances import vincenty_miles, vincenty_miles_point
+from synthetic import make_pothole_coords
+
+ORIGINS = [(47.6062095, -122.3320708), (47.5480, -122.3230)]
+
+def test_vincenty_matches_geopy():
+    lons, lats = make_pothole_coords(300)
+    dists = vincenty_miles(lats, lons, ORIGINS)
+    expected = np.array([[vincenty(origin, (lat, lon)).miles\
+        for origin in ORIGINS] for lat, lon in zip(lats, lons)])
+    assert np.abs(dists - expected).max() < 1e-6
+    points = np.array([vincenty_miles_point(lat, lon, ORIGINS)\
+        for lat, lon in zip(lats, lons)])
+    assert np.abs(points - expected).max() < 1e-6
+
+def test_missing_coordinates_give_nan():
+    lons, lats = make_pothole_coords(10)
+    lats[3] = np.nan
+    dists = vincenty_miles(lats, lons, ORIGINS)
+    assert np.isnan(dists[3]).all()
+    assert np.isfinite(np.delete(dists, 3, axis=0)).all()
+    assert np.allclose(np.delete(dists, 3, axis=0), vincenty_miles(\
+        np.delete(lats, 3), np.delete(lons, 3), ORIGINS), rtol=0, atol=1e-9)
+    assert np.isnan(vincenty_miles_point(np.nan, lons[0], ORIGINS)).all()
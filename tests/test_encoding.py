@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import build_models
+from encoding import CategoricalEncoder, OTHER
+from synthetic import make_feature_frame
+from reference import legacy_dummies
+
+def _frame(n):
+    rng = np.random.RandomState(9)
+    df = make_feature_frame(n)
+    df['SEGMENT_TY'] = rng.randint(1, 12, n)
+    df['DIVIDED_CO'] = rng.randint(0, 3, n)
+    df['VEHICLE_US'] = rng.randint(0, 4, n)
+    return df
+
+def test_same_matrix_as_get_dummies():
+    df = _frame(3000)
+    columns = build_models.CATEGORICALS
+    dense = legacy_dummies(df, columns)
+    encoder = CategoricalEncoder(columns, numeric=build_models.BASE_PREDICTORS,\
+        min_count=1)
+    X = encoder.fit_transform(df)
+
+    # get_dummies orders levels as sorted numbers, the encoder as sorted
+    # text; compare each indicator column by name
+    position = dict((name, i) for i, name in enumerate(encoder.feature_names))
+    dense_names = list(build_models.BASE_PREDICTORS) + ['%s=%s' % (col, level)\
+        for col in columns for level in pd.get_dummies(df[col]).columns]
+    order = [position[name] for name in dense_names]
+    assert np.array_equal(X.toarray()[:, order], dense.values.astype(float))
+    # Only the 'other' slots are left over, and they are empty
+    others = [position['%s=%s' % (col, OTHER)] for col in columns]
+    assert sorted(set(range(X.shape[1])) - set(order)) == sorted(others)
+    assert X[:, others].nnz == 0
+
+def test_layout_is_fixed_when_fit():
+    df = _frame(3000)
+    encoder = CategoricalEncoder(['ST_CODE'], numeric=['Temp']).fit(df)
+    counts = df['ST_CODE'].value_counts()
+    assert encoder.vocabularies['ST_CODE'] ==\
+        sorted(counts.index[counts >= encoder.min_count])
+
+    # Rare, unseen and missing levels all go to the 'other' slot
+    sample = df.iloc[:50].copy()
+    sample.loc[sample.index[0], 'ST_CODE'] = 'never seen'
+    sample.loc[sample.index[1], 'ST_CODE'] = None
+    X = encoder.transform(sample)
+    assert X.shape == (50, encoder.n_features)
+    assert X[0, 1] == 1 and X[1, 1] == 1
+    assert np.allclose(np.asarray(X.sum(axis=1)).ravel(),\
+        sample['Temp'].values + 1)
+
+def test_hashed_width():
+    df = _frame(1000)
+    X = CategoricalEncoder(build_models.CATEGORICALS,\
+        numeric=build_models.BASE_PREDICTORS, n_hash=64).fit_transform(df)
+    assert X.shape == (1000, len(build_models.BASE_PREDICTORS) + 64)
+    assert np.allclose(np.asarray(X[:, len(build_models.BASE_PREDICTORS):]\
+        .sum(axis=1)).ravel(), len(build_models.CATEGORICALS))
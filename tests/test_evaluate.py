@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import evaluate
+import build_models
+from encoding import CategoricalEncoder
+from synthetic import make_feature_frame
+
+class RecordingEncoder(CategoricalEncoder):
+    '''Notes the rows of every fit and transform.'''
+    calls = []
+
+    def fit(self, df):
+        RecordingEncoder.calls.append(('fit', sorted(df.index)))
+        return CategoricalEncoder.fit(self, df)
+
+    def transform(self, df):
+        RecordingEncoder.calls.append(('transform', sorted(df.index)))
+        return CategoricalEncoder.transform(self, df)
+
+def _frame(n=1200):
+    df = make_feature_frame(n)
+    df['long_repair'] = (df['DURATION_td'] > 3).astype(int)
+    return df
+
+def test_encoder_is_fit_per_fold_on_training_rows():
+    df = _frame()
+    folds = evaluate.make_folds(df, n_folds=3)
+    encoder = RecordingEncoder(['ST_CODE', 'SND_FEACOD'], numeric=['Temp'])
+    RecordingEncoder.calls = []
+    estimators = {'logit': build_models.model_estimators()['logit']}
+    results = evaluate.evaluate(df, {'encoded': encoder}, estimators,\
+        'long_repair', folds, n_workers=1)
+
+    assert len(results) == 3
+    assert encoder.vocabularies is None
+    fits = [rows for kind, rows in RecordingEncoder.calls if kind == 'fit']
+    tests = [rows for kind, rows in RecordingEncoder.calls if kind ==\
+        'transform' and len(rows) < len(df) / 2]
+    assert fits == [sorted(df.index[train]) for train, _ in folds]
+    assert tests == [sorted(df.index[test]) for _, test in folds]
+
+def test_parallel_results_match_serial():
+    df = _frame()
+    folds = evaluate.make_folds(df, n_folds=3, time_col='INITDT_dt')
+    feature_sets = {'base': ['Temp', 'min_dist', 'cumul_potholes'],\
+        'encoded': CategoricalEncoder(['ST_CODE'], numeric=['Temp'])}
+    estimators = {'logit': build_models.model_estimators()['logit']}
+    serial = evaluate.evaluate(df, feature_sets, estimators, 'long_repair',\
+        folds, n_workers=1)
+    parallel = evaluate.evaluate(df, feature_sets, estimators, 'long_repair',\
+        folds, n_workers=2)
+    columns = ['feature_set', 'estimator', 'fold', 'auc', 'log_loss']
+    key = ['feature_set', 'fold']
+    pd.testing.assert_frame_equal(\
+        serial[columns].sort_values(key).reset_index(drop=True),\
+        parallel[columns].sort_values(key).reset_index(drop=True))
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import pytest
+from geopy.exc import GeocoderQuotaExceeded
+from geocode import GeocodeCache, StubGeocoder, geocode_addresses
+
+KEYS = ['%d AVE NE AND NE %dTH ST' % (i % 30, i % 7) for i in range(300)]
+
+@pytest.fixture
+def cache():
+    tmp = tempfile.mkdtemp()
+    cache = GeocodeCache(os.path.join(tmp, 'geocodes.sqlite'))
+    yield cache
+    cache.close()
+    shutil.rmtree(tmp)
+
+def _run(keys, geolocator, cache):
+    return geocode_addresses(keys, geolocator, cache, n_workers=4, rate=1e6,\
+        backoff=0.001, checkpoint_every=10)
+
+def test_each_key_is_looked_up_once(cache):
+    unique = len(set(KEYS))
+    geolocator = StubGeocoder(latency=0)
+    stats = _run(KEYS, geolocator, cache)
+    assert geolocator.calls == unique
+    assert stats['requested'] == stats['found'] == unique
+    assert len(cache.lookup(KEYS)) == unique
+    assert cache.lookup(KEYS[:1])[KEYS[0]] == tuple(geolocator.geocode(\
+        KEYS[0] + ' Seattle'))
+
+    # A rerun is served from the cache
+    again = StubGeocoder(latency=0)
+    assert _run(KEYS, again, cache)['requested'] == 0
+    assert again.calls == 0
+
+def test_timeouts_are_retried(cache):
+    geolocator = StubGeocoder(latency=0, timeout_rate=0.3)
+    stats = _run(KEYS, geolocator, cache)
+    assert geolocator.calls > len(set(KEYS))
+    assert stats['found'] + stats['failed'] == len(set(KEYS))
+    assert stats['failed'] < 5
+    assert len(cache.lookup(KEYS)) == stats['found']
+
+def test_quota_error_stops_the_run_and_is_resumable(cache):
+    unique = len(set(KEYS))
+    geolocator = StubGeocoder(latency=0.001, quota_rate=0.05, seed=1)
+    with pytest.raises(GeocoderQuotaExceeded):
+        _run(KEYS, geolocator, cache)
+    # No retries, and nothing sent once the first quota error is in
+    # beyond what the other workers already had in flight
+    done = len(cache.lookup(KEYS))
+    assert done < unique
+    assert geolocator.calls <= done + 4
+
+    resumed = StubGeocoder(latency=0)
+    stats = _run(KEYS, resumed, cache)
+    assert stats['requested'] == resumed.calls == unique - done
+    assert len(cache.lookup(KEYS)) == unique
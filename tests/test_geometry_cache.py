@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import pytest
+from shapely.geometry import shape
+import create_features
+import geometry_cache
+import projection
+from projection import project_geometry
+from synthetic import write_street_shapefile
+
+fiona = pytest.importorskip('fiona')
+
+def _load(shapefilename):
+    # A fresh run: nothing held in memory
+    geometry_cache._tables.clear()
+    return geometry_cache.load_shapefile(shapefilename, projected=True)
+
+def _cache_mtime(shapefilename):
+    return os.path.getmtime(os.path.join(shapefilename +\
+        geometry_cache.GEOMETRY_CACHE_SUFFIX, 'projected', 'wkb.npy'))
+
+def test_cache_matches_shapefile_and_follows_edits(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        shapefilename = os.path.join(tmp, 'streets')
+        write_street_shapefile(shapefilename, 10)
+        with fiona.open(shapefilename + '.shp') as shp:
+            features = list(shp)
+        direct = [project_geometry(shape(feature['geometry'])) for feature in\
+            features]
+
+        _load(shapefilename)
+        table = _load(shapefilename)
+        geoms = table.geometries()
+        assert len(geoms) == len(direct) == 220
+        assert all(a.equals_exact(b, 0) for a, b in zip(geoms, direct))
+        for field in create_features.STREET_FEATURES:
+            assert table.field(field) == [feature['properties'][field] for\
+                feature in features]
+        assert table.bounds == tuple(geometry_cache._parse_shapefile(\
+            shapefilename, True).bounds)
+
+        # Touched but unchanged: rehashed, not reparsed
+        written = _cache_mtime(shapefilename)
+        os.utime(shapefilename + '.shp', None)
+        assert len(_load(shapefilename)) == 220
+        assert _cache_mtime(shapefilename) == written
+
+        # Other projection parameters: reprojected
+        monkeypatch.setattr(projection, '_X_0', projection._X_0 + 1.)
+        _load(shapefilename)
+        assert _cache_mtime(shapefilename) != written
+        monkeypatch.undo()
+        _load(shapefilename)
+        written = _cache_mtime(shapefilename)
+        os.utime(shapefilename + '.shp', None)
+        _load(shapefilename)
+        assert _cache_mtime(shapefilename) == written
+
+        write_street_shapefile(shapefilename, 5)
+        assert len(_load(shapefilename)) == 60
+        assert len(geometry_cache.load_shapefile(shapefilename)) == 60
+    finally:
+        shutil.rmtree(tmp)
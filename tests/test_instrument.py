@@ -0,0 +1,41 @@
+import sys
+import time
+import multiprocessing
+import pytest
+import instrument
+
+def _spin(seconds, busy, stop):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    busy.set()
+    stop.wait()
+
+def test_cpu_time_counts_live_children():
+    if not sys.platform.startswith('linux') and instrument.psutil is None:
+        pytest.skip('no way to read a running child process')
+    busy, stop = multiprocessing.Event(), multiprocessing.Event()
+    before = instrument._cpu_seconds()
+    worker = multiprocessing.Process(target=_spin, args=(0.5, busy, stop))
+    worker.start()
+    try:
+        assert busy.wait(10)
+        # The worker has not exited, yet its time is counted
+        assert instrument._cpu_seconds() - before >= 0.4
+    finally:
+        stop.set()
+        worker.join()
+
+def test_step_is_recorded_without_resource(monkeypatch, tmpdir):
+    monkeypatch.setattr(instrument, 'resource', None)
+    monkeypatch.setattr(instrument, 'psutil', None)
+    monkeypatch.setattr(instrument, '_reset_peak_rss', lambda: False)
+    log = instrument.RunLog(str(tmpdir.join('run.jsonl')), run_id='test')
+    with log.step('spin', rows_in=3) as record:
+        end = time.time() + 0.2
+        while time.time() < end:
+            pass
+        record['rows_out'] = 3
+    step = instrument.read_run(log.filename)['spin']
+    assert step['cpu_s'] >= 0.1
+    assert step['rows_out'] == 3
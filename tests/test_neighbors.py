@@ -0,0 +1,31 @@
+import numpy as np
+from neighbors import NEIGHBOR_RADIUS, WINDOW_DAYS, neighbor_features
+from projection import project, add_projected_coords
+from synthetic import make_work_orders, make_pothole_coords
+
+def test_neighbor_features_match_pairwise_loop():
+    n = 1500
+    df = make_work_orders(n, days=100)
+    lons, lats = make_pothole_coords(n)
+    # Squeeze into a few square kilometres so most potholes have neighbours
+    df['longitude'] = -122.33 + (lons + 122.33) * 0.05
+    df['latitude'] = 47.6 + (lats - 47.6) * 0.05
+    df['DURATION_td'] = np.floor(df['DURATION'] / np.timedelta64(1, 'D'))
+    features = neighbor_features(add_projected_coords(df))
+
+    xy = np.column_stack(project(df['longitude'].values, df['latitude'].values))
+    init, end = df['INITDT_dt'].values, df['FLDENDDT_dt'].values
+    window = np.timedelta64(WINDOW_DAYS, 'D')
+    counts, mean_days = [], []
+    for i in range(n):
+        near = (np.hypot(*(xy - xy[i]).T) <= NEIGHBOR_RADIUS) &\
+            (init < init[i]) & (init >= init[i] - window)
+        repaired = near & (end <= init[i])
+        counts.append(near.sum())
+        mean_days.append(df['DURATION_td'].values[repaired].mean() if\
+            repaired.any() else np.nan)
+
+    assert features['nearby_potholes'].mean() > 1
+    assert np.array_equal(features['nearby_potholes'].values, counts)
+    assert np.allclose(features['nearby_repair_days'].values, mean_days,\
+        equal_nan=True)
@@ -0,0 +1,40 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pytest
+import create_features
+from pipeline import Stage
+from parallel import ParallelRunner
+from synthetic import make_potholes
+
+def load_offset():
+    return 10.
+
+def add_offset_distance(df, offset=None):
+    df['offset_dist'] = create_features.create_distances(df)['min_dist'] +\
+        offset
+    return df
+
+STAGES = [s for s in create_features.STAGES if s.name in\
+    ('distances', 'calendar')] + [Stage('offset', add_offset_distance,\
+    ['latitude', 'longitude'], ['offset_dist'],\
+    resources={'offset': load_offset})]
+
+def _check_matches_serial(context=None):
+    df = make_potholes(5000)
+    with ParallelRunner(STAGES, n_workers=2, chunk_rows=700,\
+        context=context) as runner:
+        for stage in STAGES:
+            inputs = df[stage.inputs].copy()
+            serial = stage.func(inputs.copy(), **dict((name, loader())\
+                for name, loader in stage.resources.items()))[stage.outputs]
+            parallel = runner.apply(stage, inputs)
+            pd.testing.assert_frame_equal(parallel, serial)
+
+def test_parallel_matches_serial():
+    _check_matches_serial()
+
+def test_parallel_matches_serial_when_spawned():
+    if not hasattr(multiprocessing, 'get_context'):
+        pytest.skip('no start methods to choose from')
+    _check_matches_serial(multiprocessing.get_context('spawn'))
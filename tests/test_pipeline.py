@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+import pipeline
+import create_features
+from pipeline import Stage, run_stage
+from projection import X_COL, Y_COL, add_projected_coords
+from synthetic import make_work_orders, make_pothole_coords
+
+SCALE = 2.
+
+class Calls(object):
+    '''Rows passed to each call of the stage functions below.'''
+    rows = []
+
+
+def _scaled(value):
+    return value * SCALE
+
+def add_scaled(df, offset=0.):
+    Calls.rows.append(len(df))
+    df['scaled'] = _scaled(df['x']) + offset
+    return df
+
+def add_backlog(df):
+    Calls.rows.append(len(df))
+    return create_features.get_pothole_count(df)
+
+def add_neighbors(df):
+    Calls.rows.append(len(df))
+    return create_features.get_neighbor_features(df)
+
+@pytest.fixture
+def cache_dir():
+    tmp = tempfile.mkdtemp()
+    Calls.rows = []
+    yield tmp
+    shutil.rmtree(tmp)
+
+def _shards(cache_dir, stage):
+    return sorted(name for name in os.listdir(os.path.join(cache_dir,\
+        stage.name)) if name.endswith('.pkl'))
+
+def test_fingerprint_follows_constants_defaults_and_helpers(monkeypatch):
+    stage = Stage('scaled', add_scaled, ['x'], ['scaled'])
+    base = stage.fingerprint()
+    assert Stage('scaled', add_scaled, ['x'], ['scaled']).fingerprint() == base
+
+    monkeypatch.setattr(add_scaled, '__defaults__', (1.,))
+    assert stage.fingerprint() != base
+    monkeypatch.undo()
+
+    monkeypatch.setattr(__import__(__name__), 'SCALE', 3.)
+    assert stage.fingerprint() != base
+    monkeypatch.undo()
+
+    assert Stage('scaled', add_scaled, ['x'], ['scaled'], version=1)\
+        .fingerprint() != base
+
+    # A data global of create_features, and the source of the modules it
+    # calls into
+    distances = [s for s in create_features.STAGES if s.name == 'distances'][0]
+    before = distances.fingerprint()
+    name = list(create_features.LANDMARKS)[0]
+    monkeypatch.setitem(create_features.LANDMARKS, name, (47.6, -122.3))
+    assert distances.fingerprint() != before
+    monkeypatch.undo()
+
+    file_hash = pipeline._file_hash
+    monkeypatch.setattr(pipeline, '_file_hash', lambda filename: 'edited'\
+        if filename.endswith('distances.py') else file_hash(filename))
+    assert distances.fingerprint() != before
+
+def test_row_local_cache_computes_new_rows_and_evicts(cache_dir):
+    stage = Stage('scaled', add_scaled, ['x'], ['scaled'])
+    df = pd.DataFrame({'x': np.arange(1000.)})
+    out = run_stage(df.copy(), stage, cache_dir)
+    assert (out['scaled'] == 2 * df['x']).all()
+    run_stage(df.copy(), stage, cache_dir)
+    assert Calls.rows == [1000]
+    assert len(_shards(cache_dir, stage)) == 1
+
+    # New rows only; the first shard is left as it is
+    more = pd.DataFrame({'x': np.arange(1000., 1100.)})
+    out = run_stage(pd.concat([df, more], ignore_index=True), stage, cache_dir)
+    assert Calls.rows == [1000, 100]
+    assert len(_shards(cache_dir, stage)) == 2
+    assert (out['scaled'] == 2 * out['x']).all()
+
+    # Most rows gone: the mostly dead shard is folded away, the one with
+    # no rows left deleted
+    out = run_stage(df.iloc[:300].copy(), stage, cache_dir)
+    assert Calls.rows == [1000, 100]
+    assert (out['scaled'] == 2 * out['x']).all()
+    shards = _shards(cache_dir, stage)
+    assert len(shards) == 1
+    assert len(pipeline._read_shard(os.path.join(cache_dir, stage.name),\
+        shards[0][:-4])) == 300
+
+def test_changed_code_empties_the_stage_cache(cache_dir, monkeypatch):
+    stage = Stage('scaled', add_scaled, ['x'], ['scaled'])
+    df = pd.DataFrame({'x': np.arange(10.)})
+    run_stage(df.copy(), stage, cache_dir)
+    monkeypatch.setattr(__import__(__name__), 'SCALE', 3.)
+    out = run_stage(df.copy(), stage, cache_dir)
+    assert Calls.rows == [10, 10]
+    assert (out['scaled'] == 3 * df['x']).all()
+    assert len(_shards(cache_dir, stage)) == 1
+
+def _orders(n, seed, start='2010-01-01'):
+    df = make_work_orders(n, start=start, days=365, seed=seed)
+    df['longitude'], df['latitude'] = make_pothole_coords(n, seed=seed)
+    df = add_projected_coords(df)
+    return df
+
+def _check_bucketed(stage, fresh, cache_dir, gaps=False):
+    early = _orders(4000, seed=1)
+    later = _orders(400, seed=2, start='2011-01-01')
+    later['OBJECTID'] += len(early)
+    if gaps:
+        later.loc[::50, 'FLDENDDT_dt'] = pd.NaT
+        later.loc[::70, 'INITDT_dt'] = pd.NaT
+    both = pd.concat([early, later], ignore_index=True)
+
+    run_stage(early.copy(), stage, cache_dir)
+    out = run_stage(both.copy(), stage, cache_dir)
+    expected = fresh(both.copy())
+    for col in stage.outputs:
+        pd.testing.assert_series_equal(out[col], expected[col],\
+            check_dtype=False, check_names=False)
+
+    # Only the buckets reached by the new orders were rerun, with the
+    # few weeks of context before them
+    assert Calls.rows[0] == len(early)
+    assert Calls.rows[1] < len(both) / 3
+
+    run_stage(both.copy(), stage, cache_dir)
+    assert len(Calls.rows) == 2
+
+    # Dropped rows rerun their buckets and evict the stale shards
+    shards = len(_shards(cache_dir, stage))
+    kept = both.iloc[500:].copy()
+    out = run_stage(kept.copy(), stage, cache_dir)
+    expected = fresh(kept.copy())
+    for col in stage.outputs:
+        pd.testing.assert_series_equal(out[col], expected[col],\
+            check_dtype=False, check_names=False)
+    assert len(_shards(cache_dir, stage)) <= shards
+
+def test_backlog_stage_reruns_only_touched_buckets(cache_dir):
+    stage = Stage('backlog', add_backlog, ['OBJECTID','INITDT_dt','DURATION'],\
+        ['INITDT_date_only','Number_potholes','cumul_potholes'],\
+        row_local=False, time_column='INITDT_dt', end_column='DURATION')
+    _check_bucketed(stage, create_features.get_pothole_count, cache_dir)
+
+def test_neighbor_stage_reruns_only_touched_buckets(cache_dir):
+    stage = Stage('near', add_neighbors, [X_COL, Y_COL, 'INITDT_dt', 'FLDENDDT_dt',\
+        'DURATION_td'], create_features.NEIGHBOR_FEATURES, row_local=False,\
+        time_column='INITDT_dt', lookback_days=create_features.WINDOW_DAYS)
+    _check_bucketed(stage, create_features.get_neighbor_features, cache_dir,\
+        gaps=True)
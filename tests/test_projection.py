@@ -0,0 +1,32 @@
+import numpy as np
+from shapely.geometry import Polygon
+from projection import project, project_point, unproject, project_geometry
+from distances import vincenty_miles
+from synthetic import make_pothole_coords
+
+SEATTLE_LOC = (47.6062095, -122.3320708)
+
+def test_planar_distances_match_ellipsoid():
+    lons, lats = make_pothole_coords(2000)
+    xs, ys = project(lons, lats)
+    ox, oy = project_point(SEATTLE_LOC[1], SEATTLE_LOC[0])
+    planar = np.hypot(xs - ox, ys - oy)
+    ellipsoid = vincenty_miles(lats, lons, [SEATTLE_LOC])[:, 0] * 1609.344
+    assert np.abs(planar / ellipsoid - 1).max() < 2e-4
+
+def test_unproject_round_trip():
+    lons, lats = make_pothole_coords(2000)
+    back_lons, back_lats = unproject(*project(lons, lats))
+    assert np.abs(back_lons - lons).max() < 1e-9
+    assert np.abs(back_lats - lats).max() < 1e-9
+
+def test_point_and_geometry_agree_with_arrays():
+    lons, lats = make_pothole_coords(100)
+    xs, ys = project(lons, lats)
+    points = np.array([project_point(lon, lat) for lon, lat in zip(lons, lats)])
+    assert np.allclose(points, np.column_stack([xs, ys]), rtol=0, atol=1e-6)
+
+    poly = project_geometry(Polygon(list(zip(lons[:5], lats[:5]))))
+    assert np.allclose(np.array(poly.exterior.coords)[:5],\
+        np.column_stack([xs[:5], ys[:5]]), rtol=0, atol=1e-6)
+    assert np.isnan(project([np.nan], [47.6])[0][0])
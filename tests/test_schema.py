@@ -0,0 +1,53 @@
+import numpy as np
+import create_features
+import schema
+from schema import compact_frame, restore_derived, iter_records, FLOAT_RTOL
+from synthetic import make_feature_frame
+
+def _features_frame(n):
+    df = make_feature_frame(n)
+    df['DURATION_td'] = np.floor(df['DURATION'] / np.timedelta64(1, 'D'))
+    df['INITDT_date_only'] = df['INITDT_dt'].dt.normalize()
+    df = create_features.create_calendar_features(df)
+    # As after a merge: small integers as floats, flags as Python bools
+    df['dayofwk'] = df['dayofwk'].astype(float)
+    df['b_holiday'] = df['b_holiday'].astype(object)
+    return df
+
+def test_compact_frame_is_smaller_and_restorable():
+    df = _features_frame(20000)
+    original = df.copy()
+    compact, report = compact_frame(df)
+
+    assert report['bytes_after'].sum() * 2 < report['bytes_before'].sum()
+    actions = dict(zip(report['column'], report['action']))
+    assert actions['dayofwk'] == 'int' and compact['dayofwk'].dtype == np.uint8
+    assert actions['b_holiday'] == 'bool'
+    assert actions['ST_CODE'] == 'category'
+    assert 'latitude' in compact and compact['latitude'].dtype == np.float64
+
+    dropped = sorted(report['column'][report['action'] == 'dropped (derived)'])
+    assert dropped == ['DURATION', 'DURATION_td', 'INITDT_date_only',\
+        'wkdy_or_wknd']
+    restored = restore_derived(compact.copy())
+    for col in dropped:
+        assert schema._same(original[col], restored[col]), col
+
+    for col in report['column'][report['action'] == 'float32']:
+        error = np.abs(compact[col].values.astype(float) - original[col].values)
+        assert (error <= FLOAT_RTOL * np.abs(original[col].values)).all(), col
+
+def test_derived_column_that_differs_is_kept():
+    df = _features_frame(1000)
+    df.loc[df.index[0], 'DURATION_td'] += 1
+    compact, _ = compact_frame(df)
+    assert 'DURATION_td' in compact
+
+def test_records_have_slots():
+    df = _features_frame(10)
+    columns = ['OBJECTID', 'latitude', 'b_weekend?']
+    records = list(iter_records(df, columns))
+    assert len(records) == 10
+    assert records[3].OBJECTID == df['OBJECTID'].iloc[3]
+    assert records[3].b_weekend_ == df['b_weekend?'].iloc[3]
+    assert not hasattr(records[0], '__dict__')
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+import create_features
+import build_models
+import census
+import weather
+import scoring
+from backlog import BacklogCounter
+from spatial_index import PolygonLookup
+from projection import project_geometry, add_projected_coords
+from synthetic import BLOCK_GROUP_GRID, make_geoids, make_acs_table,\
+    make_weather_csv, make_polygon_tiling, make_potholes
+
+def _scorer(tmp, model_class):
+    '''
+    A scorer fit on a small synthetic city under tmp, and the batch
+    features of its history.
+    '''
+    os.makedirs(os.path.join(tmp, 'data'))
+    geoids = make_geoids(BLOCK_GROUP_GRID[0] * BLOCK_GROUP_GRID[1])
+    for seed, (table_id, _, _) in enumerate(create_features.CENSUS_ATTRIBUTES):
+        filename = os.path.join(tmp, census.acs_filename(table_id))
+        if not os.path.exists(filename):
+            make_acs_table(filename, geoids, seed=seed)
+    make_weather_csv(os.path.join(tmp, 'data', 'weather.csv'), days=400)
+    block_groups = PolygonLookup([project_geometry(poly) for poly in\
+        make_polygon_tiling(*BLOCK_GROUP_GRID, seed=9)], geoids)
+    daily = weather.add_window_features(weather.load_daily_weather(\
+        os.path.join(tmp, 'data', 'weather.csv')))
+
+    df = add_projected_coords(make_potholes(3000, days=365))
+    df = create_features.create_distances(df)
+    df = create_features.get_census_economic_vals(df, block_groups=block_groups)
+    df = create_features.get_pothole_count(df)
+    df = create_features.get_temp(df, daily=daily)
+    predictors = build_models.BASE_PREDICTORS
+    train = df.dropna(subset=predictors).copy()
+    train['long_repair'] = (train['DURATION_td'] > 3).astype(int)
+    model = model_class.fit(train[predictors].values, train['long_repair'].values)
+    scoring.save_scoring_model(model, predictors, train, root=tmp)
+
+    backlog = BacklogCounter()
+    backlog.add(df['INITDT_dt'].values, df['DURATION'].values)
+    scorer = scoring.OnlineScorer(scoring.load_scoring_model(root=tmp),\
+        block_groups, daily, backlog, n_cells=64)
+    return scorer, train, predictors
+
+def _run_in_tmp(test):
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmp)
+        test(tmp)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+
+def test_online_features_match_batch_pipeline():
+    def test(tmp):
+        scorer, train, predictors = _scorer(tmp, build_models.model_estimators()['logit'])
+        sample = train.iloc[:300]
+        lats, lons = sample['latitude'].values, sample['longitude'].values
+        dts = sample['INITDT_dt'].values
+        assert np.allclose(scorer.features(lats, lons, dts),\
+            sample[predictors].values)
+        assert np.allclose([scorer.features_one(lat, lon, dt) for\
+            lat, lon, dt in zip(lats, lons, dts)], sample[predictors].values)
+
+        # Scored from the coefficients, one at a time or in a batch
+        expected = scorer.model.predict_proba(sample[predictors].values)[:, 1]
+        assert np.allclose(scorer.score(lats, lons, dts), expected)
+        assert np.allclose(scorer.score(lats[:3], lons[:3], dts[:3]),\
+            expected[:3])
+    _run_in_tmp(test)
+
+def test_micro_batcher_returns_each_score():
+    def test(tmp):
+        scorer, train, predictors = _scorer(tmp, RandomForestClassifier(\
+            n_estimators=5, random_state=0))
+        sample = train.iloc[:100]
+        lats, lons = sample['latitude'].values, sample['longitude'].values
+        dts = sample['INITDT_dt'].values
+        batcher = scoring.MicroBatcher(scorer, max_batch=16)
+        pending = [batcher.submit(lat, lon, dt) for lat, lon, dt in\
+            zip(lats, lons, dts)]
+        scores = [p.result(timeout=10) for p in pending]
+        batcher.close()
+        assert np.allclose(scores, scorer.score(lats, lons, dts))
+    _run_in_tmp(test)
@@ -0,0 +1,57 @@
+import numpy as np
+from shapely.geometry import Point
+from spatial_index import PolygonLookup, CellGrid, StreetIndex
+from synthetic import make_street_grid, make_pothole_coords, make_polygon_tiling
+from reference import brute_force_nearest
+
+def test_street_index_matches_brute_force():
+    lines, attributes = make_street_grid(30)
+    lons, lats = make_pothole_coords(300)
+    brute = brute_force_nearest(lines, lons, lats)
+
+    streets = StreetIndex(lines, attributes)
+    dists, indexed = streets.nearest(lons, lats)
+
+    # Ties between equidistant segments may resolve either way
+    brute_dists = np.array([Point(lon, lat).distance(lines[i])\
+        for lon, lat, i in zip(lons, lats, brute)])
+    assert np.allclose(dists[:, 0], brute_dists, rtol=0, atol=1e-12)
+
+def test_street_attributes_beyond_max_distance_are_missing():
+    lines, attributes = make_street_grid(10)
+    streets = StreetIndex(lines, attributes)
+    lons, lats = make_pothole_coords(50)
+    nearest = streets.nearest(lons, lats)[1][:, 0]
+    assert streets.nearest_attributes(lons, lats) ==\
+        [attributes[line] for line in nearest]
+    far = streets.nearest_attributes(lons + 1., lats, max_distance=0.1)
+    assert all(len(values) == 5 and all(np.isnan(values)) for values in far)
+
+def test_polygon_lookup_takes_first_covering_polygon():
+    polys = make_polygon_tiling(6, 5)
+    labels = ['hood%d' % i for i in range(len(polys))]
+    lookup = PolygonLookup(polys, labels)
+    lons, lats = make_pothole_coords(500)
+    # Points exactly on shared corners and outside the city too
+    corners = np.array(polys[7].exterior.coords)[:4]
+    xs = np.concatenate([lons, corners[:, 0], [-123.]])
+    ys = np.concatenate([lats, corners[:, 1], [47.6]])
+
+    expected = []
+    for x, y in zip(xs, ys):
+        covering = [i for i, poly in enumerate(polys) if poly.covers(Point(x, y))]
+        expected.append(covering[0] if covering else -1)
+
+    assert list(lookup.lookup(xs, ys)) == expected
+    assert lookup.label(xs, ys)[-1] == ''
+    assert list(lookup.label(xs[:5], ys[:5])) == [labels[i] for i in expected[:5]]
+
+def test_cell_grid_answers_like_polygon_lookup():
+    polys = make_polygon_tiling(6, 5)
+    lookup = PolygonLookup(polys, list(range(len(polys))))
+    grid = CellGrid(lookup, n_cells=32)
+    lons, lats = make_pothole_coords(2000, seed=3)
+    expected = lookup.lookup(lons, lats)
+    assert np.array_equal(grid.lookup(lons, lats), expected)
+    assert [grid.lookup_point(x, y) for x, y in zip(lons[:200], lats[:200])] ==\
+        list(expected[:200])
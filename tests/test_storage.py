@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import storage
+from synthetic import make_feature_frame
+
+def _check_column(read, df, col):
+    if col not in storage.CATEGORICAL_COLUMNS:
+        pd.testing.assert_series_equal(read[col], df[col], check_names=False)
+        return
+    # Labels come back as categoricals of their own type
+    assert read[col].dtype.name == 'category'
+    assert read[col].cat.categories.dtype == df[col].dropna().values.dtype, col
+    assert (read[col].astype(object).values == df[col].values).all(), col
+
+def test_round_trip_and_column_subset():
+    df = make_feature_frame(3000)
+    df = df.iloc[np.random.RandomState(0).permutation(len(df))]
+    tmp = tempfile.mkdtemp()
+    try:
+        storage.write_frame(df, 'features', root=tmp)
+        read = storage.read_frame('features', root=tmp)
+        assert sorted(read.columns) == sorted(df.columns)
+        assert sorted(read.index) == sorted(df.index)
+        read = read.loc[df.index]
+        for col in df.columns:
+            _check_column(read, df, col)
+
+        subset = storage.read_frame('features', columns=['latitude', 'Temp'],\
+            root=tmp)
+        assert list(subset.columns) == ['latitude', 'Temp']
+        pd.testing.assert_series_equal(subset['Temp'].loc[df.index], df['Temp'])
+
+        year = df['INITDT_dt'].dt.year.min()
+        one_year = storage.read_frame('features', columns=['Temp'],\
+            years=[year], root=tmp)
+        assert sorted(one_year.index) ==\
+            sorted(df.index[df['INITDT_dt'].dt.year == year])
+
+        storage.append_frame(df.iloc[:10].set_index(df.index[:10] + len(df)),\
+            'features', root=tmp)
+        assert len(storage.read_frame('features', columns=['Temp'],\
+            root=tmp)) == len(df) + 10
+    finally:
+        shutil.rmtree(tmp)
+
+def test_mixed_labels_are_stored_as_strings():
+    df = make_feature_frame(500)
+    df['neighborhood_label'] = df['neighborhood_label'].astype(object)
+    df.loc[df.index[::7], 'neighborhood_label'] = ''
+    tmp = tempfile.mkdtemp()
+    try:
+        storage.write_frame(df, 'features', root=tmp)
+        read = storage.read_frame('features', root=tmp).loc[df.index]
+        assert (read['neighborhood_label'].astype(object).values ==\
+            df['neighborhood_label'].map(str).values).all()
+        assert (read['SND_FEACOD'].astype(np.int64).values ==\
+            df['SND_FEACOD'].values).all()
+    finally:
+        shutil.rmtree(tmp)
+
+def test_appends_read_back_in_order():
+    df = pd.DataFrame({\
+        'INITDT_dt': pd.to_datetime('2012-12-20') +\
+            pd.to_timedelta(np.arange(40) * 2, unit='D'),
+        'DURATION': pd.to_timedelta(np.arange(40) * 3600 * 10 ** 9),
+        'NOTE': pd.Series(['note %d' % i for i in range(40)], dtype=object)},\
+        index=pd.Index(np.arange(40)[::-1] * 10, name='OBJECTID'))
+    df.loc[df.index[5], 'DURATION'] = pd.NaT
+    # A chunk with no text at all
+    df.loc[df.index[:10], 'NOTE'] = np.nan
+    tmp = tempfile.mkdtemp()
+    try:
+        storage.delete_frame('all_cleaned', root=tmp)
+        for start in range(0, 40, 10):
+            storage.append_frame(df.iloc[start:start+10], 'all_cleaned',\
+                root=tmp)
+        read = storage.read_frame('all_cleaned', root=tmp)
+        read['NOTE'] = read['NOTE'].astype(object)
+        expected = pd.concat([part for _, part in\
+            df.groupby(df['INITDT_dt'].dt.year)])
+        pd.testing.assert_frame_equal(read, expected)
+
+        durations = storage.read_frame('all_cleaned', columns=['DURATION'],\
+            years=[2013], root=tmp)
+        pd.testing.assert_series_equal(durations['DURATION'],\
+            expected['DURATION'][expected['INITDT_dt'].dt.year == 2013])
+    finally:
+        shutil.rmtree(tmp)
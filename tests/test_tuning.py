@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from tuning import successive_halving, _subsample
+
+GRID = {'max_depth': [4, 8], 'min_samples_leaf': [1, 20],\
+    'max_features': ['sqrt']}
+
+def _data(n=3000, rate=0.02):
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(n, 4))
+    y = (rng.rand(n) < rate).astype(int)
+    y[-30:] = [0, 1] * 15
+    return X, y, np.arange(n - 600), np.arange(n - 600, n)
+
+def test_small_budgets_keep_a_rare_class():
+    X, y, train, test = _data()
+    sample = _subsample(y, train, 100, np.random.RandomState(3))
+    assert len(np.unique(y[sample])) == 2
+    assert abs(len(sample) - 100) <= 2
+
+    results = successive_halving(X, y, train, test, grid=GRID, min_rows=100,\
+        min_trees=5, max_trees=20)
+    assert np.isfinite(results['auc']).all()
+
+def test_single_class_test_rows_are_refused():
+    X, y, train, test = _data()
+    with pytest.raises(ValueError):
+        successive_halving(X, y, train, test[y[test] == 0], grid=GRID,\
+            min_rows=100, min_trees=5, max_trees=20)